@@ -0,0 +1,100 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog.settings")
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """
+    Create a throwaway file-backed test database for the duration of a benchmark.
+    A file is used instead of SQLite's in-memory database so that worker
+    threads each get a real connection.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp_dir, "benchmark.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity)
+            teardown_test_environment()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """Summarize latencies given in seconds, reporting milliseconds."""
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def run_metadata():
+    """Where and on what a benchmark ran, stored with its results so runs can be compared."""
+
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git("rev-parse", "--short", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(path, results, config=None):
+    with open(path, "w") as output:
+        json.dump({"metadata": run_metadata(), "config": config or {}, "results": results}, output, indent=2)
+
+
+def load_results(path):
+    with open(path) as saved:
+        return json.load(saved)
+
+
+def percent_change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
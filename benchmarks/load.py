@@ -0,0 +1,390 @@
+"""
+End-to-end load test of the REST API over HTTP.
+
+Seeds a throwaway database, starts `manage.py runserver` on it with the fake
+LLM client (so auto-replies cost a fixed latency instead of Gemini calls) and
+drives it from concurrent virtual users. Each user logs in with JWT and then
+picks requests from a weighted mix: post list and detail, comment list,
+comment creation (which runs moderation and may schedule an auto-reply) and
+the analytics endpoints. Throughput and p50/p95/p99 are reported per
+endpoint; --output saves them as JSON and --baseline flags regressions
+against an earlier run.
+
+    python -m benchmarks.load --users 16 --duration 30 --output load.json
+    python -m benchmarks.load --duration 30 --baseline load.json --threshold 15
+
+--url targets an already running server instead; it must know the
+benchmark accounts (see create_accounts).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.common import (
+    ROOT_DIR, load_results, percent_change, save_results, setup_django, summarize,
+)
+
+PASSWORD = "benchmark-password"
+ADMIN = "bench-admin"
+
+DEFAULT_MIX = {
+    "login": 2,
+    "post-list": 30,
+    "post-detail": 25,
+    "comment-list": 15,
+    "comment-create": 20,
+    "daily-breakdown": 4,
+    "breakdown": 4,
+}
+
+WORDS = (
+    "river", "morning", "coffee", "garden", "blog", "travel", "music", "winter",
+    "idea", "project", "weekend", "story", "friend", "city", "book", "light",
+)
+
+
+def parse_mix(value):
+    """'post-list=30,comment-create=20' -> {name: weight}, on top of the defaults."""
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, value.split(",")):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}. Choose from: {', '.join(DEFAULT_MIX)}.")
+        mix[name] = float(weight)
+    return mix
+
+
+def create_accounts(users, auto_reply_ratio, seed):
+    """
+    Benchmark logins (user i is bench-<i>), an admin (bench-admin) for the
+    analytics endpoints and the account auto-replies are posted as. A share
+    of the seeded post authors get auto-replies enabled with a short delay.
+    Returns the id of the auto-reply account.
+    """
+    from django.contrib.auth.hashers import make_password
+    from user.models import User, UserSettings
+
+    password = make_password(PASSWORD)
+    accounts = [
+        User(username=f"bench-{index}", email=f"bench-{index}@bench.local", password=password)
+        for index in range(users)
+    ]
+    accounts.append(User(username=ADMIN, email="bench-admin@bench.local", password=password, is_staff=True))
+    accounts.append(User(username="bench-ai", email="bench-ai@bench.local", password=password))
+    created = User.objects.bulk_create(accounts)
+    UserSettings.objects.bulk_create([UserSettings(user=user) for user in created])
+
+    authors = list(UserSettings.objects.filter(user__email__startswith="seed_user_").values_list("id", flat=True))
+    enabled = random.Random(seed).sample(authors, int(len(authors) * auto_reply_ratio))
+    UserSettings.objects.filter(id__in=enabled).update(auto_reply_enabled=True, auto_reply_delay=1)
+    return created[-1].id
+
+
+def prepare_database(path, args):
+    from django.core.management import call_command
+    from django.db import connection
+
+    from posts.seeding import Seeder
+
+    connection.settings_dict["NAME"] = path
+    call_command("migrate", verbosity=0)
+    Seeder(
+        users=args.seed_users, posts=args.seed_posts, comments=args.seed_comments, days=90, seed=args.seed
+    ).run()
+    ai_user_id = create_accounts(args.users, args.auto_reply_ratio, args.seed)
+    connection.close()
+    return ai_user_id
+
+
+def start_server(port, env):
+    server = subprocess.Popen(
+        [sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"runserver exited:\n{server.stderr.read().decode()}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/api/posts/?page_size=1")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("runserver did not answer within 60 seconds.")
+
+
+class Client:
+    """
+    Minimal JSON client opening one connection per request: runserver writes
+    the headers and the body of a response separately, so on a keep-alive
+    connection every response stalls ~40 ms on Nagle's algorithm meeting the
+    client's delayed ACK, which would swamp the timings.
+    """
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.token = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json", "Connection": "close"}
+        token = token or self.token
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def login(self, username):
+        body = {"username": username, "password": PASSWORD}
+        status, data = self.request("POST", "/api/user/token/", body, token="")
+        if status != 200:
+            raise RuntimeError(f"Login of {username} failed with {status}: {data[:200]!r}")
+        return json.loads(data)["access"]
+
+
+class VirtualUser:
+
+    def __init__(self, index, base_url, post_ids, seed):
+        self.username = f"bench-{index}"
+        self.client = Client(base_url)
+        self.rng = random.Random(seed + index)
+        self.post_ids = post_ids
+        self.admin_token = None
+
+    def login(self):
+        self.client.token = self.client.login(self.username)
+        self.admin_token = self.client.login(ADMIN)
+        return 200
+
+    def text(self):
+        return " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 30)))
+
+    def window(self):
+        date_to = date.today() - timedelta(days=self.rng.randint(0, 60))
+        return {"date_from": (date_to - timedelta(days=30)).isoformat(), "date_to": date_to.isoformat()}
+
+    def run(self, name):
+        """Send one request of the `name` kind and return its status code."""
+        post_id = self.rng.choice(self.post_ids)
+        if name == "login":
+            return self.login()
+        if name == "post-list":
+            return self.client.request("GET", "/api/posts/")[0]
+        if name == "post-detail":
+            return self.client.request("GET", f"/api/posts/{post_id}/")[0]
+        if name == "comment-list":
+            return self.client.request("GET", f"/api/posts/{post_id}/comments/")[0]
+        if name == "comment-create":
+            body = {"post": post_id, "content": self.text()}
+            return self.client.request("POST", f"/api/posts/{post_id}/comments/", body)[0]
+        if name == "daily-breakdown":
+            query = urlencode(self.window())
+            return self.client.request("GET", f"/api/comments-daily-breakdown/?{query}", token=self.admin_token)[0]
+        if name == "breakdown":
+            query = urlencode({**self.window(), "granularity": "day", "post": post_id})
+            return self.client.request("GET", f"/api/comments-breakdown/?{query}", token=self.admin_token)[0]
+        raise ValueError(name)
+
+
+def run_load(base_url, users, duration, mix, post_ids, seed):
+    names, weights = zip(*((name, weight) for name, weight in mix.items() if weight > 0))
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    failures = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        user = VirtualUser(index, base_url, post_ids, seed)
+        samples = {name: [] for name in names}
+        failed = {name: 0 for name in names}
+        try:
+            user.login()
+            while time.perf_counter() < deadline:
+                name = user.rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = user.run(name)
+                except (OSError, http.client.HTTPException, RuntimeError):
+                    status = None
+                elapsed = time.perf_counter() - started
+                if status is None or status >= 400:
+                    failed[name] += 1
+                else:
+                    samples[name].append(elapsed)
+        except Exception as exc:
+            with lock:
+                failures.append(exc)
+        with lock:
+            for name in names:
+                latencies[name].extend(samples[name])
+                errors[name] += failed[name]
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(users)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise failures[0]
+
+    endpoints = {}
+    for name in names:
+        endpoints[name] = {
+            **summarize(latencies[name]),
+            "errors": errors[name],
+            "throughput_rps": len(latencies[name]) / elapsed,
+        }
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "duration_s": elapsed,
+        "throughput_rps": len(everything) / elapsed,
+        "errors": sum(errors.values()),
+        "all": summarize(everything),
+        "endpoints": endpoints,
+    }
+
+
+def flatten(results):
+    """{endpoint: row} including an 'all' row for the whole run."""
+    overall = {**results["all"], "errors": results["errors"], "throughput_rps": results["throughput_rps"]}
+    return {**results["endpoints"], "all": overall}
+
+
+def print_results(results):
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, row in flatten(results).items():
+        if not row["count"]:
+            print(f"{name:<18}{0:>10}{row['errors']:>8}")
+            continue
+        print(
+            f"{name:<18}{row['count']:>10}{row['errors']:>8}{row['throughput_rps']:>9.1f}"
+            f"{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms"
+        )
+
+
+def compare(baseline, results, threshold, min_samples):
+    """
+    Print the change of throughput and p95 per endpoint against a saved
+    `baseline` and return the regressions: throughput down or p95 up by more
+    than `threshold` percent, or errors on an endpoint that had none.
+    Endpoints with fewer than `min_samples` requests are too noisy to judge.
+    """
+    metadata = baseline["metadata"]
+    print(f"\nagainst {metadata.get('git_commit')} ({metadata.get('timestamp')}):")
+    print(f"{'endpoint':<18}{'rps':>10}{'p95':>10}")
+    regressions = []
+    before_rows = flatten(baseline["results"])
+    for name, after in flatten(results).items():
+        before = before_rows.get(name)
+        if before is None:
+            continue
+        rps = percent_change(before["throughput_rps"], after["throughput_rps"])
+        p95 = percent_change(before.get("p95_ms"), after.get("p95_ms"))
+        print(f"{name:<18}{_signed(rps):>10}{_signed(p95):>10}")
+        if min(before["count"], after["count"]) < min_samples:
+            continue
+        if rps is not None and rps < -threshold:
+            regressions.append(f"{name}: throughput {rps:+.1f}%")
+        if p95 is not None and p95 > threshold:
+            regressions.append(f"{name}: p95 {p95:+.1f}%")
+        if after["errors"] and not before["errors"]:
+            regressions.append(f"{name}: {after['errors']} errors")
+    return regressions
+
+
+def _signed(change):
+    return "n/a" if change is None else f"{change:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark this running server instead of starting one.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of measured load.")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured load first.")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Endpoint weights, e.g. 'comment-create=50,login=0'.")
+    parser.add_argument("--seed-users", type=int, default=200)
+    parser.add_argument("--seed-posts", type=int, default=2000)
+    parser.add_argument("--seed-comments", type=int, default=50000)
+    parser.add_argument("--auto-reply-ratio", type=float, default=0.1,
+                        help="Share of seeded authors with auto-replies enabled.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=10, help="Regression threshold in percent.")
+    parser.add_argument("--min-samples", type=int, default=20,
+                        help="Only flag endpoints with at least this many requests in both runs.")
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            database = os.path.join(tmp_dir, "load.sqlite3")
+            setup_django()
+            ai_user_id = prepare_database(database, args)
+            env = {
+                **os.environ,
+                "DATABASE_NAME": database,
+                "LLM_CLIENT": "posts.llm.FakeLLMClient",
+                "AI_USER_ID": str(ai_user_id),
+                "QUERY_BUDGET_ACTION": "log",
+            }
+            server = start_server(args.port, env)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        try:
+            client = Client(base_url)
+            client.token = client.login("bench-0")
+            status, data = client.request("GET", "/api/posts/?page_size=100")
+            post_ids = [post["id"] for post in json.loads(data)["results"]]
+            if not post_ids:
+                raise RuntimeError("The server has no posts to benchmark.")
+
+            if args.warmup:
+                run_load(base_url, args.users, args.warmup, args.mix, post_ids, args.seed)
+            results = run_load(base_url, args.users, args.duration, args.mix, post_ids, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print_results(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    if args.output:
+        save_results(args.output, results, config)
+
+    if args.baseline:
+        regressions = compare(load_results(args.baseline), results, args.threshold, args.min_samples)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
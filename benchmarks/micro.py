@@ -0,0 +1,272 @@
+"""
+Micro-benchmarks of the hot paths behind the API:
+
+  moderation   validate_profanity() by text length and moderate() by batch size
+  serializers  PostSerializer and CommentSerializer validation and serialization
+  pages        PostListSerializer rendering of a page of posts to JSON
+  analytics    the comments-daily-breakdown view, and the live aggregate it
+               replaced, on databases of growing size
+
+Moderation runs the model in-process with the verdict cache and the lexical
+pre-filter disabled, so every call pays for the model. Each benchmark is
+calibrated to run for about --min-time seconds per round; the median of the
+rounds is reported. Results are saved with machine metadata, and --compare
+prints the change between two saved runs.
+
+    python -m benchmarks.micro --suites moderation pages --output before.json
+    python -m benchmarks.micro --output after.json
+    python -m benchmarks.micro --compare before.json after.json --threshold 5
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks.common import load_results, percent_change, save_results, setup_django, test_database
+
+SUITES = ("moderation", "serializers", "pages", "analytics")
+
+WORDS = (
+    "river", "morning", "coffee", "garden", "blog", "travel", "music", "winter",
+    "idea", "project", "weekend", "story", "friend", "city", "book", "light",
+)
+
+
+def text_of_length(length, offset=0):
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(WORDS[(len(words) + offset) % len(WORDS)])
+    return " ".join(words)[:length]
+
+
+def _time(func, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - started
+
+
+def measure(func, min_time, rounds, items=1):
+    """
+    Time `func` over `rounds` rounds of equal size, each lasting about
+    `min_time` / `rounds` seconds. `items` is how many units (texts, rows)
+    one call processes, for the per-item figure.
+    """
+    func()
+    number, target = 1, min_time / rounds
+    while (elapsed := _time(func, number)) < target and number < 1_000_000:
+        number *= 10 if elapsed < target / 10 else 2
+    per_call = [_time(func, number) / number for _ in range(rounds)]
+    median = statistics.median(per_call)
+    return {
+        "median_us": median * 1e6,
+        "min_us": min(per_call) * 1e6,
+        "max_us": max(per_call) * 1e6,
+        "per_item_us": median * 1e6 / items,
+        "items": items,
+        "number": number,
+        "rounds": rounds,
+    }
+
+
+def moderation_benchmarks(args):
+    from posts.validators import moderate, validate_profanity
+
+    for length in (20, 200, 2000, 10000):
+        text = text_of_length(length)
+        yield f"moderation.validate_profanity[{length} chars]", (lambda text=text: validate_profanity(text)), 1
+    for size in (1, 10, 100, 1000):
+        texts = [text_of_length(200, offset) for offset in range(size)]
+        yield f"moderation.moderate[batch {size}]", (lambda texts=texts: moderate(texts)), size
+
+
+def serializer_benchmarks(args):
+    from posts.models import Comment, Post
+    from posts.serializers import CommentSerializer, PostSerializer
+    from user.models import User
+
+    author = User.objects.create_user(username="bench-author", email="author@bench.local", password="benchmark")
+    post = Post.objects.create(title="Title", content=text_of_length(500), author=author)
+    comment = Comment.objects.create(post=post, author=author, content=text_of_length(200))
+    post_data = {"title": text_of_length(60), "content": text_of_length(500)}
+    comment_data = {"post": post.id, "content": text_of_length(200)}
+
+    def validate(serializer_class, data):
+        serializer = serializer_class(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    yield "serializers.PostSerializer.validate", lambda: validate(PostSerializer, post_data), 1
+    yield "serializers.PostSerializer.data", lambda: PostSerializer(post).data, 1
+    yield "serializers.CommentSerializer.validate", lambda: validate(CommentSerializer, comment_data), 1
+    yield "serializers.CommentSerializer.data", lambda: CommentSerializer(comment).data, 1
+
+
+def page_benchmarks(args):
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+
+    from posts.models import Post
+    from posts.serializers import PostListSerializer
+
+    now = timezone.now()
+    renderer = JSONRenderer()
+    for size in (20, 100, 1000, 10000):
+        posts = [
+            Post(id=index, title=text_of_length(60, index), content="", author_id=index % 50 + 1,
+                 created_at=now, updated_at=now)
+            for index in range(1, size + 1)
+        ]
+        yield (
+            f"pages.PostListSerializer[{size} posts]",
+            lambda posts=posts: renderer.render(PostListSerializer(posts, many=True).data),
+            size,
+        )
+
+
+def analytics_benchmarks(args):
+    from django.db.models import Count, Q
+    from django.db.models.functions import TruncDate
+    from django.utils import timezone
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from posts.models import Comment
+    from posts.seeding import Seeder
+    from posts.views import CommentsDailyBreakdown
+    from user.models import User
+
+    admin = User.objects.create_user(
+        username="bench-admin", email="admin@bench.local", password="benchmark", is_staff=True
+    )
+    view = CommentsDailyBreakdown.as_view()
+    factory = APIRequestFactory()
+    today = timezone.localdate()
+
+    def breakdown(days):
+        request = factory.get("/api/comments-daily-breakdown/", {
+            "date_from": (today - timedelta(days=days)).isoformat(), "date_to": today.isoformat(),
+        })
+        force_authenticate(request, user=admin)
+        response = view(request)
+        response.render()
+        return response
+
+    def live_aggregate(days):
+        start = timezone.now() - timedelta(days=days)
+        return list(
+            Comment.objects.filter(created_at__gte=start)
+            .annotate(date=TruncDate("created_at"))
+            .values("date")
+            .annotate(total=Count("id"), blocked=Count("id", filter=Q(is_blocked=True)))
+            .order_by("date")
+        )
+
+    seeded = 0
+    for size in sorted(args.comment_counts):
+        if size > seeded:
+            print(f"seeding up to {size} comments...", file=sys.stderr)
+            new = size - seeded
+            Seeder(users=max(new // 1000, 10), posts=max(new // 50, 10), comments=new, days=365, seed=size).run()
+            seeded = size
+        for days in (30, 365):
+            yield f"analytics.daily_breakdown[{size} comments, {days} days]", lambda days=days: breakdown(days), 1
+            if size <= args.live_aggregate_limit:
+                yield (
+                    f"analytics.live_aggregate[{size} comments, {days} days]",
+                    lambda days=days: live_aggregate(days),
+                    1,
+                )
+
+
+BENCHMARKS = {
+    "moderation": moderation_benchmarks,
+    "serializers": serializer_benchmarks,
+    "pages": page_benchmarks,
+    "analytics": analytics_benchmarks,
+}
+
+
+def run(args):
+    from django.test.utils import override_settings
+
+    from posts.validators import reset_moderation_pipeline
+
+    results = {}
+    with test_database(), override_settings(
+        MODERATION_BACKEND="inprocess",
+        MODERATION_BATCHING_ENABLED=False,
+        PROFANITY_CACHE_SIZE=0,
+        PROFANITY_PREFILTER_ENABLED=False,
+    ):
+        reset_moderation_pipeline()
+        for suite in args.suites:
+            for name, func, items in BENCHMARKS[suite](args):
+                if args.filter and args.filter not in name:
+                    continue
+                results[name] = measure(func, args.min_time, args.rounds, items)
+                row = results[name]
+                print(f"{name:<58}{row['median_us']:>14,.1f} us{row['per_item_us']:>12,.2f} us/item")
+        reset_moderation_pipeline()
+    return results
+
+
+def compare(before, after, threshold):
+    """Print the median change of every benchmark in both runs; return the ones slower by over `threshold`%."""
+    for label, saved in (("before", before), ("after", after)):
+        metadata = saved["metadata"]
+        print(f"{label:<7}{metadata.get('git_commit')} {metadata.get('timestamp')} "
+              f"on {metadata.get('platform')}, {metadata.get('cpu_count')} CPUs")
+    if before["metadata"].get("platform") != after["metadata"].get("platform"):
+        print("warning: the runs come from different machines")
+
+    print(f"\n{'benchmark':<58}{'before':>14}{'after':>14}{'change':>10}")
+    regressions = []
+    for name, old in before["results"].items():
+        new = after["results"].get(name)
+        if new is None:
+            continue
+        change = percent_change(old["median_us"], new["median_us"])
+        flag = ""
+        if change is not None and change > threshold:
+            flag = "  slower"
+            regressions.append(name)
+        elif change is not None and change < -threshold:
+            flag = "  faster"
+        print(f"{name:<58}{old['median_us']:>11,.1f} us{new['median_us']:>11,.1f} us{change:>+9.1f}%{flag}")
+    for name in after["results"].keys() - before["results"].keys():
+        print(f"{name:<58}{'':>14}{after['results'][name]['median_us']:>11,.1f} us       new")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("-k", "--filter", help="Only run benchmarks whose name contains this text.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Approximate seconds per benchmark.")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--comment-counts", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Database sizes for the analytics suite, e.g. 10000 100000 1000000 10000000.")
+    parser.add_argument("--live-aggregate-limit", type=int, default=1_000_000,
+                        help="Skip the live aggregate above this many comments.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two saved runs.")
+    parser.add_argument("--threshold", type=float, default=5, help="Change in percent reported as a regression.")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*(load_results(path) for path in args.compare), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower by more than {args.threshold}%")
+            sys.exit(1)
+        return
+
+    setup_django()
+    results = run(args)
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        save_results(args.output, results, config)
+
+
+if __name__ == "__main__":
+    main()
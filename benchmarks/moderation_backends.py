@@ -0,0 +1,158 @@
+"""
+Compare request latency of the moderation backends under mixed read/write load.
+
+Reads hit the post list and detail endpoints, writes create comments and so
+run the profanity model. The verdict cache and the lexical pre-filter are
+disabled so that every write reaches the backend being measured.
+
+    python -m benchmarks.moderation_backends --threads 8 --requests 2000 --write-ratio 0.2
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from benchmarks.common import setup_django, summarize, test_database
+
+WORDS = (
+    "river", "morning", "coffee", "garden", "blog", "travel", "music", "winter",
+    "idea", "project", "weekend", "story", "friend", "city", "book", "light",
+)
+
+
+def random_text(rng, length=20):
+    return " ".join(rng.choice(WORDS) for _ in range(length)) + f" {rng.random()}"
+
+
+def create_fixtures(posts):
+    from posts.models import Post
+    from user.models import User
+
+    author = User.objects.create_user(
+        username="bench-author", email="author@bench.local", password="benchmark"
+    )
+    rng = random.Random(0)
+    post_ids = [
+        Post.objects.create(title=f"Post {index}", content=random_text(rng), author=author).id
+        for index in range(posts)
+    ]
+    return author, post_ids
+
+
+def run_load(author, post_ids, threads, requests, write_ratio, seed):
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    latencies = {"read": [], "write": []}
+    errors = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker(worker_id):
+        try:
+            run_requests(worker_id)
+        except Exception as exc:
+            with lock:
+                errors.append(exc)
+        finally:
+            connection.close()
+
+    def run_requests(worker_id):
+        rng = random.Random(seed + worker_id)
+        client = APIClient()
+        client.force_authenticate(author)
+        samples = {"read": [], "write": []}
+        for _ in range(per_thread):
+            post_id = rng.choice(post_ids)
+            started = time.perf_counter()
+            if rng.random() < write_ratio:
+                kind = "write"
+                response = client.post(
+                    f"/api/posts/{post_id}/comments/",
+                    {"post": post_id, "content": random_text(rng)},
+                )
+            elif rng.random() < 0.5:
+                kind = "read"
+                response = client.get("/api/posts/")
+            else:
+                kind = "read"
+                response = client.get(f"/api/posts/{post_id}/")
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(f"{kind} request failed with {response.status_code}")
+            samples[kind].append(elapsed)
+        with lock:
+            for kind, values in samples.items():
+                latencies[kind].extend(values)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    total = latencies["read"] + latencies["write"]
+    return {
+        "duration_s": duration,
+        "throughput_rps": len(total) / duration,
+        "all": summarize(total),
+        "read": summarize(latencies["read"]),
+        "write": summarize(latencies["write"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["inprocess", "process"])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--posts", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+    from posts.validators import reset_moderation_pipeline
+
+    results = {}
+    with test_database():
+        author, post_ids = create_fixtures(args.posts)
+        for backend in args.backends:
+            with override_settings(
+                MODERATION_BACKEND=backend,
+                MODERATION_POOL_SIZE=args.pool_size,
+                PROFANITY_CACHE_SIZE=0,
+                PROFANITY_PREFILTER_ENABLED=False,
+            ):
+                reset_moderation_pipeline()
+                # Warm up so pool start-up and model loading are not measured.
+                run_load(author, post_ids, args.threads, args.threads * 4, args.write_ratio, args.seed)
+                results[backend] = run_load(
+                    author, post_ids, args.threads, args.requests, args.write_ratio, args.seed
+                )
+                reset_moderation_pipeline()
+
+    print(f"{'backend':<12}{'rps':>10}{'all p99':>12}{'read p99':>12}{'write p99':>12}")
+    for backend, result in results.items():
+        print(
+            f"{backend:<12}{result['throughput_rps']:>10.1f}"
+            f"{result['all']['p99_ms']:>10.1f}ms"
+            f"{result['read']['p99_ms']:>10.1f}ms"
+            f"{result['write']['p99_ms']:>10.1f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
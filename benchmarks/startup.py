@@ -0,0 +1,98 @@
+"""
+Measure process start-up cost: wall time of `manage.py check`, time until
+Django's app registry is ready, and which modules dominate import time
+(from `python -X importtime`).
+
+Heavy optional dependencies are listed separately; none of them should be
+imported at start-up since they are loaded lazily through posts.providers.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import ROOT_DIR
+
+HEAVY_MODULES = ("sklearn", "scipy", "joblib", "profanity_check", "google.generativeai")
+
+APP_READY_SCRIPT = """
+import os, time
+started = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog.settings")
+import django
+django.setup()
+print(time.perf_counter() - started)
+"""
+
+
+def run(args, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True, env=os.environ.copy())
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    return elapsed, result
+
+
+def parse_importtime(stderr):
+    """Return {module: cumulative microseconds} for top-level entries of -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cumulative.isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to report.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    check_times = [run(["manage.py", "check"])[0] for _ in range(args.runs)]
+    ready_times = [float(run(["-c", APP_READY_SCRIPT])[1].stdout) for _ in range(args.runs)]
+
+    _, traced = run(["manage.py", "check"], importtime=True)
+    imports = parse_importtime(traced.stderr)
+    slowest = sorted(
+        ((name, micros) for name, micros in imports.items() if "." not in name),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:args.top]
+    heavy = sorted(
+        name for name in imports if any(name == module or name.startswith(f"{module}.") for module in HEAVY_MODULES)
+    )
+
+    results = {
+        "manage_py_check_s": statistics.median(check_times),
+        "app_ready_s": statistics.median(ready_times),
+        "modules_imported": len(imports),
+        "slowest_imports_ms": {name: micros / 1000 for name, micros in slowest},
+        "heavy_modules_imported": heavy,
+    }
+
+    print(f"manage.py check  {results['manage_py_check_s'] * 1000:8.1f} ms (median of {args.runs})")
+    print(f"app ready        {results['app_ready_s'] * 1000:8.1f} ms (median of {args.runs})")
+    print(f"modules imported {results['modules_imported']:8d}")
+    print("slowest top-level imports:")
+    for name, millis in results["slowest_imports_ms"].items():
+        print(f"  {name:<40}{millis:8.1f} ms")
+    print(f"heavy modules imported at start-up: {', '.join(heavy) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'blog.urls'
@@ -61,7 +63,7 @@ WSGI_APPLICATION = 'blog.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
     }
 }
 
@@ -96,13 +98,59 @@ AUTH_USER_MODEL = 'user.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.TimedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'posts.timing.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5
 }
 
+# Views declaring a `query_budget` are checked against it on every request (see posts.querybudget).
+# QUERY_BUDGET_ACTION is 'log' (warning) or 'raise' (fail the request, for CI).
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=True, cast=bool)
+QUERY_BUDGET_ACTION = config('QUERY_BUDGET_ACTION', default='log')
+
+# Per-request timing breakdown (see posts.timing): a log line for a SERVER_TIMING_SAMPLE_RATE share of
+# requests, with a Server-Timing header for staff users (any client with SERVER_TIMING_PUBLIC, or in DEBUG).
+# Requests over SERVER_TIMING_SLOW_MS (0 disables) are logged as warnings and, with
+# SERVER_TIMING_PROFILE_SLOW, profiled into SERVER_TIMING_PROFILE_DIR.
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=False, cast=bool)
+SERVER_TIMING_SAMPLE_RATE = config('SERVER_TIMING_SAMPLE_RATE', default=0.01, cast=float)
+SERVER_TIMING_PUBLIC = config('SERVER_TIMING_PUBLIC', default=False, cast=bool)
+SERVER_TIMING_SLOW_MS = config('SERVER_TIMING_SLOW_MS', default=1000, cast=float)
+SERVER_TIMING_PROFILE_SLOW = config('SERVER_TIMING_PROFILE_SLOW', default=False, cast=bool)
+SERVER_TIMING_PROFILE_DIR = config('SERVER_TIMING_PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+SERVER_TIMING_LOG_LEVEL = config('SERVER_TIMING_LOG_LEVEL', default='INFO')
+
+# Timing records are one JSON line each on their own handler, so they do not go through the root logger;
+# SERVER_TIMING_LOG_LEVEL=WARNING keeps only the slow requests.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'timing': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'timing': {'class': 'logging.StreamHandler', 'formatter': 'timing'},
+    },
+    'loggers': {
+        'posts.timing': {'handlers': ['timing'], 'level': SERVER_TIMING_LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Keyset pagination of the post and comment lists (see posts.pagination).
+# PAGINATION_COUNT_MODE is the default of the `count` query parameter: none, exact or estimate.
+PAGINATION_MAX_PAGE_SIZE = config('PAGINATION_MAX_PAGE_SIZE', default=100, cast=int)
+PAGINATION_COUNT_MODE = config('PAGINATION_COUNT_MODE', default='none')
+PAGINATION_COUNT_CACHE_TTL = config('PAGINATION_COUNT_CACHE_TTL', default=60, cast=int)
+
+# Largest number of comments accepted by one request to the bulk comment endpoint.
+BULK_COMMENTS_MAX_ITEMS = config('BULK_COMMENTS_MAX_ITEMS', default=500, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -121,3 +169,44 @@ SPECTACULAR_SETTINGS = {
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': True,
 }
+
+# Build ML models and API clients when the WSGI/ASGI application loads instead of on first request.
+WARM_UP_ON_START = config('WARM_UP_ON_START', default=True, cast=bool)
+
+# Content moderation
+MODERATION_BACKEND = config('MODERATION_BACKEND', default='inprocess')
+MODERATION_POOL_SIZE = config('MODERATION_POOL_SIZE', default=2, cast=int)
+MODERATION_POOL_TIMEOUT = config('MODERATION_POOL_TIMEOUT', default=2.0, cast=float)
+MODERATION_BATCHING_ENABLED = config('MODERATION_BATCHING_ENABLED', default=False, cast=bool)
+MODERATION_BATCH_WINDOW_MS = config('MODERATION_BATCH_WINDOW_MS', default=5, cast=float)
+MODERATION_MAX_BATCH_SIZE = config('MODERATION_MAX_BATCH_SIZE', default=64, cast=int)
+PROFANITY_MODEL_VERSION = config('PROFANITY_MODEL_VERSION', default='')
+PROFANITY_CACHE_SIZE = config('PROFANITY_CACHE_SIZE', default=10000, cast=int)
+PROFANITY_CACHE_TTL = config('PROFANITY_CACHE_TTL', default=3600, cast=int)
+PROFANITY_PREFILTER_ENABLED = config('PROFANITY_PREFILTER_ENABLED', default=True, cast=bool)
+PROFANITY_BLOCKLIST = config('PROFANITY_BLOCKLIST', default=str(BASE_DIR / 'posts' / 'data' / 'profanity_blocklist.txt'))
+PROFANITY_ALLOWLIST = config('PROFANITY_ALLOWLIST', default=str(BASE_DIR / 'posts' / 'data' / 'clean_phrases.txt'))
+# Texts up to this many characters skip the model and count as clean. Off by default: the model
+# flags short words (e.g. 'ass', 'fag') that the blocklist deliberately leaves to it.
+PROFANITY_FAST_PATH_MAX_LENGTH = config('PROFANITY_FAST_PATH_MAX_LENGTH', default=0, cast=int)
+
+# Auto-replies
+# 'memory' runs replies on an in-process scheduler, 'database' queues them as
+# AutoReplyJob rows for `manage.py run_autoreply_worker`. In both, replies falling due within
+# AUTO_REPLY_COALESCE_WINDOW seconds run together, up to AUTO_REPLY_BATCH_SIZE comments of a post per prompt.
+AUTO_REPLY_QUEUE = config('AUTO_REPLY_QUEUE', default='memory')
+AUTO_REPLY_WORKERS = config('AUTO_REPLY_WORKERS', default=4, cast=int)
+AUTO_REPLY_MAX_PENDING = config('AUTO_REPLY_MAX_PENDING', default=10000, cast=int)
+AUTO_REPLY_BATCH_SIZE = config('AUTO_REPLY_BATCH_SIZE', default=10, cast=int)
+AUTO_REPLY_COALESCE_WINDOW = config('AUTO_REPLY_COALESCE_WINDOW', default=5, cast=float)
+AUTO_REPLY_MAX_ATTEMPTS = config('AUTO_REPLY_MAX_ATTEMPTS', default=5, cast=int)
+AUTO_REPLY_RETRY_BACKOFF = config('AUTO_REPLY_RETRY_BACKOFF', default=30, cast=int)
+AUTO_REPLY_STALE_TIMEOUT = config('AUTO_REPLY_STALE_TIMEOUT', default=300, cast=int)
+# Seconds a user's settings stay cached for the auto-reply checks (0 disables the cache, see user.cache).
+USER_SETTINGS_CACHE_TTL = config('USER_SETTINGS_CACHE_TTL', default=300, cast=int)
+LLM_CLIENT = config('LLM_CLIENT', default='posts.llm.GeminiClient')
+LLM_MAX_CONCURRENCY = config('LLM_MAX_CONCURRENCY', default=100, cast=int)
+LLM_TIMEOUT = config('LLM_TIMEOUT', default=30, cast=float)
+LLM_REPLY_CACHE_SIZE = config('LLM_REPLY_CACHE_SIZE', default=1000, cast=int)
+LLM_REPLY_CACHE_TTL = config('LLM_REPLY_CACHE_TTL', default=86400, cast=int)
+LLM_REPLY_CACHE_VARIANTS = config('LLM_REPLY_CACHE_VARIANTS', default=1, cast=int)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from posts.models import Post, Comment
+from posts.models import Post, Comment, AutoReplyJob
 
 
 @admin.register(Post)
@@ -23,3 +23,16 @@ class CommentAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at"
     )
+
+
+@admin.register(AutoReplyJob)
+class AutoReplyJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "comment",
+        "state",
+        "due_at",
+        "attempts",
+        "claimed_by",
+        "updated_at"
+    )
+    list_filter = ("state",)
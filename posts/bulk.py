@@ -0,0 +1,73 @@
+"""
+Creation of many comments in one request: one moderation pass, one
+transaction, bulk INSERTs, and the follow-up work that post_save would do
+(thread paths, rollups, auto-reply scheduling) done in bulk as well.
+"""
+from django.db import transaction
+
+from . import rollups, threads
+from .jobs import schedule_auto_replies
+from .models import Comment, Post
+from .serializers import BulkCommentItemSerializer
+from .validators import moderate
+
+
+def _validate_items(items):
+    """Return ({index: validated data}, {index: errors}) for the raw items."""
+    valid, errors = {}, {}
+    for index, item in enumerate(items):
+        serializer = BulkCommentItemSerializer(data=item)
+        if serializer.is_valid():
+            valid[index] = serializer.validated_data
+        else:
+            errors[index] = serializer.errors
+    if not valid:
+        return valid, errors
+
+    posts = Post.objects.in_bulk({data['post'] for data in valid.values()})
+    parent_ids = {data['parent_comment'] for data in valid.values() if data.get('parent_comment')}
+    parents = Comment.objects.only('id', 'post_id', 'path').in_bulk(parent_ids) if parent_ids else {}
+
+    for index, data in list(valid.items()):
+        parent_id = data.get('parent_comment')
+        if data['post'] not in posts:
+            errors[index] = {'post': [f"Invalid pk \"{data['post']}\" - object does not exist."]}
+        elif parent_id and (parent_id not in parents or parents[parent_id].post_id != data['post']):
+            errors[index] = {'parent_comment': ["Must be an existing comment on the same post."]}
+        else:
+            data['post'] = posts[data['post']]
+            data['parent_comment'] = parents.get(parent_id)
+            continue
+        del valid[index]
+    return valid, errors
+
+
+def bulk_create_comments(author, items, atomic=False):
+    """
+    Create comments by `author` from `items` (dicts with post, content and an
+    optional parent_comment id). Invalid items are reported and the others
+    are created, unless `atomic` is set, in which case nothing is created if
+    any item is invalid.
+
+    Returns ({index: created Comment}, {index: errors}).
+    """
+    valid, errors = _validate_items(items)
+    if not valid or (atomic and errors):
+        return {}, errors
+
+    indexes = list(valid)
+    verdicts = moderate([valid[index]['content'] for index in indexes])
+    comments = [
+        Comment(
+            author=author,
+            is_blocked=bool(verdict),
+            **valid[index],
+        )
+        for index, verdict in zip(indexes, verdicts)
+    ]
+    with transaction.atomic():
+        created = Comment.objects.bulk_create(comments, batch_size=500)
+        threads.assign_paths(created)
+        rollups.record_comments(created)
+        schedule_auto_replies(created)
+    return dict(zip(indexes, created)), errors
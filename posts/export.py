@@ -0,0 +1,105 @@
+"""
+Streaming exports of posts, comments and the daily comment breakdown as
+NDJSON or CSV. Rows are read with a chunked QuerySet.iterator() over
+values_list(), so memory use does not depend on the size of the table, and
+every filter is applied in SQL.
+"""
+import csv
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, CommentDailyStats, Post
+from .rollups import day_start
+
+CHUNK_SIZE = 2000
+
+DATASETS = {
+    'posts': (Post, ('id', 'title', 'content', 'author', 'is_blocked', 'created_at', 'updated_at')),
+    'comments': (Comment, (
+        'id', 'post', 'author', 'parent_comment', 'content', 'is_blocked', 'is_auto_reply', 'created_at', 'updated_at',
+    )),
+    'daily-breakdown': (CommentDailyStats, ('date', 'total_comments', 'blocked_comments')),
+}
+OUTPUT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def export_rows(dataset, date_from=None, date_to=None, author=None, is_blocked=None):
+    """
+    Return (columns, row iterator) for `dataset`. Dates bound created_at
+    (the day itself for the daily breakdown), both inclusive.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r}. Choose from: {', '.join(DATASETS)}.")
+    model, columns = DATASETS[dataset]
+    queryset = model.objects.all()
+
+    if model is CommentDailyStats:
+        if author is not None or is_blocked is not None:
+            raise ExportError("The daily breakdown can only be filtered by date.")
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        queryset = queryset.order_by('date')
+    else:
+        try:
+            if date_from:
+                queryset = queryset.filter(created_at__gte=day_start(date_from))
+            if date_to:
+                queryset = queryset.filter(created_at__lt=day_start(date_to + timedelta(days=1)))
+        except OverflowError:
+            raise ExportError("The date range is out of bounds.")
+        if author is not None:
+            queryset = queryset.filter(author_id=author)
+        if is_blocked is not None:
+            queryset = queryset.filter(is_blocked=is_blocked)
+        queryset = queryset.order_by('pk')
+
+    return columns, queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, so rows can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(dict(zip(columns, row))) + '\n')
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def render(output_format, columns, rows):
+    if output_format not in OUTPUT_FORMATS:
+        raise ExportError(f"Unknown output format {output_format!r}. Choose from: {', '.join(OUTPUT_FORMATS)}.")
+    renderer = render_ndjson if output_format == 'ndjson' else render_csv
+    return renderer(columns, rows)
@@ -0,0 +1,227 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from user.cache import get_user_settings
+from .models import AutoReplyJob
+from .scheduler import get_auto_reply_scheduler
+from .tasks import auto_reply_to_comments
+
+logger = logging.getLogger(__name__)
+
+_reply_coalescer = None
+_lock = threading.Lock()
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_auto_reply(comment, delay):
+    return AutoReplyJob.objects.create(
+        comment=comment,
+        due_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def schedule_auto_replies(comments):
+    """
+    Schedule auto-replies for comments inserted without post_save (e.g. by
+    bulk_create), like the comment_post_save signal does for single comments.
+    Comments on posts sharing a reply delay are replied to in one batch.
+    Expects `comment.post` to be loaded already.
+    """
+    by_delay = {}
+    for comment in comments:
+        if comment.is_auto_reply or comment.is_blocked:
+            continue
+        user_settings = get_user_settings(comment.post.author_id)
+        if user_settings and user_settings.auto_reply_enabled:
+            by_delay.setdefault(user_settings.auto_reply_delay, []).append(comment)
+
+    if settings.AUTO_REPLY_QUEUE == 'database':
+        now = timezone.now()
+        AutoReplyJob.objects.bulk_create(
+            AutoReplyJob(comment=comment, due_at=now + timedelta(seconds=delay))
+            for delay, group in by_delay.items()
+            for comment in group
+        )
+        return
+
+    coalescer = get_reply_coalescer()
+    for delay, group in by_delay.items():
+        transaction.on_commit(partial(coalescer.add, [comment.id for comment in group], delay))
+
+
+def reply_to_comments(comment_ids):
+    for comment_id, error in auto_reply_to_comments(comment_ids).items():
+        if error is not None:
+            logger.error(f"Auto-reply to comment {comment_id} failed: {error}")
+
+
+class ReplyCoalescer:
+    """
+    In-process counterpart of the lookahead of claim_due_jobs: auto-replies
+    falling due within AUTO_REPLY_COALESCE_WINDOW seconds of each other are
+    run as one scheduler job. That job calls reply_to_comments(), which merges
+    the comments of each post into batched prompts and keeps all of its LLM
+    requests in flight at once, so one worker thread serves the whole burst.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = []
+
+    def add(self, comment_ids, delay):
+        """Reply to `comment_ids` in about `delay` seconds. Returns False if the scheduler is full."""
+        due_at = time.monotonic() + delay
+        with self._lock:
+            for batch in self._open:
+                if batch['due_at'] <= due_at <= batch['due_at'] + settings.AUTO_REPLY_COALESCE_WINDOW:
+                    batch['comment_ids'].extend(comment_ids)
+                    return True
+            batch = {'due_at': due_at, 'comment_ids': list(comment_ids)}
+            self._open.append(batch)
+        if get_auto_reply_scheduler().schedule(delay, self.flush, batch):
+            return True
+        self._close(batch)
+        return False
+
+    def flush(self, batch):
+        reply_to_comments(self._close(batch))
+
+    def _close(self, batch):
+        with self._lock:
+            self._open = [other for other in self._open if other is not batch]
+            return list(batch['comment_ids'])
+
+
+def get_reply_coalescer():
+    global _reply_coalescer
+    if _reply_coalescer is None:
+        with _lock:
+            if _reply_coalescer is None:
+                _reply_coalescer = ReplyCoalescer()
+    return _reply_coalescer
+
+
+def claim_due_jobs(worker_id, batch_size, now=None, lookahead=0):
+    """
+    Atomically claim up to `batch_size` due jobs for `worker_id`.
+
+    Jobs falling due within `lookahead` seconds are claimed as well, so that
+    replies to a burst of comments on one post can share an LLM request.
+
+    The claim is a conditional UPDATE on the pending state, so two workers can
+    never claim the same job even on databases without row locking. Where
+    SKIP LOCKED is available, concurrent workers also avoid waiting on each other.
+    """
+    now = now or timezone.now()
+    due = (
+        AutoReplyJob.objects
+        .filter(state=AutoReplyJob.State.PENDING, due_at__lte=now + timedelta(seconds=lookahead))
+        .order_by('due_at', 'id')
+    )
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job_ids = list(due.values_list('id', flat=True)[:batch_size])
+        AutoReplyJob.objects.filter(id__in=job_ids, state=AutoReplyJob.State.PENDING).update(
+            state=AutoReplyJob.State.RUNNING,
+            claimed_by=worker_id,
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(
+        AutoReplyJob.objects
+        .filter(id__in=job_ids, state=AutoReplyJob.State.RUNNING, claimed_by=worker_id)
+        .order_by('due_at', 'id')
+    )
+
+
+def release_stale_jobs(timeout, now=None):
+    """
+    Return jobs whose worker died mid-run to the pending state. Jobs that have
+    used up AUTO_REPLY_MAX_ATTEMPTS fail instead, so a job that keeps crashing
+    its worker is not retried forever. Returns the number of released jobs.
+    """
+    now = now or timezone.now()
+    stale = AutoReplyJob.objects.filter(
+        state=AutoReplyJob.State.RUNNING,
+        claimed_at__lt=now - timedelta(seconds=timeout),
+    )
+    failed = stale.filter(attempts__gte=settings.AUTO_REPLY_MAX_ATTEMPTS).update(
+        state=AutoReplyJob.State.FAILED,
+        last_error='The worker stopped while running the job.',
+        claimed_by='',
+        claimed_at=None,
+    )
+    if failed:
+        logger.error(f"{failed} stale auto-reply job(s) failed permanently: their worker stopped too often.")
+    return stale.update(state=AutoReplyJob.State.PENDING, claimed_by='', claimed_at=None)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: AUTO_REPLY_RETRY_BACKOFF seconds doubled per failed attempt."""
+    return settings.AUTO_REPLY_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+
+
+def complete_job(job):
+    job.state = AutoReplyJob.State.DONE
+    job.last_error = ''
+    job.save(update_fields=['state', 'last_error', 'updated_at'])
+
+
+def fail_job(job, error):
+    job.last_error = repr(error)
+    if job.attempts >= settings.AUTO_REPLY_MAX_ATTEMPTS:
+        job.state = AutoReplyJob.State.FAILED
+        logger.error(f"Auto-reply job {job.id} failed permanently: {error!r}")
+    else:
+        job.state = AutoReplyJob.State.PENDING
+        job.due_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        logger.warning(f"Auto-reply job {job.id} failed, retrying at {job.due_at}: {error!r}")
+    job.claimed_by = ''
+    job.claimed_at = None
+    job.save(update_fields=['state', 'due_at', 'last_error', 'claimed_by', 'claimed_at', 'updated_at'])
+
+
+def run_jobs(jobs):
+    """Run a batch of claimed jobs with their LLM requests in flight concurrently."""
+    try:
+        errors = auto_reply_to_comments([job.comment_id for job in jobs])
+    except Exception as exc:
+        # E.g. a configuration error: the whole batch is retried with backoff, the worker keeps running.
+        logger.exception("Auto-reply batch failed")
+        errors = dict.fromkeys((job.comment_id for job in jobs), exc)
+    succeeded = 0
+    for job in jobs:
+        error = errors[job.comment_id]
+        if error is None:
+            complete_job(job)
+            succeeded += 1
+        else:
+            fail_job(job, error)
+    return succeeded
+
+
+def get_backlog():
+    """Summarize the job table: counts per state and the oldest pending due time."""
+    counts = dict(
+        AutoReplyJob.objects.values_list('state').annotate(count=Count('id')).order_by()
+    )
+    pending = AutoReplyJob.objects.filter(state=AutoReplyJob.State.PENDING)
+    return {
+        'states': {state: counts.get(state, 0) for state in AutoReplyJob.State.values},
+        'due_now': pending.filter(due_at__lte=timezone.now()).count(),
+        'oldest_due_at': pending.aggregate(oldest=Min('due_at'))['oldest'],
+    }
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class LLMClient(ABC):
+    """
+    Interface of the text generation clients used for auto-replies.
+    Implementations only need an async `generate` coroutine.
+    """
+    model_name = ''
+
+    @abstractmethod
+    async def generate(self, prompt):
+        """Return the text generated for `prompt`."""
+
+
+class GeminiClient(LLMClient):
+
+    def __init__(self, api_key=None, model_name=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.environ["GOOGLE_API_KEY"])
+        self.model_name = model_name or os.environ["GENERATIVE_MODEL"]
+        self._model = genai.GenerativeModel(self.model_name)
+
+    async def generate(self, prompt):
+        response = await self._model.generate_content_async(prompt)
+        return response.text
+
+
+class FakeLLMClient(LLMClient):
+    """Local stand-in for tests and benchmarks: answers after a fixed latency."""
+    model_name = 'fake'
+
+    def __init__(self, latency=0.05, reply="Thank you for sharing your thoughts!"):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.reply
+
+
+class ReplyCache:
+    """
+    Bounded LRU of generated replies.
+
+    With `variants` > 1 the first few requests for a key still reach the LLM
+    and each reply is kept; once `variants` replies are stored, hits return a
+    random one of them so identical comments do not all get the same answer.
+    """
+
+    def __init__(self, max_size=1000, ttl=None, variants=1):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variants = max(variants, 1)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry, now):
+        return self.ttl is None or now - entry[1] < self.ttl
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_fresh(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None and len(entry[0]) >= self.variants:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return random.choice(entry[0])
+            self.misses += 1
+            return None
+
+    def add(self, key, reply):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_fresh(entry, now):
+                entry = self._entries[key] = ([], now)
+            if len(entry[0]) < self.variants:
+                entry[0].append(reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "variants": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+
+class AsyncLLMRunner:
+    """
+    Drives generation requests of an LLMClient concurrently on an event loop
+    running in a single background thread.
+
+    Synchronous callers submit prompts and get concurrent.futures.Future
+    objects back, so a handful of threads can keep hundreds of requests in
+    flight. At most `max_concurrency` requests run at once and each one is
+    cancelled after `timeout` seconds.
+
+    Prompts submitted with a `cache_key` are answered from `cache` when
+    possible, and concurrent requests for the same key share one LLM call.
+    """
+
+    def __init__(self, client, max_concurrency=100, timeout=30, cache=None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self._in_flight = {}
+        self._loop = None
+        self._semaphore = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self):
+        with self._lock:
+            # Threads do not survive a fork, so each process needs its own loop thread.
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._loop.run_forever, name="llm-event-loop", daemon=True
+                ).start()
+            return self._loop
+
+    async def _generate(self, prompt):
+        async with self._semaphore:
+            return await asyncio.wait_for(self.client.generate(prompt), self.timeout)
+
+    async def _generate_cached(self, prompt, cache_key):
+        # Runs on the loop thread only, so `_in_flight` needs no lock.
+        reply = self.cache.get(cache_key)
+        if reply is not None:
+            return reply
+        task = self._in_flight.get(cache_key)
+        if task is not None:
+            self.cache.record_coalesced()
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._generate(prompt))
+        self._in_flight[cache_key] = task
+        try:
+            reply = await asyncio.shield(task)
+        finally:
+            self._in_flight.pop(cache_key, None)
+        self.cache.add(cache_key, reply)
+        return reply
+
+    def submit(self, prompt, cache_key=None):
+        if cache_key is not None and self.cache is not None:
+            coroutine = self._generate_cached(prompt, cache_key)
+        else:
+            coroutine = self._generate(prompt)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop())
+
+    def generate(self, prompt, cache_key=None):
+        return self.submit(prompt, cache_key).result()
+
+    def generate_many(self, prompts, cache_keys=None):
+        """Generate all prompts concurrently. Failed prompts yield their exception instead of a text."""
+        cache_keys = cache_keys or [None] * len(prompts)
+        return wait_for_replies(
+            [self.submit(prompt, cache_key) for prompt, cache_key in zip(prompts, cache_keys)]
+        )
+
+
+def wait_for_replies(futures):
+    """Wait for submitted prompts, returning each reply or the exception it raised."""
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as exc:
+            results.append(exc)
+    return results
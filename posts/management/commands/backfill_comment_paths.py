@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.threads import backfill_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized thread path of every comment, e.g. after raw SQL inserts or imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Comments read and updated per query.")
+
+    def handle(self, *args, **options):
+        updated = backfill_paths(batch_size=options["batch_size"])
+        self.stdout.write(f"Updated the path of {updated} comment(s).")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from posts.export import DATASETS, OUTPUT_FORMATS, ExportError, export_rows, render
+
+
+class Command(BaseCommand):
+    help = "Stream posts, comments or the daily comment breakdown to a file or stdout as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=list(DATASETS))
+        parser.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default="ndjson")
+        parser.add_argument("--output", help="File to write to. Defaults to stdout.")
+        parser.add_argument("--date-from", help="First creation day to export (YYYY-MM-DD).")
+        parser.add_argument("--date-to", help="Last creation day to export (YYYY-MM-DD).")
+        parser.add_argument("--author", type=int, help="Only export rows by this user id.")
+        parser.add_argument("--blocked", choices=["true", "false"], help="Only export blocked or visible rows.")
+
+    def handle(self, *args, **options):
+        filters = {
+            "date_from": self.parse(options["date_from"]),
+            "date_to": self.parse(options["date_to"]),
+            "author": options["author"],
+            "is_blocked": None if options["blocked"] is None else options["blocked"] == "true",
+        }
+        try:
+            columns, rows = export_rows(options["dataset"], **filters)
+            chunks = render(options["output_format"], columns, rows)
+            if options["output"]:
+                with open(options["output"], "w", newline="", encoding="utf-8") as output:
+                    output.writelines(chunks)
+            else:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending="")
+        except ExportError as exc:
+            raise CommandError(exc)
+
+    @staticmethod
+    def parse(value):
+        if value is None:
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise CommandError(f"Invalid date {value!r}. Please use YYYY-MM-DD.")
+        return date
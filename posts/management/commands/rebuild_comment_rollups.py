@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from posts.models import Comment, CommentDailyStats
+from posts.rollups import comment_date, rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily comment rollup table from the Comment table, in chunks of days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", help="First day to rebuild (YYYY-MM-DD). Defaults to the oldest comment.")
+        parser.add_argument("--date-to", help="Last day to rebuild (YYYY-MM-DD). Defaults to the newest comment.")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        bounds = Comment.objects.aggregate(oldest=Min("created_at"), newest=Max("created_at"))
+        stats_bounds = CommentDailyStats.objects.aggregate(oldest=Min("date"), newest=Max("date"))
+
+        date_from = self.parse(options["date_from"]) or min(
+            filter(None, [bounds["oldest"] and comment_date(bounds["oldest"]), stats_bounds["oldest"]]),
+            default=None,
+        )
+        date_to = self.parse(options["date_to"]) or max(
+            filter(None, [bounds["newest"] and comment_date(bounds["newest"]), stats_bounds["newest"]]),
+            default=None,
+        )
+        if date_from is None or date_to is None:
+            self.stdout.write("No comments to roll up.")
+            return
+        if date_from > date_to:
+            raise CommandError("--date-from must not be after --date-to.")
+
+        days = rebuild(date_from, date_to, chunk_days=options["chunk_days"])
+        self.stdout.write(f"Rebuilt rollups from {date_from} to {date_to}: {days} day(s) with comments.")
+
+    @staticmethod
+    def parse(value):
+        if value is None:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f"Invalid date {value!r}. Please use YYYY-MM-DD.")
+        return date
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.jobs import claim_due_jobs, default_worker_id, get_backlog, release_stale_jobs, run_jobs
+
+
+class Command(BaseCommand):
+    help = "Process due auto-reply jobs. Several workers can run side by side."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Jobs claimed per round. Their LLM requests run concurrently."
+        )
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when idle.")
+        parser.add_argument("--worker-id", default=None, help="Defaults to <hostname>:<pid>.")
+        parser.add_argument("--once", action="store_true", help="Process one batch and exit.")
+        parser.add_argument("--status", action="store_true", help="Print the job backlog and exit.")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            self.print_backlog()
+            return
+
+        worker_id = options["worker_id"] or default_worker_id()
+        self.stdout.write(f"Auto-reply worker {worker_id} started.")
+        try:
+            while True:
+                released = release_stale_jobs(settings.AUTO_REPLY_STALE_TIMEOUT)
+                if released:
+                    self.stdout.write(f"Released {released} stale job(s).")
+
+                jobs = claim_due_jobs(
+                    worker_id, options["batch_size"], lookahead=settings.AUTO_REPLY_COALESCE_WINDOW
+                )
+                succeeded = run_jobs(jobs) if jobs else 0
+                if jobs:
+                    self.stdout.write(f"Processed {len(jobs)} job(s), {len(jobs) - succeeded} failed.")
+
+                if options["once"]:
+                    break
+                if len(jobs) < options["batch_size"]:
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(f"Auto-reply worker {worker_id} stopped.")
+
+    def print_backlog(self):
+        backlog = get_backlog()
+        for state, count in backlog["states"].items():
+            self.stdout.write(f"{state:<10}{count}")
+        self.stdout.write(f"{'due now':<10}{backlog['due_now']}")
+        self.stdout.write(f"{'oldest':<10}{backlog['oldest_due_at'] or '-'}")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import Seeder, load_fixture
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load a JSON fixture and/or generate users, posts and threaded comments with bulk_create, "
+        "without per-row signals. Derived rows (user settings, thread paths, rollups) are written in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fixture", help="JSON fixture (dumpdata format) to load first. Existing rows are kept.")
+        parser.add_argument("--users", type=int, default=0, help="Number of users to generate.")
+        parser.add_argument("--posts", type=int, default=0, help="Number of posts to generate.")
+        parser.add_argument("--comments", type=int, default=0, help="Number of comments to generate.")
+        parser.add_argument("--days", type=int, default=365, help="Spread generated content over this many days.")
+        parser.add_argument("--reply-ratio", type=float, default=0.6, help="Share of comments that are replies.")
+        parser.add_argument("--blocked-ratio", type=float, default=0.02, help="Share of blocked posts and comments.")
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per bulk_create transaction.")
+        parser.add_argument("--seed", type=int, help="Random seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        if options["fixture"]:
+            loaded = load_fixture(options["fixture"], chunk_size=options["chunk_size"])
+            self.stdout.write(f"Loaded {options['fixture']}: " + ", ".join(f"{n} {label}" for label, n in loaded.items()))
+
+        if not (options["users"] or options["posts"] or options["comments"]):
+            return
+        if options["posts"] and not options["users"] or options["comments"] and not options["posts"]:
+            raise CommandError("Generated posts need --users and generated comments need --posts.")
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1.")
+
+        timings = Seeder(
+            users=options["users"],
+            posts=options["posts"],
+            comments=options["comments"],
+            days=options["days"],
+            reply_ratio=options["reply_ratio"],
+            blocked_ratio=options["blocked_ratio"],
+            chunk_size=options["chunk_size"],
+            seed=options["seed"],
+            stdout=self.stdout,
+        ).run()
+        rows = sum(count for count, _ in timings.values())
+        elapsed = sum(seconds for _, seconds in timings.values())
+        self.stdout.write(f"Seeded {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s).")
@@ -0,0 +1,84 @@
+import logging
+import time
+
+from django.conf import settings
+
+from . import timing
+from .querybudget import QueryBudgetExceeded, count_queries, get_view_budget
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the SQL queries of every request and reports views that run more
+    than their `query_budget`: logged as a warning, or raised as
+    QueryBudgetExceeded when QUERY_BUDGET_ACTION is 'raise' (for CI).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        request.query_budget = None
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        budget = request.query_budget
+        if budget is not None and len(counter) > budget:
+            message = counter.report(budget, f"{request.method} {request.path}")
+            if settings.QUERY_BUDGET_ACTION == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_budget(view_func, request.method)
+
+
+class RequestTimingMiddleware:
+    """
+    Breaks sampled requests down into database, moderation, serialization,
+    authentication and LLM time (see posts.timing), reported in a log line
+    and, to staff users, in a Server-Timing header. The other requests are
+    only timed as a whole, and logged when slower than SERVER_TIMING_SLOW_MS.
+    Put it first to include the other middleware in the total.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING_ENABLED:
+            return self.get_response(request)
+
+        if not timing.sampled():
+            started = time.perf_counter()
+            response = self.get_response(request)
+            timing.report_slow(
+                'request', f"{request.method} {request.path}", time.perf_counter() - started,
+                status=response.status_code, view=getattr(request.resolver_match, 'view_name', None),
+            )
+            return response
+
+        with timing.collect(profile=settings.SERVER_TIMING_PROFILE_SLOW) as timings:
+            response = self.get_response(request)
+
+        if self.show_header(request):
+            response['Server-Timing'] = timings.header()
+        timing.report(
+            timings, 'request', f"{request.method} {request.path}",
+            status=response.status_code, view=getattr(request.resolver_match, 'view_name', None),
+        )
+        return response
+
+    @staticmethod
+    def show_header(request):
+        # Timings reveal how the server spends its time, so only staff see them outside of development.
+        if settings.SERVER_TIMING_PUBLIC or settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    CommentDailyStats = apps.get_model('posts', 'CommentDailyStats')
+    rows = (
+        Comment.objects.annotate(date=TruncDate('created_at'))
+        .values('date')
+        .annotate(total=Count('id'), blocked=Count('id', filter=Q(is_blocked=True)))
+        .order_by()
+    )
+    CommentDailyStats.objects.bulk_create(
+        CommentDailyStats(date=row['date'], total_comments=row['total'], blocked_comments=row['blocked'])
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_autoreplyjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total_comments', models.PositiveIntegerField(default=0)),
+                ('blocked_comments', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'comment daily stats',
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
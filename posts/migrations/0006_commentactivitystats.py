@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import Trunc
+
+
+def backfill_activity_stats(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    CommentActivityStats = apps.get_model('posts', 'CommentActivityStats')
+    for resolution in ('hour', 'day', 'week', 'month'):
+        rows = (
+            Comment.objects.annotate(slot=Trunc('created_at', resolution))
+            .values('slot', 'post_id', 'author_id', 'is_auto_reply')
+            .annotate(total=Count('id'), blocked=Count('id', filter=Q(is_blocked=True)))
+            .order_by()
+        )
+        CommentActivityStats.objects.bulk_create(
+            CommentActivityStats(
+                resolution=resolution,
+                bucket=row['slot'],
+                post_id=row['post_id'],
+                author_id=row['author_id'],
+                is_auto_reply=row['is_auto_reply'],
+                total_comments=row['total'],
+                blocked_comments=row['blocked'],
+            )
+            for row in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_commentdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentActivityStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('is_auto_reply', models.BooleanField(default=False)),
+                ('total_comments', models.PositiveIntegerField(default=0)),
+                ('blocked_comments', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.post')),
+            ],
+            options={
+                'verbose_name_plural': 'comment activity stats',
+                'indexes': [models.Index(fields=['resolution', 'post', 'bucket'], name='activity_post_bucket_idx'), models.Index(fields=['resolution', 'author', 'bucket'], name='activity_author_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'bucket', 'post', 'author', 'is_auto_reply'), name='unique_comment_activity_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_activity_stats, migrations.RunPython.noop),
+    ]
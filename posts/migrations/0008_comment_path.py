@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_comment_paths(apps, schema_editor):
+    from posts.threads import backfill_paths
+
+    backfill_paths(apps.get_model('posts', 'Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_comment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def split_activity_scopes(apps, schema_editor):
+    """Replace the rows keyed by post and author together with rows over all comments, per post and per author."""
+    CommentActivityStats = apps.get_model('posts', 'CommentActivityStats')
+    combined = CommentActivityStats.objects.filter(post__isnull=False, author__isnull=False)
+    for scope in ((), ('post_id',), ('author_id',)):
+        rows = (
+            combined.values('resolution', 'bucket', 'is_auto_reply', *scope)
+            .annotate(total=Sum('total_comments'), blocked=Sum('blocked_comments'))
+            .order_by()
+        )
+        CommentActivityStats.objects.bulk_create(
+            (
+                CommentActivityStats(
+                    resolution=row['resolution'],
+                    bucket=row['bucket'],
+                    post_id=row.get('post_id'),
+                    author_id=row.get('author_id'),
+                    is_auto_reply=row['is_auto_reply'],
+                    total_comments=row['total'],
+                    blocked_comments=row['blocked'],
+                )
+                for row in rows
+            ),
+            batch_size=1000,
+        )
+    combined.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_comment_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='commentactivitystats',
+            name='unique_comment_activity_bucket',
+        ),
+        migrations.RemoveIndex(
+            model_name='commentactivitystats',
+            name='activity_post_bucket_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='commentactivitystats',
+            name='activity_author_bucket_idx',
+        ),
+        migrations.AlterField(
+            model_name='commentactivitystats',
+            name='author',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='commentactivitystats',
+            name='post',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.post'),
+        ),
+        migrations.RunPython(split_activity_scopes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commentactivitystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('author', None), ('post', None)), fields=('resolution', 'bucket', 'is_auto_reply'), name='unique_activity_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentactivitystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('author', None)), fields=('resolution', 'post', 'bucket', 'is_auto_reply'), name='unique_activity_post_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentactivitystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('post', None)), fields=('resolution', 'author', 'bucket', 'is_auto_reply'), name='unique_activity_author_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentactivitystats',
+            constraint=models.CheckConstraint(condition=models.Q(('post', None), ('author', None), _connector='OR'), name='activity_single_scope'),
+        ),
+    ]
@@ -6,30 +6,155 @@ from blog.settings import AUTH_USER_MODEL
 class Post(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
-    author = models.ForeignKey(AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
+    # Not indexed on its own: post_author_created_idx leads with it.
+    author = models.ForeignKey(AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts', db_index=False)
     is_blocked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='post_created_idx'),
+            models.Index(fields=['author', 'created_at'], name='post_author_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 
 class Comment(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
+    # The foreign keys are not indexed on their own: the composite indexes in Meta lead with them.
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', db_index=False)
+    author = models.ForeignKey(AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments', db_index=False)
     parent_comment = models.ForeignKey(
         'self',
         null=True,
         blank=True,
         related_name='replies',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
     content = models.TextField()
     is_blocked = models.BooleanField(default=False)
     is_auto_reply = models.BooleanField(default=False)
+    # Ids of the ancestors and the comment itself, maintained by posts.threads.
+    path = models.TextField(blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+            models.Index(fields=['parent_comment', 'created_at'], name='comment_parent_created_idx'),
+            models.Index(fields=['author', 'created_at'], name='comment_author_created_idx'),
+            models.Index(fields=['created_at', 'is_blocked'], name='comment_created_blocked_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.author} on {self.post}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The row as loaded, for the rollups to tell what a later save or delete changes (see posts.rollups).
+        instance._loaded_values = (field_names, values)
+        return instance
+
+
+class AutoReplyJob(models.Model):
+    class State(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, related_name='auto_reply_job')
+    due_at = models.DateTimeField()
+    state = models.CharField(max_length=16, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=128, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'due_at'], name='autoreplyjob_state_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'Auto-reply job for comment {self.comment_id} ({self.state})'
+
+
+class CommentDailyStats(models.Model):
+    """Per-day comment counters, kept current by signals in posts.rollups."""
+    date = models.DateField(unique=True)
+    total_comments = models.PositiveIntegerField(default=0)
+    blocked_comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'comment daily stats'
+
+    def __str__(self):
+        return f'{self.date}: {self.total_comments} comments, {self.blocked_comments} blocked'
+
+
+class CommentActivityStats(models.Model):
+    """
+    Comment counters pre-aggregated per time bucket at several resolutions
+    and split by auto-reply flag, kept current by posts.rollups. Every comment
+    is counted in three scopes: over all comments (no post or author), per
+    post (no author) and per author (no post), so each breakdown only sums the
+    rows of its own scope.
+    """
+    class Resolution(models.TextChoices):
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+        WEEK = 'week', 'Week'
+        MONTH = 'month', 'Month'
+
+    resolution = models.CharField(max_length=8, choices=Resolution.choices)
+    bucket = models.DateTimeField()
+    # Plain references without constraints: counters are decremented by the
+    # comments' own delete signals, so they must not cascade on their own.
+    post = models.ForeignKey(
+        Post, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, blank=True,
+        related_name='+',
+    )
+    author = models.ForeignKey(
+        AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, blank=True,
+        related_name='+',
+    )
+    is_auto_reply = models.BooleanField(default=False)
+    total_comments = models.PositiveIntegerField(default=0)
+    blocked_comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'comment activity stats'
+        # One unique index per scope, which also serves the breakdown queries of that scope.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'bucket', 'is_auto_reply'],
+                condition=models.Q(post=None, author=None),
+                name='unique_activity_bucket',
+            ),
+            models.UniqueConstraint(
+                fields=['resolution', 'post', 'bucket', 'is_auto_reply'],
+                condition=models.Q(author=None),
+                name='unique_activity_post_bucket',
+            ),
+            models.UniqueConstraint(
+                fields=['resolution', 'author', 'bucket', 'is_auto_reply'],
+                condition=models.Q(post=None),
+                name='unique_activity_author_bucket',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(post=None) | models.Q(author=None), name='activity_single_scope'
+            ),
+        ]
+
+    def __str__(self):
+        scope = f'post {self.post_id}' if self.post_id else f'author {self.author_id}' if self.author_id else 'all'
+        return f'{self.resolution} {self.bucket}: {self.total_comments} comments ({scope})'
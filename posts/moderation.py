@@ -0,0 +1,412 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram:
+    """Thread-safe bucketed histogram (upper-inclusive bounds, plus an overflow bucket)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "count": sum(counts),
+            "sum": total,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class ModerationDispatcher:
+    """
+    Collects texts submitted by concurrent request threads and classifies them
+    together, so many small writes share one vectorized model call.
+
+    A batch is flushed once `max_batch_size` texts are queued or `window`
+    seconds after its oldest text arrived, whichever comes first.
+    """
+
+    def __init__(self, classify, window=0.005, max_batch_size=64):
+        self._classify = classify
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_times = Histogram(WAIT_TIME_BUCKETS)
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, texts):
+        """Queue texts for classification and return one future per text."""
+        enqueued_at = time.monotonic()
+        futures = [Future() for _ in texts]
+        with self._condition:
+            self._ensure_started()
+            self._pending.extend(
+                (text, future, enqueued_at) for text, future in zip(texts, futures)
+            )
+            self._condition.notify()
+        return futures
+
+    def classify(self, texts):
+        return [future.result() for future in self.submit(list(texts))]
+
+    def stats(self):
+        with self._condition:
+            queued = len(self._pending)
+        return {
+            "window": self.window,
+            "max_batch_size": self.max_batch_size,
+            "queued": queued,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_time": self.wait_times.snapshot(),
+        }
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so pre-fork servers need a fresh one per worker.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="moderation-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = self._pending[0][2] + self.window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        started_at = time.monotonic()
+        try:
+            verdicts = self._classify([text for text, _, _ in batch])
+        except Exception as exc:
+            for _, future, _ in batch:
+                future.set_exception(exc)
+            return
+
+        self.batch_sizes.observe(len(batch))
+        for (_, future, enqueued_at), verdict in zip(batch, verdicts):
+            self.wait_times.observe(started_at - enqueued_at)
+            future.set_result(verdict)
+
+
+def normalize_text(text):
+    return " ".join(text.casefold().split())
+
+
+class VerdictCache:
+    """
+    Bounded LRU of classifier verdicts keyed by a hash of the normalized text
+    and the model version, so repeated texts skip inference entirely.
+
+    Entries older than `ttl` seconds are treated as misses; a `ttl` of None
+    keeps them until they are evicted.
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._model_version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, model_version):
+        payload = f"{model_version}\0{normalize_text(text)}".encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts, model_version):
+        """Return cached verdicts in input order, with None for every miss."""
+        now = time.monotonic()
+        verdicts = []
+        with self._lock:
+            self._check_version(model_version)
+            for text in texts:
+                key = self.make_key(text, model_version)
+                entry = self._entries.get(key)
+                if entry is not None and (self.ttl is None or now - entry[1] < self.ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    verdicts.append(entry[0])
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    self.misses += 1
+                    verdicts.append(None)
+        return verdicts
+
+    def set_many(self, items, model_version):
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(model_version)
+            for text, verdict in items:
+                key = self.make_key(text, model_version)
+                self._entries[key] = (verdict, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "model_version": self._model_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def _check_version(self, model_version):
+        # Entries of an older model can never be hit again, so drop them eagerly.
+        if model_version != self._model_version:
+            self._entries.clear()
+            self._model_version = model_version
+
+
+class Verdict:
+    """A moderation decision together with the pipeline stage that made it."""
+
+    __slots__ = ("is_profane", "stage")
+
+    def __init__(self, is_profane, stage):
+        self.is_profane = is_profane
+        self.stage = stage
+
+    def __bool__(self):
+        return self.is_profane
+
+    def __repr__(self):
+        return f"Verdict(is_profane={self.is_profane}, stage={self.stage!r})"
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton matching a fixed set of keywords in one pass over
+    the text, regardless of how many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._lengths = [()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def __len__(self):
+        return len(self._goto)
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._lengths.append(())
+            state = next_state
+        if state:
+            self._lengths[state] += (len(keyword),)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._lengths[next_state] += self._lengths[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """Yield (start, end) spans of every keyword occurrence in `text`."""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length in self._lengths[state]:
+                yield index + 1 - length, index + 1
+
+    def contains_word(self, text):
+        """Return True if any keyword occurs in `text` as a whole word."""
+        for start, end in self.iter_matches(text):
+            before = text[start - 1] if start else " "
+            after = text[end] if end < len(text) else " "
+            if not before.isalnum() and not after.isalnum():
+                return True
+        return False
+
+
+class LexicalPreFilter:
+    """
+    Cheap first moderation stage in front of the ML model.
+
+    Texts containing a blocklisted word are profane, allowlisted phrases and
+    texts no longer than `fast_path_max_length` are clean, and everything else
+    is left undecided (None) for the model.
+    """
+
+    def __init__(self, blocklist, allowlist=(), fast_path_max_length=0):
+        self.automaton = KeywordAutomaton(normalize_text(word) for word in blocklist if word.strip())
+        self.allowlist = frozenset(normalize_text(phrase) for phrase in allowlist if phrase.strip())
+        self.fast_path_max_length = fast_path_max_length
+
+    @classmethod
+    def from_files(cls, blocklist_path, allowlist_path=None, fast_path_max_length=0):
+        return cls(
+            _read_wordlist(blocklist_path),
+            _read_wordlist(allowlist_path) if allowlist_path else (),
+            fast_path_max_length=fast_path_max_length,
+        )
+
+    def decide(self, text):
+        normalized = normalize_text(text)
+        if self.automaton.contains_word(normalized):
+            return Verdict(True, "lexicon")
+        if normalized in self.allowlist:
+            return Verdict(False, "allowlist")
+        if len(normalized) <= self.fast_path_max_length:
+            return Verdict(False, "fast_path")
+        return None
+
+
+def _read_wordlist(path):
+    with open(path, encoding="utf-8") as wordlist:
+        return [
+            line.strip() for line in wordlist
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+_worker_predict = None
+
+
+def _init_pool_worker():
+    # With the fork start method the parent has usually imported the model
+    # already, so workers share its pages instead of loading their own copy.
+    global _worker_predict
+    from profanity_check import predict
+    _worker_predict = predict
+
+
+def _classify_in_pool_worker(texts):
+    return [bool(flag) for flag in _worker_predict(texts)]
+
+
+class ProcessPoolModerationBackend:
+    """
+    Runs the profanity model in a pool of worker processes, keeping sklearn
+    inference (and the GIL it holds) off request threads.
+
+    If the pool breaks or does not answer within `timeout` seconds, texts are
+    classified in-process with `fallback` instead.
+    """
+
+    def __init__(self, fallback, max_workers=2, timeout=None):
+        self._fallback = fallback
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.fallbacks = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else None)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_pool_worker,
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, texts):
+        """Schedule classification of `texts` and return a future of the verdict list."""
+        return self._get_executor().submit(_classify_in_pool_worker, list(texts))
+
+    def classify(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        try:
+            return self.submit(texts).result(timeout=self.timeout)
+        except BrokenProcessPool:
+            logger.warning("Moderation process pool is broken, restarting it.")
+            self.shutdown(wait=False)
+        except (TimeoutError, OSError) as exc:
+            logger.warning(f"Moderation process pool failed ({exc!r}), classifying in-process.")
+        self.fallbacks += 1
+        return self._fallback(texts)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "timeout": self.timeout,
+            "fallbacks": self.fallbacks,
+        }
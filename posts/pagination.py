@@ -0,0 +1,201 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering columns of the last
+row seen instead of an OFFSET, so every page costs one index range scan no
+matter how deep the client has scrolled, and rows inserted meanwhile never
+shift a page. The total count is optional since it is the only part that
+grows with the table.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on `ordering` (taken from the view's `ordering` when set), whose
+    last field must be unique. Query parameters:
+
+    - `cursor`: opaque position returned in the `next` / `previous` links.
+    - `page_size`: rows per page, capped at PAGINATION_MAX_PAGE_SIZE.
+    - `count`: `none` (skip the total), `exact` (COUNT(*)) or `estimate`
+      (a count cached for PAGINATION_COUNT_CACHE_TTL seconds, or the planner's
+      row estimate on PostgreSQL).
+    """
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    count_modes = ('none', 'exact', 'estimate')
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def get_ordering(self, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        try:
+            value = int(value)
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be a positive integer.'})
+        return min(value, settings.PAGINATION_MAX_PAGE_SIZE)
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param, settings.PAGINATION_COUNT_MODE)
+        if mode not in self.count_modes:
+            raise ValidationError({self.count_query_param: f"Must be one of: {', '.join(self.count_modes)}."})
+        return mode
+
+    def decode_cursor(self, request):
+        """Return (position, reverse) for the requested cursor, or (None, False) for the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = data['p'], bool(data.get('r'))
+            if not isinstance(position, list) or len(position) != len(self.fields):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, position)
+            ]
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse=False):
+        position = [
+            self.model._meta.get_field(name).value_to_string(instance) for name, _ in self.fields
+        ]
+        data = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, base64.urlsafe_b64encode(data.encode()).decode()
+        )
+
+    def after(self, position, reverse):
+        """Q selecting the rows that come after `position` in the (possibly reversed) ordering."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {field: value for (field, _), value in zip(self.fields[:index], position)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.model = queryset.model
+        self.fields = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+        self.count_mode = self.get_count_mode(request)
+        self.base_url = request.build_absolute_uri()
+        self.queryset = queryset
+
+        position, reverse = self.decode_cursor(request)
+        order_by = [f"{'-' if descending != reverse else ''}{name}" for name, descending in self.fields]
+        page = queryset.order_by(*order_by)
+        if position is not None:
+            page = page.filter(self.after(position, reverse))
+        rows = list(page[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_count(self):
+        if self.count_mode == 'exact':
+            return self.queryset.count()
+        if self.count_mode == 'estimate':
+            return estimate_count(self.queryset)
+        return None
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        count = self.get_count()
+        if count is not None:
+            response['count'] = count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': f"Only present with {self.count_query_param}=exact|estimate."},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'Pagination cursor from a next/previous link.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': f'Results per page (at most {settings.PAGINATION_MAX_PAGE_SIZE}).',
+             'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': 'Total count: none, exact or estimate.',
+             'schema': {'type': 'string', 'enum': list(self.count_modes)}},
+        ]
+
+
+def estimate_count(queryset):
+    """
+    Approximate row count of `queryset`. On PostgreSQL an unfiltered table uses
+    the planner statistics; otherwise the exact count is cached for
+    PAGINATION_COUNT_CACHE_TTL seconds.
+    """
+    query = queryset.query
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return int(row[0])
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.sha256(f'{sql}\0{params!r}'.encode()).hexdigest()
+    key = f'pagination:count:{queryset.model._meta.label_lower}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+    return count
@@ -0,0 +1,77 @@
+"""
+Registry of lazily built heavy dependencies (ML models, API clients).
+
+Nothing is imported or constructed until the first `get()`, so management
+commands, tests and worker boot do not pay for models they never use.
+Servers can call `warm_up()` to build everything before the first request.
+"""
+import logging
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_factories = {}
+_instances = {}
+_lock = threading.RLock()
+
+
+def register(name, factory):
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+
+
+def get(name):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = _factories[name]()
+    return instance
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+def reset(*names):
+    """Forget built instances (all of them when no names are given) so they are rebuilt on next use."""
+    with _lock:
+        for name in names or list(_instances):
+            _instances.pop(name, None)
+
+
+def warm_up(names=None):
+    """Build the given providers (all by default) and return their load times in seconds."""
+    timings = {}
+    for name in names or list(_factories):
+        started = time.perf_counter()
+        try:
+            get(name)
+        except Exception:
+            logger.exception(f"Warm-up of provider {name!r} failed.")
+            continue
+        timings[name] = time.perf_counter() - started
+        logger.info(f"Provider {name!r} ready in {timings[name]:.3f}s.")
+    return timings
+
+
+def _build_prefilter():
+    from .moderation import LexicalPreFilter
+
+    return LexicalPreFilter.from_files(
+        settings.PROFANITY_BLOCKLIST,
+        settings.PROFANITY_ALLOWLIST,
+        fast_path_max_length=settings.PROFANITY_FAST_PATH_MAX_LENGTH,
+    )
+
+
+register('profanity_model', lambda: import_module('profanity_check').predict)
+register('profanity_prefilter', _build_prefilter)
+register('llm_client', lambda: import_string(settings.LLM_CLIENT)())
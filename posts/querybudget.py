@@ -0,0 +1,64 @@
+"""
+Query budgets: upper bounds on the number of SQL queries a block of code or
+an endpoint may run, to catch N+1 regressions.
+
+In tests:
+
+    with query_budget(3):
+        client.get(url)
+
+Views declare `query_budget`, either a number or a dict keyed by viewset
+action / lowercase HTTP method, which QueryBudgetMiddleware enforces.
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Database execute wrapper recording the SQL of every query it sees."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self, budget, label):
+        listing = "\n".join(f"{index}. {sql}" for index, sql in enumerate(self.queries, 1))
+        return f"{label} ran {len(self)} queries, over its budget of {budget}:\n{listing}"
+
+
+@contextmanager
+def count_queries(using='default'):
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+@contextmanager
+def query_budget(budget, using='default', label='Block'):
+    """Raise QueryBudgetExceeded if the block runs more than `budget` queries."""
+    with count_queries(using) as counter:
+        yield counter
+    if len(counter) > budget:
+        raise QueryBudgetExceeded(counter.report(budget, label))
+
+
+def get_view_budget(view_func, method):
+    """The query budget a view declares for a request method, or None."""
+    view_class = getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if not isinstance(budget, dict):
+        return budget
+    actions = getattr(view_func, 'actions', None) or {}
+    method = method.lower()
+    return budget.get(actions.get(method, method))
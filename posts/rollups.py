@@ -0,0 +1,259 @@
+"""
+Incremental maintenance of the pre-aggregated comment analytics tables:
+CommentDailyStats (per day) and CommentActivityStats (per hour, day, week
+and month, over all comments, per post and per author, split by auto-reply
+flag).
+"""
+from collections import Counter, namedtuple
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .models import Comment, CommentActivityStats, CommentDailyStats
+
+RESOLUTIONS = CommentActivityStats.Resolution.values
+ACTIVITY_KEY = ('post_id', 'author_id', 'is_auto_reply')
+# The fields of ACTIVITY_KEY each scope of CommentActivityStats keeps; the others are NULL.
+SCOPES = (('is_auto_reply',), ('post_id', 'is_auto_reply'), ('author_id', 'is_auto_reply'))
+
+Snapshot = namedtuple('Snapshot', 'created_at is_blocked post_id author_id is_auto_reply')
+
+
+def localize(value):
+    return timezone.localtime(value) if timezone.is_aware(value) else value
+
+
+def comment_date(created_at):
+    """The calendar day a comment counts towards, in the current time zone like TruncDate."""
+    return localize(created_at).date()
+
+
+def day_start(date):
+    start = datetime.combine(date, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def bucket_start(value, resolution):
+    """Start of the `resolution` bucket containing `value`, in the current time zone."""
+    value = localize(value)
+    if resolution == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    date = value.date()
+    if resolution == 'week':
+        date -= timedelta(days=date.weekday())
+    elif resolution == 'month':
+        date = date.replace(day=1)
+    return day_start(date)
+
+
+def next_bucket(start, resolution):
+    if resolution == 'hour':
+        # Step in absolute time so DST transitions neither repeat nor skip an hour.
+        return localize(start + timedelta(hours=1))
+    date = localize(start).date()
+    if resolution == 'day':
+        date += timedelta(days=1)
+    elif resolution == 'week':
+        date += timedelta(days=7)
+    else:
+        date = (date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day_start(date)
+
+
+def iter_buckets(start, end, resolution):
+    """Yield the starts of all `resolution` buckets overlapping [start, end)."""
+    bucket = bucket_start(start, resolution)
+    while bucket < end:
+        yield bucket
+        bucket = next_bucket(bucket, resolution)
+
+
+def _increment(model, lookup, total, blocked):
+    """Atomically add `total` and `blocked` (which may be negative) to the counters of one row."""
+    if not total and not blocked:
+        return
+    changes = {
+        'total_comments': F('total_comments') + total,
+        'blocked_comments': F('blocked_comments') + blocked,
+    }
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, total_comments=max(total, 0), blocked_comments=max(blocked, 0))
+    except IntegrityError:
+        # Another writer created the row first, so it can be updated now.
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _increment_all(model, lookups, total, blocked):
+    """Like _increment for several rows at once, in two queries whether or not the rows exist yet."""
+    if not total and not blocked:
+        return
+    if total > 0 or blocked > 0:
+        # Only additions can meet a missing row; removals always follow an earlier addition.
+        model.objects.bulk_create([model(**lookup) for lookup in lookups], ignore_conflicts=True)
+    model.objects.filter(reduce(or_, (Q(**lookup) for lookup in lookups))).update(
+        total_comments=F('total_comments') + total,
+        blocked_comments=F('blocked_comments') + blocked,
+    )
+
+
+def adjust_day(date, total=0, blocked=0):
+    _increment(CommentDailyStats, {'date': date}, total, blocked)
+
+
+def _activity_lookups(snapshot):
+    for resolution in RESOLUTIONS:
+        bucket = bucket_start(snapshot.created_at, resolution)
+        for scope in SCOPES:
+            yield {
+                'resolution': resolution,
+                'bucket': bucket,
+                **{field: getattr(snapshot, field) if field in scope else None for field in ACTIVITY_KEY},
+            }
+
+
+def _apply(snapshot, total, blocked):
+    adjust_day(comment_date(snapshot.created_at), total, blocked)
+    _increment_all(CommentActivityStats, list(_activity_lookups(snapshot)), total, blocked)
+
+
+def snapshot(comment):
+    """What a saved comment is counted under, or None if it is not saved or not fully loaded."""
+    fields = comment.__dict__
+    if comment.pk is None or any(fields.get(name) is None for name in Snapshot._fields):
+        return None
+    return Snapshot(*(fields[name] for name in Snapshot._fields))
+
+
+def saved_snapshot(comment):
+    """
+    What a comment was counted under when it was last loaded or saved, or None
+    if that is unknown (it was built in memory, or loaded without all the
+    counted fields). Only worked out on first use, so loading comments that are
+    never saved or deleted costs nothing.
+    """
+    fields = comment.__dict__
+    if '_rollup_snapshot' not in fields:
+        loaded = dict(zip(*fields.get('_loaded_values', ((), ()))))
+        fields['_rollup_snapshot'] = (
+            None if any(loaded.get(name) is None for name in Snapshot._fields)
+            else Snapshot(*(loaded[name] for name in Snapshot._fields))
+        )
+    return fields['_rollup_snapshot']
+
+
+def record_change(previous, current):
+    """Move a comment's contribution from its `previous` snapshot to its `current` one."""
+    if previous == current:
+        return
+    if previous is not None and current is not None and previous._replace(is_blocked=current.is_blocked) == current:
+        _apply(current, 0, int(current.is_blocked) - int(previous.is_blocked))
+        return
+    if previous is not None:
+        _apply(previous, -1, -int(previous.is_blocked))
+    if current is not None:
+        _apply(current, 1, int(current.is_blocked))
+
+
+def record_comments(comments):
+    """Count comments inserted without post_save (e.g. by bulk_create) with one update per touched row."""
+    totals = Counter()
+    blocked = Counter()
+    for comment in comments:
+        current = snapshot(comment)
+        keys = [('day', comment_date(current.created_at))] + [
+            ('activity', tuple(sorted(lookup.items()))) for lookup in _activity_lookups(current)
+        ]
+        for key in keys:
+            totals[key] += 1
+            blocked[key] += int(current.is_blocked)
+
+    for (table, key), total in totals.items():
+        if table == 'day':
+            adjust_day(key, total, blocked[table, key])
+        else:
+            _increment(CommentActivityStats, dict(key), total, blocked[table, key])
+
+
+def _aggregate(queryset, fields, **annotations):
+    return (
+        queryset.annotate(**annotations)
+        .values(*annotations, *fields)
+        .annotate(total=Count('id'), blocked=Count('id', filter=Q(is_blocked=True)))
+        .order_by()
+    )
+
+
+def _scope_filter(scope):
+    """Lookups selecting the CommentActivityStats rows of one of the SCOPES."""
+    return {f'{field}__isnull': field not in scope for field in ('post_id', 'author_id')}
+
+
+def _activity_rows(resolution, rows):
+    return [
+        CommentActivityStats(
+            resolution=resolution,
+            bucket=row['slot'],
+            post_id=row.get('post_id'),
+            author_id=row.get('author_id'),
+            is_auto_reply=row['is_auto_reply'],
+            total_comments=row['total'],
+            blocked_comments=row['blocked'],
+        )
+        for row in rows
+    ]
+
+
+def rebuild(date_from, date_to, chunk_days=31):
+    """
+    Recompute every rollup of the days in [date_from, date_to] from the
+    Comment table, `chunk_days` days per transaction. The week and month
+    buckets overlapping the range are then recomputed over their whole span
+    from the day buckets, so buckets reaching past the range stay complete.
+    Returns the number of days with comments.
+    """
+    days_written = 0
+    chunk_start = date_from
+    while chunk_start <= date_to:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), date_to)
+        start, end = day_start(chunk_start), day_start(chunk_end + timedelta(days=1))
+        comments = Comment.objects.filter(created_at__gte=start, created_at__lt=end)
+        with transaction.atomic():
+            CommentDailyStats.objects.filter(date__range=[chunk_start, chunk_end]).delete()
+            days_written += len(CommentDailyStats.objects.bulk_create(
+                CommentDailyStats(date=row['date'], total_comments=row['total'], blocked_comments=row['blocked'])
+                for row in _aggregate(comments, (), date=TruncDate('created_at'))
+            ))
+            for resolution in ('hour', 'day'):
+                for scope in SCOPES:
+                    CommentActivityStats.objects.filter(
+                        resolution=resolution, bucket__gte=start, bucket__lt=end, **_scope_filter(scope)
+                    ).delete()
+                    CommentActivityStats.objects.bulk_create(_activity_rows(
+                        resolution, _aggregate(comments, scope, slot=Trunc('created_at', resolution))
+                    ))
+        chunk_start = chunk_end + timedelta(days=1)
+
+    for resolution in ('week', 'month'):
+        start = bucket_start(day_start(date_from), resolution)
+        end = next_bucket(bucket_start(day_start(date_to), resolution), resolution)
+        with transaction.atomic():
+            for scope in SCOPES:
+                buckets = CommentActivityStats.objects.filter(bucket__gte=start, bucket__lt=end, **_scope_filter(scope))
+                buckets.filter(resolution=resolution).delete()
+                CommentActivityStats.objects.bulk_create(_activity_rows(
+                    resolution,
+                    buckets.filter(resolution='day').annotate(slot=Trunc('bucket', resolution))
+                    .values('slot', *scope)
+                    .annotate(total=Sum('total_comments'), blocked=Sum('blocked_comments'))
+                    .order_by(),
+                ))
+    return days_written
@@ -0,0 +1,126 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_auto_reply_scheduler = None
+_lock = threading.Lock()
+
+
+class DelayedJobScheduler:
+    """
+    Runs callables after a delay using one timer thread and a fixed-size worker pool.
+
+    Pending jobs are kept in a heap ordered by due time, so a burst of delayed
+    jobs costs heap entries rather than sleeping OS threads. At most
+    `max_workers` jobs run concurrently and at most `max_pending` wait.
+    """
+
+    def __init__(self, max_workers=4, max_pending=10000):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._condition = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._pid = None
+
+    def schedule(self, delay, func, *args):
+        """Run `func(*args)` in `delay` seconds. Returns False if the queue is full."""
+        with self._condition:
+            if len(self._heap) >= self.max_pending:
+                self.rejected += 1
+                logger.warning(f"Delayed job queue is full, dropping {func.__name__}{args}.")
+                return False
+            self._ensure_started()
+            due_at = time.monotonic() + delay
+            heapq.heappush(self._heap, (due_at, next(self._sequence), func, args))
+            self._condition.notify()
+        return True
+
+    @property
+    def queue_depth(self):
+        with self._condition:
+            return len(self._heap)
+
+    def stats(self):
+        with self._condition:
+            next_due = self._heap[0][0] - time.monotonic() if self._heap else None
+            return {
+                "queue_depth": len(self._heap),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "next_due_in": next_due,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so pre-fork servers need fresh ones per worker.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="delayed-job"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="delayed-job-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                remaining = self._heap[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                _, _, func, args = heapq.heappop(self._heap)
+                self._running += 1
+            self._executor.submit(self._execute, func, args)
+
+    def _execute(self, func, args):
+        close_old_connections()
+        succeeded = False
+        try:
+            func(*args)
+            succeeded = True
+        except Exception:
+            logger.exception(f"Delayed job {func.__name__}{args} failed.")
+        finally:
+            close_old_connections()
+            with self._condition:
+                self._running -= 1
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+
+def get_auto_reply_scheduler():
+    global _auto_reply_scheduler
+    if _auto_reply_scheduler is None:
+        with _lock:
+            if _auto_reply_scheduler is None:
+                _auto_reply_scheduler = DelayedJobScheduler(
+                    max_workers=settings.AUTO_REPLY_WORKERS,
+                    max_pending=settings.AUTO_REPLY_MAX_PENDING,
+                )
+    return _auto_reply_scheduler
@@ -0,0 +1,401 @@
+"""
+Bulk seeding of users, posts and threaded comments, for scale environments
+and benchmarks.
+
+Generated rows are written with chunked executemany() INSERTs and explicit
+primary keys, so foreign keys and thread paths are known up front. No model
+is saved, so no signal fires and no auto-reply is scheduled; the rows the
+signals would derive (UserSettings, thread paths, analytics rollups) are
+written in bulk instead. Fixtures are loaded with bulk_create the same way.
+"""
+import bisect
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from user.models import User, UserSettings
+from . import rollups, threads
+from .models import Comment, CommentActivityStats, Post
+from .rollups import comment_date
+
+WORDS = (
+    "great post thanks for sharing this really helpful idea I think you are right but what about the "
+    "other side of it python django api data model code test fast slow users comments reply question "
+    "answer agree disagree interesting read more later love it nice work example article blog"
+).split()
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the given created_at/updated_at values instead of setting them to now()."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def fast_writes(cache_mb=256):
+    """
+    On SQLite, skip fsync and give the page cache room for the index pages
+    while seeding; the data is reproducible anyway.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Pragmas like synchronous cannot change inside a transaction.
+        yield
+        return
+    pragmas = {'synchronous': 'OFF', 'cache_size': -cache_mb * 1024}
+    with connection.cursor() as cursor:
+        saved = {}
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}')
+            saved[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute(f'PRAGMA {name} = {int(value)}')
+
+
+@contextmanager
+def deferred_indexes(*models):
+    """
+    Drop the Meta.indexes of `models` and create them again afterwards:
+    building an index once over sorted data is much cheaper than updating it
+    row by row. Only worth it when most of the rows are new.
+    """
+    indexes = [(model, index) for model in models for index in model._meta.indexes]
+    if not indexes:
+        yield
+        return
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+
+
+def reset_sequences(*models):
+    """Move the id sequences past explicitly inserted keys (needed on PostgreSQL, a no-op on SQLite)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def insert_rows(model, fields, rows):
+    """
+    INSERT `rows`, tuples of database-ready values for `fields`, with one
+    executemany() call; the other columns get their field default. This skips
+    building model instances and preparing every value per field, which is
+    where bulk_create spends its time at this volume.
+    """
+    opts = model._meta
+    named = [opts.get_field(name) for name in fields]
+    rest = [field for field in opts.concrete_fields if field not in named]
+    defaults = tuple(field.get_db_prep_save(field.get_default(), connection) for field in rest)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in named + rest)
+    placeholders = ', '.join(['%s'] * (len(named) + len(rest)))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) VALUES ({placeholders})',
+            [row + defaults for row in rows],
+        )
+    return len(rows)
+
+
+class Seeder:
+    """
+    Generates `users` users, `posts` posts and `comments` comments spread
+    over the last `days` days. Authors and commented posts follow a heavy
+    tailed (Zipf-like) popularity, and `reply_ratio` of the comments reply to
+    an earlier comment of the same post, preferring recent ones.
+
+    Comments are generated in creation order, so ids, timestamps and thread
+    paths are consistent, and their rollups are counted on the way: a bucket
+    is written as soon as the comments have moved past it.
+    """
+
+    def __init__(self, users, posts, comments, days=365, reply_ratio=0.6, blocked_ratio=0.02,
+                 chunk_size=10000, seed=None, stdout=None):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.days = days
+        self.reply_ratio = reply_ratio
+        self.blocked_ratio = blocked_ratio
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.stdout = stdout
+        self.timings = {}
+        self.sentences = [
+            ' '.join(self.random.choices(WORDS, k=self.random.randint(3, 25))).capitalize() + '.'
+            for _ in range(2000)
+        ]
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def zipf_weights(self, count, exponent=1.1):
+        """Cumulative weights making item i about (i + 1) ** -exponent as likely as the first."""
+        return list(itertools.accumulate((rank + 1) ** -exponent for rank in range(count)))
+
+    def pick(self, cumulative_weights):
+        """Index drawn according to `cumulative_weights`."""
+        return bisect.bisect(cumulative_weights, self.random.random() * cumulative_weights[-1])
+
+    def write(self, label, model, fields, rows):
+        started, written = time.perf_counter(), 0
+        for chunk in _chunks(rows, self.chunk_size):
+            with transaction.atomic():
+                written += insert_rows(model, fields, chunk)
+        self.record(label, written, time.perf_counter() - started)
+
+    def record(self, label, rows, elapsed):
+        self.timings[label] = (rows, elapsed)
+        if rows:
+            self.log(f"{label:<14}{rows:>10} rows in {elapsed:7.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        else:
+            self.log(f"{label:<14}{'':>10}      in {elapsed:7.2f}s")
+
+    def run(self):
+        # Whole hours keep every quarter hour offset aligned with local bucket boundaries.
+        start = (timezone.now() - timedelta(days=self.days)).replace(minute=0, second=0, microsecond=0)
+        span = self.days * 86400
+        adapt = connection.ops.adapt_datetimefield_value
+        password = make_password(None)
+
+        # When most rows will be new, indexes are cheaper to build at the end than to maintain.
+        deferred = (Post, Comment, CommentActivityStats) if (
+            self.comments > Comment.objects.count() and not connection.in_atomic_block
+        ) else ()
+
+        with fast_writes(), deferred_indexes(*deferred):
+            first_user = next_id(User)
+            user_ids = list(range(first_user, first_user + self.users))
+            joined = adapt(start)
+            self.write('users', User, (
+                'id', 'username', 'email', 'password', 'first_name', 'last_name', 'date_joined',
+            ), (
+                (pk, f'seed_user_{pk}', f'seed_user_{pk}@example.com', password, 'Seed', f'User {pk}', joined)
+                for pk in user_ids
+            ))
+            first_settings = next_id(UserSettings)
+            self.write('user settings', UserSettings, ('id', 'user'), (
+                (first_settings + offset, pk) for offset, pk in enumerate(user_ids)
+            ))
+
+            first_post = next_id(Post)
+            post_ids = list(range(first_post, first_post + self.posts))
+            author_weights = self.zipf_weights(len(user_ids))
+            post_times = sorted(self.random.random() * span for _ in post_ids)
+
+            def post_rows():
+                for pk, offset in zip(post_ids, post_times):
+                    created_at = adapt(start + timedelta(seconds=offset))
+                    yield (
+                        pk, self.random.choice(self.sentences)[:255], self.random.choice(self.sentences),
+                        user_ids[self.pick(author_weights)], self.random.random() < self.blocked_ratio,
+                        created_at, created_at,
+                    )
+
+            self.write('posts', Post, (
+                'id', 'title', 'content', 'author', 'is_blocked', 'created_at', 'updated_at',
+            ), post_rows())
+
+            if self.comments:
+                self.write_comments(next_id(Comment), user_ids, post_ids, post_times, start)
+            reset_sequences(User, UserSettings, Post, Comment)
+            started = time.perf_counter()
+        if deferred:
+            self.record('indexes', 0, time.perf_counter() - started)
+        return self.timings
+
+    def write_comments(self, first_id, user_ids, post_ids, post_times, start):
+        counter = RollupCounter(start)
+        comment_time = rollup_time = 0
+        written = rolled_up = 0
+        comments = self.generate_comments(first_id, user_ids, post_ids, post_times, start, counter)
+        fields = (
+            'id', 'post', 'author', 'parent_comment', 'path', 'content', 'is_blocked', 'created_at', 'updated_at',
+        )
+        while True:
+            started = time.perf_counter()
+            chunk = list(itertools.islice(comments, self.chunk_size))
+            if chunk:
+                with transaction.atomic():
+                    written += insert_rows(Comment, fields, chunk)
+            comment_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            if not chunk:
+                counter.close()
+            while len(counter.rows) >= self.chunk_size or counter.rows and not chunk:
+                with transaction.atomic():
+                    rolled_up += insert_rows(CommentActivityStats, counter.fields, counter.rows[:self.chunk_size])
+                del counter.rows[:self.chunk_size]
+            rollup_time += time.perf_counter() - started
+            if not chunk:
+                break
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for date, (total, blocked) in counter.days.items():
+                rollups.adjust_day(date, total, blocked)
+        self.record('comments', written, comment_time)
+        self.record('rollups', rolled_up + len(counter.days), rollup_time + time.perf_counter() - started)
+
+    def generate_comments(self, first_id, user_ids, post_ids, post_times, start, counter):
+        post_weights = self.zipf_weights(len(post_ids), exponent=0.9)
+        author_weights = self.zipf_weights(len(user_ids), exponent=0.7)
+        span = self.days * 86400
+        offsets = sorted(self.random.random() * span for _ in range(self.comments))
+        adapt = connection.ops.adapt_datetimefield_value
+        threads_by_post = {}
+
+        for pk, offset in zip(itertools.count(first_id), offsets):
+            index = self.pick(post_weights)
+            # A comment cannot predate its post; fall back to the newest post that existed.
+            if post_times[index] > offset:
+                index = max(bisect.bisect(post_times, offset) - 1, 0)
+            offset = max(offset, post_times[index])
+            post_id = post_ids[index]
+            author_id = user_ids[self.pick(author_weights)]
+            is_blocked = self.random.random() < self.blocked_ratio
+            earlier = threads_by_post.setdefault(post_id, [])
+            parent = None
+            if earlier and self.random.random() < self.reply_ratio:
+                # Recent comments attract most replies.
+                parent = earlier[max(len(earlier) - 1 - int(self.random.expovariate(0.2)), 0)]
+            path = (parent[1] if parent else '') + threads.encode_segment(pk)
+            earlier.append((pk, path))
+            counter.add(offset, post_id, author_id, is_blocked)
+            created_at = adapt(start + timedelta(seconds=offset))
+            yield (
+                pk, post_id, author_id, parent[0] if parent else None, path,
+                self.random.choice(self.sentences), is_blocked, created_at, created_at,
+            )
+
+
+class RollupCounter:
+    """
+    Counts comments into the rollup tables while they are generated in
+    creation order. Offsets are seconds after `start`, a whole UTC hour, so
+    every bucket boundary of any time zone falls on a quarter hour offset.
+    """
+    fields = ('resolution', 'bucket', 'post', 'author', 'is_auto_reply', 'total_comments', 'blocked_comments')
+
+    def __init__(self, start):
+        self.start = start
+        self.days = {}
+        self.rows = []
+        self.quarters = {}
+        self.current = {resolution: None for resolution in rollups.RESOLUTIONS}
+        self.counts = {resolution: {} for resolution in rollups.RESOLUTIONS}
+
+    def buckets(self, offset):
+        quarter = int(offset // 900)
+        if quarter not in self.quarters:
+            moment = self.start + timedelta(seconds=quarter * 900)
+            self.quarters[quarter] = (
+                comment_date(moment),
+                {resolution: rollups.bucket_start(moment, resolution) for resolution in rollups.RESOLUTIONS},
+            )
+        return self.quarters[quarter]
+
+    def add(self, offset, post_id, author_id, is_blocked):
+        date, buckets = self.buckets(offset)
+        day = self.days.setdefault(date, [0, 0])
+        day[0] += 1
+        day[1] += is_blocked
+        for resolution, bucket in buckets.items():
+            if bucket != self.current[resolution]:
+                self.flush(resolution)
+                self.current[resolution] = bucket
+            # Counted over all comments, per post and per author, like rollups.SCOPES.
+            for key in ((None, None), (post_id, None), (None, author_id)):
+                counts = self.counts[resolution].setdefault(key, [0, 0])
+                counts[0] += 1
+                counts[1] += is_blocked
+
+    def flush(self, resolution):
+        bucket = connection.ops.adapt_datetimefield_value(self.current[resolution])
+        self.rows.extend(
+            (resolution, bucket, post_id, author_id, False, total, blocked)
+            for (post_id, author_id), (total, blocked) in self.counts[resolution].items()
+        )
+        self.counts[resolution].clear()
+
+    def close(self):
+        for resolution in rollups.RESOLUTIONS:
+            self.flush(resolution)
+
+
+def load_fixture(path, chunk_size=10000):
+    """
+    Load a dumpdata/loaddata JSON fixture with bulk_create instead of one save()
+    per object. Rows whose primary key already exists are left alone, so the
+    fixture can be loaded at every start. Returns {model label: objects read}.
+    """
+    with open(path, encoding='utf-8') as fixture:
+        objects = [deserialized.object for deserialized in serializers.deserialize('json', fixture)]
+
+    by_model = {}
+    for obj in objects:
+        by_model.setdefault(type(obj), []).append(obj)
+
+    with fast_writes(), explicit_timestamps(*by_model):
+        with transaction.atomic():
+            for model in (User, UserSettings, Post, Comment):
+                if by_model.get(model):
+                    model.objects.bulk_create(by_model[model], batch_size=chunk_size, ignore_conflicts=True)
+            for model, rows in by_model.items():
+                if model not in (User, UserSettings, Post, Comment):
+                    model.objects.bulk_create(rows, batch_size=chunk_size, ignore_conflicts=True)
+
+            users = [user.pk for user in by_model.get(User, ())]
+            UserSettings.objects.bulk_create(
+                [UserSettings(user_id=pk) for pk in users], batch_size=chunk_size, ignore_conflicts=True
+            )
+            comments = by_model.get(Comment, [])
+            threads.assign_paths(comments)
+        reset_sequences(*by_model, UserSettings)
+
+    if comments:
+        dates = [comment_date(comment.created_at) for comment in comments]
+        rollups.rebuild(min(dates), max(dates))
+    return {model._meta.label: len(rows) for model, rows in by_model.items()}
@@ -1,9 +1,11 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Post, Comment
-from .validators import validate_profanity
+from .timing import TimedSerializerMixin
+from .validators import validate_profanity_fields
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     title = serializers.CharField()
     content = serializers.CharField()
 
@@ -21,14 +23,12 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ("author", "is_blocked", "created_at", "updated_at")
 
     def validate(self, data):
-        if validate_profanity(data.get('title', '')) or validate_profanity(data.get('content', '')):
-            data['is_blocked'] = True
-        else:
-            data['is_blocked'] = False
+        verdicts = validate_profanity_fields(data, ('title', 'content'))
+        data['is_blocked'] = any(verdicts.values())
         return data
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Post
         fields = (
@@ -39,7 +39,7 @@ class PostListSerializer(serializers.ModelSerializer):
         )
 
 
-class PostDetailSerializer(serializers.ModelSerializer):
+class PostDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = serializers.CharField(read_only=True, source="author.username")
 
     class Meta:
@@ -55,7 +55,7 @@ class PostDetailSerializer(serializers.ModelSerializer):
         )
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     content = serializers.CharField()
 
     class Meta:
@@ -73,8 +73,24 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ("author", "is_blocked", "parent_comment")
 
     def validate(self, data):
-        if validate_profanity(data.get('content', '')):
-            data['is_blocked'] = True
-        else:
-            data['is_blocked'] = False
+        verdicts = validate_profanity_fields(data, ('content',))
+        data['is_blocked'] = any(verdicts.values())
         return data
+
+
+class BulkCommentItemSerializer(serializers.Serializer):
+    """One item of a bulk comment request; posts and parents are resolved for all items at once."""
+    post = serializers.IntegerField(min_value=1)
+    content = serializers.CharField()
+    parent_comment = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+
+class BulkCommentSerializer(TimedSerializerMixin, serializers.Serializer):
+    comments = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_comments(self, comments):
+        max_items = settings.BULK_COMMENTS_MAX_ITEMS
+        if len(comments) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} comments can be created per request.")
+        return comments
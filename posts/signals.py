@@ -1,15 +1,48 @@
-import threading
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+
+from user.cache import get_user_settings
+from . import rollups, threads
+from .jobs import enqueue_auto_reply, get_reply_coalescer
 from .models import Comment
-from .tasks import auto_reply_to_comment
+
+
+@receiver(post_save, sender=Comment)
+def comment_assign_path(sender, instance, created, **kwargs):
+    if created:
+        threads.assign_paths([instance])
 
 
 @receiver(post_save, sender=Comment)
 def comment_post_save(sender, instance, created, **kwargs):
     if created and not instance.is_auto_reply:
-        user_settings = instance.post.author.settings
-        if user_settings.auto_reply_enabled:
+        user_settings = get_user_settings(instance.post.author_id)
+        if user_settings and user_settings.auto_reply_enabled:
             delay = user_settings.auto_reply_delay
-            timer = threading.Timer(delay, auto_reply_to_comment, args=(instance.id,))
-            timer.start()
+            if settings.AUTO_REPLY_QUEUE == 'database':
+                # Written in the caller's transaction, if any (the API views open one around the comment
+                # INSERT), so the job is as durable as the comment. Under autocommit it is a separate write.
+                enqueue_auto_reply(instance, delay)
+            else:
+                # Schedule only once the comment row is committed, so the job never runs before it exists.
+                transaction.on_commit(partial(get_reply_coalescer().add, [instance.id], delay))
+
+
+@receiver(post_save, sender=Comment)
+def comment_update_rollups(sender, instance, created, **kwargs):
+    current = rollups.snapshot(instance)
+    previous = None if created else rollups.saved_snapshot(instance)
+    # An update of an instance that was not loaded with its counted fields cannot be
+    # attributed; `manage.py rebuild_comment_rollups` repairs such drift, like QuerySet.update().
+    if created or previous is not None:
+        rollups.record_change(previous, current)
+    instance._rollup_snapshot = current
+
+
+@receiver(post_delete, sender=Comment)
+def comment_delete_rollups(sender, instance, **kwargs):
+    rollups.record_change(rollups.saved_snapshot(instance), None)
@@ -1,43 +1,229 @@
+import hashlib
+import json
 import logging
 import os
-import google.generativeai as genai
+import threading
+
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
+from user.cache import get_user_settings
 from user.models import User
+from . import providers, rollups, threads, timing
+from .llm import AsyncLLMRunner, ReplyCache, wait_for_replies
 from .models import Comment
+from .moderation import normalize_text
 from dotenv import load_dotenv
 
 load_dotenv()
-genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-model = genai.GenerativeModel(os.environ["GENERATIVE_MODEL"])
 
 logger = logging.getLogger(__name__)
 
+_llm_runner = None
+_reply_cache = None
+_llm_runner_lock = threading.Lock()
+
+
+def get_reply_cache():
+    """Return the shared reply cache, or None when LLM_REPLY_CACHE_SIZE is 0."""
+    global _reply_cache
+    if settings.LLM_REPLY_CACHE_SIZE <= 0:
+        return None
+    if _reply_cache is None:
+        with _llm_runner_lock:
+            if _reply_cache is None:
+                _reply_cache = ReplyCache(
+                    max_size=settings.LLM_REPLY_CACHE_SIZE,
+                    ttl=settings.LLM_REPLY_CACHE_TTL or None,
+                    variants=settings.LLM_REPLY_CACHE_VARIANTS,
+                )
+    return _reply_cache
+
+
+def get_llm_runner():
+    global _llm_runner
+    if _llm_runner is None:
+        with _llm_runner_lock:
+            if _llm_runner is None:
+                _llm_runner = AsyncLLMRunner(
+                    providers.get('llm_client'),
+                    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                    timeout=settings.LLM_TIMEOUT,
+                    cache=get_reply_cache(),
+                )
+    return _llm_runner
+
+
+def build_prompt(comment_text):
+    return f"{os.environ['PROMPT']}: {comment_text}"
+
+
+def build_batch_prompt(comments):
+    items = "\n".join(f"{comment.id}: {' '.join(comment.content.split())}" for comment in comments)
+    return (
+        f"{os.environ['PROMPT']}\n"
+        "You will receive several comments, one per line, each prefixed with its id. "
+        "Reply to each comment separately. Answer only with a JSON object mapping every "
+        'comment id to its reply, for example {"1": "First reply", "2": "Second reply"}.\n'
+        f"{items}"
+    )
+
+
+def parse_batch_response(text, comments):
+    """Return {comment_id: reply} from a batched response, or raise ValueError."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("Batched response is not a JSON object.")
+
+    replies = {}
+    for comment in comments:
+        reply = data.get(str(comment.id))
+        if not isinstance(reply, str) or not reply.strip():
+            raise ValueError(f"Batched response has no reply for comment {comment.id}.")
+        replies[comment.id] = reply
+    return replies
+
+
+def reply_cache_key(comment_text, model_name):
+    payload = f"{model_name}\0{os.environ['PROMPT']}\0{normalize_text(comment_text)}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
 
 def get_ai_response(comment_text):
-    response = model.generate_content(f"{os.environ['PROMPT']}: {comment_text}")
-    return response.text
+    runner = get_llm_runner()
+    with timing.timed('llm'):
+        return runner.generate(
+            build_prompt(comment_text), reply_cache_key(comment_text, runner.client.model_name)
+        )
 
 
-def auto_reply_to_comment(comment_id):
+def _get_reply_target(comment_id):
+    """Return the comment if it should be auto-replied to, otherwise None."""
     try:
-        comment = Comment.objects.get(id=comment_id)
-        post = comment.post
-        user_settings = post.author.settings
-
-        if user_settings.auto_reply_enabled and not comment.is_blocked:
-            ai_reply = get_ai_response(comment.content)
-
-            if ai_reply:
-                reply_content = ai_reply.strip()
-                reply_author = User.objects.get(id=os.environ["AI_USER_ID"])
-                Comment.objects.create(
-                    post=post,
-                    author=reply_author,
-                    content=reply_content,
-                    parent_comment=comment,
-                    created_at=timezone.now(),
-                    is_auto_reply=True
-                )
+        comment = Comment.objects.select_related('post').get(id=comment_id)
     except Comment.DoesNotExist:
         logger.error(f"Comment with ID {comment_id} is not found.")
+        return None
+
+    user_settings = get_user_settings(comment.post.author_id)
+    if user_settings and user_settings.auto_reply_enabled and not comment.is_blocked:
+        return comment
+    return None
+
+
+def _save_replies(replies):
+    """Create the auto-reply comments for (comment, ai_reply) pairs with a single INSERT."""
+    replies = [(comment, ai_reply.strip()) for comment, ai_reply in replies if ai_reply and ai_reply.strip()]
+    if not replies:
+        return []
+    reply_author = User.objects.get(id=os.environ["AI_USER_ID"])
+    with transaction.atomic():
+        created = Comment.objects.bulk_create([
+            Comment(
+                post=comment.post,
+                author=reply_author,
+                content=reply_content,
+                parent_comment=comment,
+                created_at=timezone.now(),
+                is_auto_reply=True
+            )
+            for comment, reply_content in replies
+        ])
+        threads.assign_paths(created)
+        rollups.record_comments(created)
+    return created
+
+
+def _group_by_post(comments, batch_size):
+    groups = {}
+    for comment in comments:
+        groups.setdefault(comment.post_id, []).append(comment)
+    return [
+        group[start:start + batch_size]
+        for group in groups.values()
+        for start in range(0, len(group), batch_size)
+    ]
+
+
+def auto_reply_to_comment(comment_id):
+    with timing.task('auto_reply_to_comment'):
+        comment = _get_reply_target(comment_id)
+        if comment is not None:
+            _save_replies([(comment, get_ai_response(comment.content))])
+
+
+def auto_reply_to_comments(comment_ids):
+    """
+    Reply to many comments, running all LLM requests concurrently.
+
+    Comments on the same post are coalesced into one multi-item request of at
+    most AUTO_REPLY_BATCH_SIZE comments. If a batched response cannot be
+    parsed, its comments are retried with one request each. All replies are
+    inserted with one bulk_create. Returns a {comment_id: exception or None} mapping.
+    """
+    with timing.task('auto_reply_to_comments'):
+        return _auto_reply_to_comments(comment_ids)
+
+
+def _auto_reply_to_comments(comment_ids):
+    errors = dict.fromkeys(comment_ids)
+    replies = {}
+
+    def collect(comment, response):
+        if isinstance(response, Exception):
+            errors[comment.id] = response
+        else:
+            replies[comment.id] = response
+
+    targets = [
+        comment for comment in map(_get_reply_target, comment_ids) if comment is not None
+    ]
+    batches = _group_by_post(targets, settings.AUTO_REPLY_BATCH_SIZE)
+    multi = [batch for batch in batches if len(batch) > 1]
+    single = [batch[0] for batch in batches if len(batch) == 1]
+
+    runner = get_llm_runner()
+
+    def submit_single(comment):
+        return runner.submit(
+            build_prompt(comment.content), reply_cache_key(comment.content, runner.client.model_name)
+        )
+
+    # Batched and single prompts are all put in flight before waiting on any of them.
+    batch_futures = [runner.submit(build_batch_prompt(batch)) for batch in multi]
+    single_futures = [submit_single(comment) for comment in single]
+
+    with timing.timed('llm'):
+        batch_responses = wait_for_replies(batch_futures)
+        single_responses = wait_for_replies(single_futures)
+
+    fallback = []
+    for batch, response in zip(multi, batch_responses):
+        if isinstance(response, Exception):
+            errors.update(dict.fromkeys((comment.id for comment in batch), response))
+            continue
+        try:
+            replies.update(parse_batch_response(response, batch))
+        except ValueError as exc:
+            logger.warning(f"Falling back to single replies for post {batch[0].post_id}: {exc}")
+            fallback.extend(batch)
+    for comment, response in zip(single, single_responses):
+        collect(comment, response)
+
+    if fallback:
+        fallback_futures = [submit_single(comment) for comment in fallback]
+        with timing.timed('llm'):
+            fallback_responses = wait_for_replies(fallback_futures)
+        for comment, response in zip(fallback, fallback_responses):
+            collect(comment, response)
+
+    answered = [comment for comment in targets if comment.id in replies]
+    try:
+        _save_replies([(comment, replies[comment.id]) for comment in answered])
+    except Exception as exc:
+        errors.update(dict.fromkeys((comment.id for comment in answered), exc))
+    return errors
@@ -1,5 +1,22 @@
+import cProfile
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from concurrent.futures.process import BrokenProcessPool
 from unittest.mock import patch
 
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
@@ -7,9 +24,24 @@ from datetime import datetime
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from posts.models import Comment, Post
+from posts.jobs import ReplyCoalescer, claim_due_jobs, release_stale_jobs, run_jobs
+from posts.llm import AsyncLLMRunner, FakeLLMClient, LLMClient, ReplyCache
+from posts import providers, rollups, threads, timing
+from posts.querybudget import QueryBudgetExceeded, query_budget
+from posts.models import AutoReplyJob, Comment, CommentActivityStats, CommentDailyStats, Post
+from posts.scheduler import DelayedJobScheduler
+from posts.tasks import auto_reply_to_comment, auto_reply_to_comments
+from posts.validators import moderate
+from posts.views import PostViewSet
+from posts.moderation import (
+    KeywordAutomaton,
+    LexicalPreFilter,
+    ModerationDispatcher,
+    ProcessPoolModerationBackend,
+    VerdictCache
+)
 
-from user.models import User
+from user.models import User, UserSettings
 
 
 class CommentsDailyBreakdownTest(APITestCase):
@@ -153,3 +185,1321 @@ class CreatePostTest(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(post.is_blocked)
+
+
+class ProfanityBatchTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = RefreshToken.for_user(self.user).access_token
+
+    def test_classify_profanity_batch(self):
+        from posts.validators import classify_profanity
+
+        verdicts = classify_profanity(['This is fine.', 'This content has a bad word: SHIT!'])
+        self.assertEqual(verdicts, [False, True])
+        self.assertEqual(classify_profanity([]), [])
+
+    @override_settings(PROFANITY_CACHE_SIZE=0, PROFANITY_PREFILTER_ENABLED=False)
+    def test_create_post_classifies_fields_in_one_call(self):
+        url = reverse('posts:post-list')
+        data = {'title': 'Valid Title', 'content': 'This content has a bad word: SHIT!'}
+        with patch('posts.validators.predict', return_value=[0, 1]) as mock_predict:
+            response = self.client.post(url, data, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_predict.assert_called_once_with(['Valid Title', 'This content has a bad word: SHIT!'])
+        self.assertTrue(Post.objects.get().is_blocked)
+
+
+class ModerationDispatcherTest(SimpleTestCase):
+
+    def test_concurrent_submissions_share_one_batch(self):
+        calls = []
+
+        def classify(texts):
+            calls.append(list(texts))
+            return [text == 'bad' for text in texts]
+
+        dispatcher = ModerationDispatcher(classify, window=0.2, max_batch_size=10)
+        results = {}
+
+        def worker(text):
+            results[text] = dispatcher.classify([text])[0]
+
+        threads = [threading.Thread(target=worker, args=(text,)) for text in ('good', 'bad', 'fine')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {'good': False, 'bad': True, 'fine': False})
+        self.assertEqual(len(calls), 1)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['batch_size']['count'], 1)
+        self.assertEqual(stats['wait_time']['count'], 3)
+
+    def test_flushes_when_batch_is_full(self):
+        dispatcher = ModerationDispatcher(lambda texts: [False] * len(texts), window=10, max_batch_size=2)
+        self.assertEqual(dispatcher.classify(['a', 'b']), [False, False])
+
+    def test_classifier_errors_propagate_to_callers(self):
+        def classify(texts):
+            raise RuntimeError('model unavailable')
+
+        dispatcher = ModerationDispatcher(classify, window=0)
+        with self.assertRaises(RuntimeError):
+            dispatcher.classify(['text'])
+
+
+class VerdictCacheTest(SimpleTestCase):
+
+    def test_hits_on_normalized_text(self):
+        cache = VerdictCache(max_size=10)
+        cache.set_many([('Great post!', False)], 'v1')
+
+        self.assertEqual(cache.get_many(['  great   POST! ', 'other'], 'v1'), [False, None])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = VerdictCache(max_size=2)
+        cache.set_many([('a', False), ('b', True)], 'v1')
+        cache.get_many(['a'], 'v1')
+        cache.set_many([('c', False)], 'v1')
+
+        self.assertEqual(cache.get_many(['a', 'b', 'c'], 'v1'), [False, None, False])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entries_are_misses(self):
+        cache = VerdictCache(max_size=10, ttl=60)
+        cache.set_many([('a', True)], 'v1')
+        with patch('posts.moderation.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(cache.get_many(['a'], 'v1'), [None])
+
+    def test_model_version_change_invalidates(self):
+        cache = VerdictCache(max_size=10)
+        cache.set_many([('a', True)], 'v1')
+
+        self.assertEqual(cache.get_many(['a'], 'v2'), [None])
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_repeated_text_skips_inference(self):
+        from posts.validators import validate_profanity
+
+        with override_settings(PROFANITY_MODEL_VERSION='cache-test'), \
+                patch('posts.validators.predict', return_value=[1]) as mock_predict:
+            self.assertTrue(validate_profanity('Some repeated spam'))
+            self.assertTrue(validate_profanity('some repeated SPAM'))
+        mock_predict.assert_called_once()
+
+
+class LexicalPreFilterTest(SimpleTestCase):
+
+    def test_automaton_matches_whole_words_only(self):
+        automaton = KeywordAutomaton(['ass', 'shit', 'son of a bitch'])
+
+        self.assertTrue(automaton.contains_word('what a shit!'))
+        self.assertTrue(automaton.contains_word('you son of a bitch'))
+        self.assertFalse(automaton.contains_word('a classic assessment'))
+        self.assertEqual(list(automaton.iter_matches('shits')), [(0, 4)])
+
+    def test_decides_obvious_texts(self):
+        prefilter = LexicalPreFilter(['shit'], ['great post!'], fast_path_max_length=3)
+
+        self.assertEqual(prefilter.decide('This content has a bad word: SHIT!').stage, 'lexicon')
+        self.assertTrue(prefilter.decide('SHIT'))
+        self.assertEqual(prefilter.decide('Great   post!').stage, 'allowlist')
+        self.assertEqual(prefilter.decide('ok').stage, 'fast_path')
+        self.assertIsNone(prefilter.decide('Something the model has to look at'))
+
+    def test_validate_profanity_reports_stage(self):
+        from posts.validators import validate_profanity
+
+        with patch('posts.validators.predict') as mock_predict:
+            verdict = validate_profanity('This content has a bad word: SHIT!')
+        self.assertTrue(verdict)
+        self.assertEqual(verdict.stage, 'lexicon')
+        mock_predict.assert_not_called()
+
+        with override_settings(PROFANITY_CACHE_SIZE=0):
+            verdict = validate_profanity('A perfectly ordinary sentence about gardening.')
+        self.assertFalse(verdict)
+        self.assertEqual(verdict.stage, 'model')
+
+    def test_short_profanity_reaches_the_model(self):
+        from posts.validators import reset_moderation_pipeline, validate_profanity
+
+        reset_moderation_pipeline()
+        self.addCleanup(reset_moderation_pipeline)
+        for word in ('ass', 'fag', 'cum', 'fuk', 'tit', 'wtf'):
+            verdict = validate_profanity(word)
+            self.assertTrue(verdict, word)
+            self.assertNotEqual(verdict.stage, 'fast_path')
+
+
+class ProcessPoolModerationBackendTest(SimpleTestCase):
+
+    def test_classifies_in_worker_processes(self):
+        backend = ProcessPoolModerationBackend(lambda texts: [], max_workers=1, timeout=30)
+        try:
+            self.assertEqual(backend.classify(['Lovely weather today.', 'What a SHIT post']), [False, True])
+            self.assertEqual(backend.fallbacks, 0)
+        finally:
+            backend.shutdown()
+
+    def test_falls_back_to_in_process_inference(self):
+        backend = ProcessPoolModerationBackend(lambda texts: [True] * len(texts), max_workers=1)
+        with patch.object(backend, 'submit', side_effect=BrokenProcessPool), \
+                self.assertLogs('posts.moderation', level='WARNING'):
+            self.assertEqual(backend.classify(['text']), [True])
+        self.assertEqual(backend.stats()['fallbacks'], 1)
+
+
+class DelayedJobSchedulerTest(SimpleTestCase):
+
+    def test_runs_jobs_in_due_order(self):
+        done = threading.Event()
+        order = []
+
+        def job(name):
+            order.append(name)
+            if len(order) == 3:
+                done.set()
+
+        scheduler = DelayedJobScheduler(max_workers=1)
+        scheduler.schedule(0.2, job, 'late')
+        scheduler.schedule(0, job, 'now')
+        scheduler.schedule(0.1, job, 'soon')
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(order, ['now', 'soon', 'late'])
+        self.assertEqual(scheduler.queue_depth, 0)
+
+    def test_rejects_jobs_over_capacity(self):
+        scheduler = DelayedJobScheduler(max_workers=1, max_pending=1)
+        with self.assertLogs('posts.scheduler', level='WARNING'):
+            self.assertTrue(scheduler.schedule(60, print))
+            self.assertFalse(scheduler.schedule(60, print))
+        self.assertEqual(scheduler.stats()['queue_depth'], 1)
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+
+
+class AutoReplySchedulingTest(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='password')
+        self.author.settings.auto_reply_enabled = True
+        self.author.settings.auto_reply_delay = 30
+        self.author.settings.save()
+        self.post = Post.objects.create(title='title', content='content', author=self.author)
+
+    def test_schedules_auto_reply_after_commit(self):
+        with patch('posts.jobs.get_auto_reply_scheduler') as mock_get_scheduler, \
+                patch('posts.jobs._reply_coalescer', ReplyCoalescer()):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                comment = Comment.objects.create(post=self.post, author=self.author, content='Nice')
+            mock_get_scheduler.return_value.schedule.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+
+        mock_get_scheduler.return_value.schedule.assert_called_once()
+        delay, flush, batch = mock_get_scheduler.return_value.schedule.call_args.args
+        self.assertEqual((delay, batch['comment_ids']), (30, [comment.id]))
+
+    def test_replies_falling_due_together_share_one_job(self):
+        coalescer = ReplyCoalescer()
+        with patch('posts.jobs.get_auto_reply_scheduler') as mock_get_scheduler, \
+                patch('posts.jobs._reply_coalescer', coalescer), \
+                self.captureOnCommitCallbacks(execute=True):
+            comments = [
+                Comment.objects.create(post=self.post, author=self.author, content=f'Comment {index}')
+                for index in range(3)
+            ]
+        mock_get_scheduler.return_value.schedule.assert_called_once()
+        _, flush, batch = mock_get_scheduler.return_value.schedule.call_args.args
+
+        client = BatchAwareLLMClient()
+        with patch('posts.tasks.get_llm_runner', return_value=AsyncLLMRunner(client)), \
+                patch.dict(os.environ, {'AI_USER_ID': str(self.author.id), 'PROMPT': 'Reply'}), \
+                override_settings(AUTO_REPLY_BATCH_SIZE=10):
+            flush(batch)
+        # One prompt for the three comments on the post.
+        self.assertEqual(len(client.prompts), 1)
+        self.assertEqual(
+            set(Comment.objects.filter(is_auto_reply=True).values_list('parent_comment', flat=True)),
+            {comment.id for comment in comments},
+        )
+        # The batch is closed, so later comments start a new one.
+        with patch('posts.jobs.get_auto_reply_scheduler') as mock_get_scheduler:
+            coalescer.add([comments[0].id], 30)
+        mock_get_scheduler.return_value.schedule.assert_called_once()
+
+
+@override_settings(AUTO_REPLY_QUEUE='database', AUTO_REPLY_MAX_ATTEMPTS=2, AUTO_REPLY_RETRY_BACKOFF=10)
+class AutoReplyJobQueueTest(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='password')
+        self.author.settings.auto_reply_enabled = True
+        self.author.settings.auto_reply_delay = 30
+        self.author.settings.save()
+        self.post = Post.objects.create(title='title', content='content', author=self.author)
+        self.comment = Comment.objects.create(post=self.post, author=self.author, content='Nice')
+
+    def test_comment_creates_pending_job(self):
+        job = AutoReplyJob.objects.get(comment=self.comment)
+        self.assertEqual(job.state, AutoReplyJob.State.PENDING)
+        self.assertAlmostEqual(
+            (job.due_at - timezone.now()).total_seconds(), 30, delta=5
+        )
+
+    def test_jobs_are_claimed_once_when_due(self):
+        self.assertEqual(claim_due_jobs('worker-1', 10), [])
+
+        later = timezone.now() + timedelta(minutes=1)
+        jobs = claim_due_jobs('worker-1', 10, now=later)
+        self.assertEqual([job.comment_id for job in jobs], [self.comment.id])
+        self.assertEqual(jobs[0].state, AutoReplyJob.State.RUNNING)
+        self.assertEqual(jobs[0].attempts, 1)
+        self.assertEqual(claim_due_jobs('worker-2', 10, now=later), [])
+
+    def test_failed_jobs_back_off_then_fail(self):
+        later = timezone.now() + timedelta(minutes=1)
+        runner = AsyncLLMRunner(FailingLLMClient())
+        with patch('posts.tasks.get_llm_runner', return_value=runner), \
+                patch.dict(os.environ, {'AI_USER_ID': str(self.author.id), 'PROMPT': 'Reply'}), \
+                self.assertLogs('posts.jobs', level='WARNING'):
+            jobs = claim_due_jobs('worker-1', 10, now=later)
+            self.assertEqual(run_jobs(jobs), 0)
+            job = AutoReplyJob.objects.get()
+            self.assertEqual(job.state, AutoReplyJob.State.PENDING)
+            self.assertGreater(job.due_at, timezone.now() + timedelta(seconds=5))
+
+            jobs = claim_due_jobs('worker-1', 10, now=later + timedelta(minutes=1))
+            self.assertEqual(run_jobs(jobs), 0)
+            job = AutoReplyJob.objects.get()
+            self.assertEqual(job.state, AutoReplyJob.State.FAILED)
+            self.assertIn('LLM down', job.last_error)
+        self.assertFalse(Comment.objects.filter(is_auto_reply=True).exists())
+
+    def test_worker_survives_batch_errors(self):
+        AutoReplyJob.objects.update(due_at=timezone.now())
+        out = StringIO()
+        with patch('posts.jobs.auto_reply_to_comments', side_effect=KeyError('PROMPT')), \
+                self.assertLogs('posts.jobs', level='WARNING'):
+            call_command('run_autoreply_worker', '--once', '--poll-interval=0', stdout=out)
+        self.assertIn('Processed 1 job(s), 1 failed.', out.getvalue())
+        job = AutoReplyJob.objects.get()
+        self.assertEqual(job.state, AutoReplyJob.State.PENDING)
+        self.assertGreater(job.due_at, timezone.now() + timedelta(seconds=5))
+        self.assertIn('PROMPT', job.last_error)
+
+    def test_stale_jobs_fail_after_max_attempts(self):
+        later = timezone.now() + timedelta(minutes=1)
+        claim_due_jobs('worker-1', 10, now=later)
+        self.assertEqual(release_stale_jobs(60, now=later + timedelta(minutes=2)), 1)
+        self.assertEqual(AutoReplyJob.objects.get().state, AutoReplyJob.State.PENDING)
+
+        claim_due_jobs('worker-1', 10, now=later + timedelta(minutes=3))
+        with self.assertLogs('posts.jobs', level='ERROR'):
+            self.assertEqual(release_stale_jobs(60, now=later + timedelta(minutes=5)), 0)
+        job = AutoReplyJob.objects.get()
+        self.assertEqual((job.state, job.attempts), (AutoReplyJob.State.FAILED, 2))
+
+    def test_worker_command_processes_due_jobs(self):
+        AutoReplyJob.objects.update(due_at=timezone.now())
+        out = StringIO()
+        runner = AsyncLLMRunner(FakeLLMClient(latency=0, reply=' Thanks! '))
+        with patch('posts.tasks.get_llm_runner', return_value=runner), \
+                patch.dict(os.environ, {'AI_USER_ID': str(self.author.id), 'PROMPT': 'Reply'}):
+            call_command('run_autoreply_worker', '--once', '--poll-interval=0', stdout=out)
+
+        self.assertEqual(AutoReplyJob.objects.get().state, AutoReplyJob.State.DONE)
+        reply = Comment.objects.get(is_auto_reply=True)
+        self.assertEqual(reply.parent_comment, self.comment)
+        self.assertEqual(reply.content, 'Thanks!')
+
+        call_command('run_autoreply_worker', '--status', stdout=out)
+        self.assertIn('done      1', out.getvalue())
+
+
+class AsyncLLMRunnerTest(SimpleTestCase):
+
+    def test_runs_requests_concurrently(self):
+        client = FakeLLMClient(latency=0.2)
+        runner = AsyncLLMRunner(client, max_concurrency=500)
+
+        started = time.monotonic()
+        results = runner.generate_many([f'prompt {index}' for index in range(300)])
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(results), 300)
+        self.assertEqual(client.calls, 300)
+
+    def test_concurrency_is_capped(self):
+        runner = AsyncLLMRunner(FakeLLMClient(latency=0.1), max_concurrency=2)
+
+        started = time.monotonic()
+        runner.generate_many(['a', 'b', 'c', 'd'])
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_slow_requests_time_out(self):
+        runner = AsyncLLMRunner(FakeLLMClient(latency=5), timeout=0.05)
+
+        results = runner.generate_many(['prompt'])
+        self.assertIsInstance(results[0], TimeoutError)
+
+
+class FailingLLMClient(LLMClient):
+
+    async def generate(self, prompt):
+        raise RuntimeError('LLM down')
+
+
+class BatchAwareLLMClient(LLMClient):
+    """Answers batched prompts with a JSON object, or with `batch_reply` when it is set."""
+
+    def __init__(self, batch_reply=None):
+        self.batch_reply = batch_reply
+        self.prompts = []
+
+    async def generate(self, prompt):
+        self.prompts.append(prompt)
+        ids = re.findall(r'^(\d+): ', prompt, flags=re.MULTILINE)
+        if not ids:
+            return 'Single reply'
+        return self.batch_reply or json.dumps({comment_id: f'Reply to {comment_id}' for comment_id in ids})
+
+
+@override_settings(AUTO_REPLY_BATCH_SIZE=2)
+class AutoReplyCoalescingTest(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='password')
+        self.author.settings.auto_reply_enabled = True
+        self.author.settings.save()
+        self.post = Post.objects.create(title='title', content='content', author=self.author)
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.author, content=f'Comment {index}')
+            for index in range(3)
+        ]
+
+    def reply_with(self, client):
+        runner = AsyncLLMRunner(client)
+        with patch('posts.tasks.get_llm_runner', return_value=runner), \
+                patch.dict(os.environ, {'AI_USER_ID': str(self.author.id), 'PROMPT': 'Reply'}):
+            return auto_reply_to_comments([comment.id for comment in self.comments])
+
+    def test_comments_on_one_post_share_a_request(self):
+        client = BatchAwareLLMClient()
+        errors = self.reply_with(client)
+
+        self.assertEqual(set(errors.values()), {None})
+        self.assertEqual(len(client.prompts), 2)
+        replies = {
+            reply.parent_comment_id: reply.content
+            for reply in Comment.objects.filter(is_auto_reply=True)
+        }
+        self.assertEqual(replies, {
+            self.comments[0].id: f'Reply to {self.comments[0].id}',
+            self.comments[1].id: f'Reply to {self.comments[1].id}',
+            self.comments[2].id: 'Single reply',
+        })
+
+    def test_unparseable_batch_falls_back_to_single_requests(self):
+        client = BatchAwareLLMClient(batch_reply='Sorry, I cannot do JSON.')
+        with self.assertLogs('posts.tasks', level='WARNING'):
+            errors = self.reply_with(client)
+
+        self.assertEqual(set(errors.values()), {None})
+        self.assertEqual(len(client.prompts), 4)
+        self.assertEqual(Comment.objects.filter(is_auto_reply=True, content='Single reply').count(), 3)
+
+
+class ReplyCacheTest(SimpleTestCase):
+
+    def test_identical_in_flight_prompts_share_one_call(self):
+        client = FakeLLMClient(latency=0.1)
+        cache = ReplyCache(max_size=10)
+        runner = AsyncLLMRunner(client, cache=cache)
+
+        replies = runner.generate_many(['prompt'] * 5, ['key'] * 5)
+        self.assertEqual(replies, [client.reply] * 5)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(cache.stats()['coalesced'], 4)
+
+        self.assertEqual(runner.generate('prompt', 'key'), client.reply)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_collects_variants_before_serving_hits(self):
+        cache = ReplyCache(max_size=10, variants=2)
+        self.assertIsNone(cache.get('key'))
+        cache.add('key', 'first')
+        self.assertIsNone(cache.get('key'))
+        cache.add('key', 'second')
+
+        self.assertIn(cache.get('key'), ('first', 'second'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_size_and_ttl_bounds(self):
+        cache = ReplyCache(max_size=1, ttl=60)
+        cache.add('a', 'reply a')
+        cache.add('b', 'reply b')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'reply b')
+
+        with patch('posts.llm.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('b'))
+
+
+class ProvidersTest(SimpleTestCase):
+
+    def tearDown(self):
+        providers._factories.pop('test_provider', None)
+        providers.reset('test_provider')
+
+    def test_builds_once_on_first_use(self):
+        calls = []
+        providers.register('test_provider', lambda: calls.append(1) or object())
+
+        self.assertFalse(providers.is_loaded('test_provider'))
+        instance = providers.get('test_provider')
+        self.assertIs(providers.get('test_provider'), instance)
+        self.assertEqual(len(calls), 1)
+
+        providers.reset('test_provider')
+        self.assertIsNot(providers.get('test_provider'), instance)
+
+    def test_warm_up_reports_timings_and_survives_failures(self):
+        def broken():
+            raise ImportError('missing dependency')
+
+        providers.register('test_provider', broken)
+        with self.assertLogs('posts.providers', level='ERROR'):
+            timings = providers.warm_up(['test_provider', 'profanity_prefilter'])
+        self.assertEqual(list(timings), ['profanity_prefilter'])
+
+
+class CommentRollupTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        self.comment = Comment.objects.create(post=self.post, author=self.user, content='First')
+        Comment.objects.create(post=self.post, author=self.user, content='Second', is_blocked=True)
+
+    def stats(self):
+        stats = CommentDailyStats.objects.get(date=timezone.localdate())
+        return stats.total_comments, stats.blocked_comments
+
+    def test_counts_created_comments(self):
+        self.assertEqual(self.stats(), (2, 1))
+
+    def test_tracks_blocked_transitions(self):
+        comment = Comment.objects.get(id=self.comment.id)
+        comment.is_blocked = True
+        comment.save()
+        self.assertEqual(self.stats(), (2, 2))
+
+        comment.is_blocked = False
+        comment.save()
+        comment.content = 'Edited'
+        comment.save()
+        self.assertEqual(self.stats(), (2, 1))
+
+    def test_loading_comments_takes_no_snapshot(self):
+        comments = list(Comment.objects.all())
+        self.assertFalse(any('_rollup_snapshot' in comment.__dict__ for comment in comments))
+
+        comment = Comment.objects.defer('is_blocked').get(id=self.comment.id)
+        comment.is_blocked = True
+        comment.save()
+        # Not loaded with all the counted fields, so the change cannot be attributed.
+        self.assertEqual(self.stats(), (2, 1))
+
+    def test_counts_deletes_including_cascades(self):
+        self.comment.delete()
+        self.assertEqual(self.stats(), (1, 1))
+
+        self.post.delete()
+        self.assertEqual(self.stats(), (0, 0))
+
+    def test_rebuild_command_repairs_drift(self):
+        Comment.objects.filter(id=self.comment.id).update(is_blocked=True)
+        CommentDailyStats.objects.update(total_comments=100)
+
+        call_command('rebuild_comment_rollups', stdout=StringIO())
+        self.assertEqual(self.stats(), (2, 2))
+
+    def rollup_rows(self):
+        daily = set(CommentDailyStats.objects.values_list('date', 'total_comments', 'blocked_comments'))
+        activity = set(CommentActivityStats.objects.values_list(
+            'resolution', 'bucket', 'post', 'author', 'is_auto_reply', 'total_comments', 'blocked_comments',
+        ))
+        return daily, activity
+
+    def test_partial_rebuilds_keep_neighbouring_weeks_and_months(self):
+        # 2024-04-29 is a Monday, so its week spans the end of April and the start of May.
+        days = [datetime(2024, 4, day) for day in (15, 29, 30)] + [datetime(2024, 5, day) for day in (1, 2, 6, 20)]
+        for created_at in days:
+            comment = Comment.objects.create(post=self.post, author=self.user, content='Dated')
+            Comment.objects.filter(id=comment.id).update(created_at=timezone.make_aware(created_at))
+        rollups.rebuild(datetime(2024, 4, 1).date(), timezone.localdate())
+        expected = self.rollup_rows()
+
+        for date_from, date_to in (((2024, 4, 1), (2024, 4, 30)), ((2024, 5, 2), (2024, 5, 2)),
+                                   ((2024, 4, 30), (2024, 5, 1))):
+            rollups.rebuild(datetime(*date_from).date(), datetime(*date_to).date())
+            self.assertEqual(self.rollup_rows(), expected, (date_from, date_to))
+
+        # Drift inside a partial range is repaired without touching the rest of its week and month.
+        Comment.objects.filter(created_at__date=datetime(2024, 5, 1).date()).update(is_blocked=True)
+        rollups.rebuild(datetime(2024, 5, 1).date(), datetime(2024, 5, 1).date())
+        partial = self.rollup_rows()
+        rollups.rebuild(datetime(2024, 4, 1).date(), timezone.localdate())
+        self.assertEqual(partial, self.rollup_rows())
+
+
+class CommentsBreakdownTest(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='password', is_staff=True)
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='password')
+        self.client.force_authenticate(self.admin)
+        self.post = Post.objects.create(title='title', content='content', author=self.admin)
+        self.other_post = Post.objects.create(title='other', content='content', author=self.other)
+        self.comment = Comment.objects.create(post=self.post, author=self.other, content='First')
+        Comment.objects.create(post=self.post, author=self.admin, content='Bad', is_blocked=True)
+        Comment.objects.create(
+            post=self.post, author=self.admin, content='Reply', parent_comment=self.comment, is_auto_reply=True
+        )
+        Comment.objects.create(post=self.other_post, author=self.other, content='Elsewhere')
+        self.today = timezone.localdate()
+
+    def breakdown(self, **params):
+        params.setdefault('date_from', self.today.isoformat())
+        params.setdefault('date_to', self.today.isoformat())
+        response = self.client.get(reverse('posts:comments-breakdown'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data['results']
+
+    def totals(self, rows):
+        return [(row['total_comments'], row['blocked_comments'], row['auto_reply_comments']) for row in rows]
+
+    def test_day_breakdown_splits_auto_replies(self):
+        rows = self.breakdown()
+        self.assertEqual(self.totals(rows), [(4, 1, 1)])
+        self.assertEqual(rows[0]['human_comments'], 3)
+
+    def test_hourly_buckets_are_zero_filled(self):
+        rows = self.breakdown(granularity='hour')
+        self.assertEqual(len(rows), 24)
+        self.assertEqual(sum(row['total_comments'] for row in rows), 4)
+        self.assertEqual(sum(1 for row in rows if row['total_comments']), 1)
+
+    def test_weekly_and_monthly_buckets(self):
+        date_from = self.today - timedelta(days=self.today.weekday() + 14)
+        rows = self.breakdown(granularity='week', date_from=date_from.isoformat())
+        self.assertEqual(self.totals(rows), [(0, 0, 0), (0, 0, 0), (4, 1, 1)])
+
+        rows = self.breakdown(granularity='month')
+        self.assertEqual(self.totals(rows), [(4, 1, 1)])
+        self.assertEqual(rows[0]['bucket'].day, 1)
+
+    def test_post_and_author_filters(self):
+        self.assertEqual(self.totals(self.breakdown(post=self.post.id)), [(3, 1, 1)])
+        self.assertEqual(self.totals(self.breakdown(author=self.other.id)), [(2, 0, 0)])
+        self.assertEqual(self.totals(self.breakdown(post=self.post.id, author=self.other.id)), [(1, 0, 0)])
+
+    def test_tracks_updates_and_deletes(self):
+        self.comment.is_blocked = True
+        self.comment.save()
+        self.assertEqual(self.totals(self.breakdown(granularity='week')), [(4, 2, 1)])
+
+        self.comment.delete()
+        self.assertEqual(self.totals(self.breakdown(granularity='hour'))[timezone.localtime().hour], (2, 1, 0))
+
+    def test_rebuild_command_repairs_activity(self):
+        CommentActivityStats.objects.all().delete()
+        call_command('rebuild_comment_rollups', stdout=StringIO())
+        for granularity in ('hour', 'day', 'week', 'month'):
+            rows = [row for row in self.breakdown(granularity=granularity) if row['total_comments']]
+            self.assertEqual(self.totals(rows), [(4, 1, 1)], granularity)
+
+    def test_rollups_keep_one_row_per_scope(self):
+        hourly = CommentActivityStats.objects.filter(resolution='hour')
+        # Over all comments, per post (two posts) and per author (two authors), each split by auto-reply flag.
+        self.assertEqual(hourly.filter(post=None, author=None).count(), 2)
+        self.assertEqual(hourly.filter(author=None).exclude(post=None).count(), 3)
+        self.assertEqual(hourly.filter(post=None).exclude(author=None).count(), 3)
+        self.assertFalse(hourly.exclude(post=None).exclude(author=None).exists())
+
+    def test_rejects_invalid_parameters(self):
+        url = reverse('posts:comments-breakdown')
+        params = {'date_from': '2024-01-01', 'date_to': '2024-01-02'}
+        for invalid in ({'granularity': 'year'}, {'post': 'abc'}, {'author': '²'}, {'date_from': '2024-13-01'}):
+            response = self.client.get(url, {**params, **invalid})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for date_from, date_to, granularity in (
+            ('2000-01-01', '2024-01-01', 'hour'),
+            ('0001-01-01', '9999-12-30', 'hour'),
+            ('9999-12-01', '9999-12-31', 'day'),
+            ('9999-12-01', '9999-12-30', 'month'),
+        ):
+            response = self.client.get(url, {'date_from': date_from, 'date_to': date_to, 'granularity': granularity})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (date_from, date_to, granularity))
+
+
+class QueryPlanTest(APITestCase):
+    """Hot read paths must be served by an index, never by a full scan or sort of a posts table."""
+    tables = ('posts_post', 'posts_comment', 'posts_commentdailystats', 'posts_commentactivitystats')
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        for index in range(3):
+            Comment.objects.create(post=self.post, author=self.user, content=f'Comment {index}')
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall() if 'Seq Scan on posts_' in row[0]]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [
+                row[-1] for row in cursor.fetchall()
+                if re.fullmatch(rf"SCAN ({'|'.join(self.tables)})( AS \w+)?", row[-1].strip())
+                or row[-1].strip() == 'USE TEMP B-TREE FOR ORDER BY'
+            ]
+
+    def assertNoFullScans(self, captured_queries):
+        selects = [query['sql'] for query in captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertEqual(self.full_scans(sql), [], sql)
+
+    def assertIndexedReads(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNoFullScans(context.captured_queries)
+
+    def test_post_list(self):
+        self.assertIndexedReads(reverse('posts:post-list'))
+
+    def test_comment_list(self):
+        self.assertIndexedReads(reverse('posts:post-comments', args=[self.post.id]))
+
+    def test_comment_tree(self):
+        self.assertIndexedReads(reverse('posts:post-comment-tree', args=[self.post.id]))
+
+    def test_cursor_pages(self):
+        Post.objects.create(title='second', content='content', author=self.user)
+        for url in (reverse('posts:post-list'), reverse('posts:post-comments', args=[self.post.id])):
+            next_page = self.client.get(url, {'page_size': 1}).data['next']
+            self.assertIndexedReads(next_page)
+            self.assertIndexedReads(self.client.get(next_page).data['previous'])
+
+    def test_comments_daily_breakdown(self):
+        today = timezone.localdate().isoformat()
+        self.assertIndexedReads(reverse('posts:comments-daily-breakdown'), {'date_from': today, 'date_to': today})
+
+    def test_comments_breakdown(self):
+        today = timezone.localdate().isoformat()
+        url = reverse('posts:comments-breakdown')
+        for scope in ({}, {'post': self.post.id}, {'author': self.user.id}, {'post': self.post.id, 'author': self.user.id}):
+            for granularity in ('hour', 'month'):
+                self.assertIndexedReads(url, {'date_from': today, 'date_to': today, 'granularity': granularity, **scope})
+
+    def test_rollup_rebuild(self):
+        today = timezone.localdate().isoformat()
+        with CaptureQueriesContext(connection) as context:
+            call_command('rebuild_comment_rollups', date_from=today, date_to=today, stdout=StringIO())
+        self.assertNoFullScans(context.captured_queries)
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        created_at = timezone.now()
+        self.comments = Comment.objects.bulk_create([
+            # Shared timestamps check that ties are broken by id.
+            Comment(post=self.post, author=self.user, content=f'Comment {index}',
+                    created_at=created_at + timedelta(seconds=index // 3))
+            for index in range(12)
+        ])
+        self.url = reverse('posts:post-comments', args=[self.post.id])
+        cache.clear()
+
+    def walk(self, url, params=None, link='next'):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.append([comment['id'] for comment in response.data['results']])
+            if not response.data[link]:
+                return seen, response
+            response = self.client.get(response.data[link])
+
+    def test_walks_forward_and_back_without_gaps(self):
+        pages, last = self.walk(self.url, {'page_size': 5})
+        ids = [comment.id for comment in self.comments]
+        self.assertEqual(pages, [ids[:5], ids[5:10], ids[10:]])
+        self.assertNotIn('count', last.data)
+
+        back, _ = self.walk(last.data['previous'], link='previous')
+        self.assertEqual(back, [ids[5:10], ids[:5]])
+
+    def test_new_rows_do_not_shift_pages(self):
+        first = self.client.get(self.url, {'page_size': 5})
+        Comment.objects.filter(id=self.comments[0].id).delete()
+        second = self.client.get(first.data['next'])
+        self.assertEqual([c['id'] for c in second.data['results']], [c.id for c in self.comments[5:10]])
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=8)
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 8)
+
+        for invalid in ('all', '²', '0'):
+            response = self.client.get(self.url, {'page_size': invalid})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, invalid)
+
+    def test_count_modes(self):
+        self.assertEqual(self.client.get(self.url, {'count': 'exact'}).data['count'], 12)
+        self.assertEqual(self.client.get(self.url, {'count': 'estimate'}).data['count'], 12)
+
+        Comment.objects.create(post=self.post, author=self.user, content='Late')
+        self.assertEqual(self.client.get(self.url, {'count': 'estimate'}).data['count'], 12)
+        self.assertEqual(self.client.get(self.url, {'count': 'exact'}).data['count'], 13)
+
+    def test_deep_pages_do_not_use_offset(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        for _ in range(3):
+            response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['next'])
+        self.assertFalse([query for query in context.captured_queries if 'OFFSET' in query['sql']])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_post_list_is_newest_first(self):
+        older = Post.objects.create(title='older', content='content', author=self.user)
+        newer = Post.objects.create(title='newer', content='content', author=self.user)
+        response = self.client.get(reverse('posts:post-list'), {'page_size': 2})
+        self.assertEqual([post['id'] for post in response.data['results']], [newer.id, older.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.id])
+
+
+class CommentTreeTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        self.url = reverse('posts:post-comment-tree', args=[self.post.id])
+
+    def comment(self, parent=None, content='Comment'):
+        return Comment.objects.create(post=self.post, author=self.user, content=content, parent_comment=parent)
+
+    def ids(self, nodes):
+        return [(node['id'], self.ids(node['replies'])) if node['replies'] else node['id'] for node in nodes]
+
+    def test_nests_replies_in_order(self):
+        first, second = self.comment(), self.comment()
+        reply = self.comment(first)
+        nested = self.comment(reply)
+        response = self.client.get(self.url)
+        self.assertEqual(self.ids(response.data['results']), [(first.id, [(reply.id, [nested.id])]), second.id])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(response.data['results'][0]['reply_count'], 1)
+
+    def test_long_chain_loads_in_one_query(self):
+        parent = None
+        for index in range(200):
+            parent = self.comment(parent, content=f'Auto reply {index}')
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'depth': 50})
+
+        node, depth = response.data['results'][0], 1
+        while node['replies']:
+            node, depth = node['replies'][0], depth + 1
+        self.assertEqual(depth, 50)
+        self.assertTrue(node['has_more_replies'])
+
+        response = self.client.get(self.url, {'root': node['id'], 'depth': 1})
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_levels_are_paginated(self):
+        top = [self.comment() for _ in range(3)]
+        replies = [self.comment(top[0]) for _ in range(3)]
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(self.ids(response.data['results']), [(top[0].id, [r.id for r in replies[:2]]), top[1].id])
+        self.assertTrue(response.data['has_more'])
+        self.assertTrue(response.data['results'][0]['has_more_replies'])
+
+        response = self.client.get(self.url, {'limit': 2, 'after': top[1].id})
+        self.assertEqual(self.ids(response.data['results']), [top[2].id])
+        self.assertFalse(response.data['has_more'])
+
+        response = self.client.get(self.url, {'limit': 2, 'root': top[0].id, 'after': replies[1].id})
+        self.assertEqual(self.ids(response.data['results']), [replies[2].id])
+
+    def test_errors(self):
+        comment = self.comment()
+        self.assertEqual(self.client.get(self.url, {'root': 999}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.url, {'after': 999}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.url, {'root': comment.id, 'after': comment.id}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        for invalid in ({'depth': 0}, {'depth': '²'}, {'limit': 'ten'}, {'root': '-1'}):
+            self.assertEqual(self.client.get(self.url, invalid).status_code, status.HTTP_400_BAD_REQUEST)
+        missing = reverse('posts:post-comment-tree', args=[self.post.id + 100])
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CommentThreadPathTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        self.root = self.comment()
+        self.reply = self.comment(self.root)
+        self.nested = self.comment(self.reply)
+        self.sibling = self.comment(self.root)
+        self.other = self.comment()
+
+    def comment(self, parent=None):
+        return Comment.objects.create(post=self.post, author=self.user, content='Comment', parent_comment=parent)
+
+    def test_paths_follow_the_thread(self):
+        nested = Comment.objects.get(id=self.nested.id)
+        self.assertEqual(threads.depth(nested.path), 3)
+        self.assertTrue(nested.path.startswith(Comment.objects.get(id=self.reply.id).path))
+        self.assertEqual(threads.decode_segment(nested.path[-threads.SEGMENT_WIDTH:]), nested.id)
+
+    def test_subtree_fetch_and_count_in_one_query(self):
+        with self.assertNumQueries(1):
+            ids = [comment.id for comment in threads.subtree(self.root)]
+        self.assertEqual(ids, [self.root.id, self.reply.id, self.nested.id, self.sibling.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(threads.count_descendants(self.reply), 1)
+
+    def test_bulk_created_auto_replies_get_paths(self):
+        self.user.settings.auto_reply_enabled = True
+        self.user.settings.save()
+        with patch('posts.tasks.get_ai_response', return_value='Thanks!'), \
+                patch.dict(os.environ, {'AI_USER_ID': str(self.user.id)}):
+            auto_reply_to_comment(self.nested.id)
+        reply = Comment.objects.get(parent_comment=self.nested)
+        self.assertEqual(reply.path, self.nested.path + threads.encode_segment(reply.id))
+
+    def test_delete_removes_the_subtree(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.delete(reverse('posts:post-comment-detail', args=[self.reply.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            set(Comment.objects.values_list('id', flat=True)), {self.root.id, self.sibling.id, self.other.id}
+        )
+        self.assertEqual(CommentDailyStats.objects.get().total_comments, 3)
+
+    def test_comments_without_a_path_get_one_on_demand(self):
+        parent, = Comment.objects.bulk_create([Comment(post=self.post, author=self.user, content='Raw')])
+        self.assertEqual(Comment.objects.get(id=parent.id).path, '')
+        reply = self.comment(parent)
+        self.assertEqual(threads.depth(reply.path), 2)
+        self.assertEqual(Comment.objects.get(id=parent.id).path, threads.encode_segment(parent.id))
+
+        orphan, = Comment.objects.bulk_create([Comment(post=self.post, author=self.user, content='Raw')])
+        self.assertEqual(threads.count_descendants(orphan), 0)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('posts:post-comment-tree', args=[self.post.id]), {'root': parent.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['results']], [reply.id])
+        threads.delete_subtree(Comment.objects.get(id=parent.id))
+        self.assertFalse(Comment.objects.filter(id__in=[parent.id, reply.id]).exists())
+
+    def test_backfill_command_restores_paths(self):
+        expected = dict(Comment.objects.values_list('id', 'path'))
+        Comment.objects.update(path='')
+        out = StringIO()
+        call_command('backfill_comment_paths', stdout=out)
+        self.assertIn('5 comment(s)', out.getvalue())
+        self.assertEqual(dict(Comment.objects.values_list('id', 'path')), expected)
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTest(APITestCase):
+    """Every request below also runs under QueryBudgetMiddleware, which fails it over its view's budget."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', email='writer@example.com', password='x')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+        self.comment = Comment.objects.create(post=self.post, author=self.user, content='First')
+        self.comments_url = reverse('posts:post-comments', args=[self.post.id])
+
+    def test_read_paths(self):
+        with query_budget(2):
+            self.client.get(reverse('posts:post-list'))
+        with query_budget(2):
+            response = self.client.get(reverse('posts:post-detail', args=[self.post.id]))
+        self.assertEqual(response.data['author'], 'writer')
+        with query_budget(2):
+            self.client.get(self.comments_url)
+        with query_budget(2):
+            self.client.get(reverse('posts:post-comment-tree', args=[self.post.id]))
+        response = self.client.get(reverse('posts:post-comments', args=[self.post.id + 100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_comment_create_does_not_walk_relations(self):
+        self.user.settings.auto_reply_enabled = True
+        self.user.settings.save()
+        # Two of the ten are the SAVEPOINT/RELEASE around the comment and its signal writes.
+        with query_budget(10) as queries, self.captureOnCommitCallbacks():
+            response = self.client.post(self.comments_url, {'post': self.post.id, 'content': 'Second'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(queries.queries[2].startswith('SAVEPOINT'))
+        self.assertTrue(queries.queries[-1].startswith('RELEASE SAVEPOINT'))
+        self.assertEqual(sum(sql.startswith('SELECT') and 'FROM "posts_post"' in sql for sql in queries.queries), 1)
+        self.assertEqual(sum('FROM "user_usersettings"' in sql for sql in queries.queries), 1)
+
+    def test_middleware_enforces_view_budgets(self):
+        with patch.object(PostViewSet, 'query_budget', {'list': 1}):
+            with self.assertRaisesRegex(QueryBudgetExceeded, 'GET /api/posts/ ran 2 queries'):
+                self.client.get(reverse('posts:post-list'))
+
+            with override_settings(QUERY_BUDGET_ACTION='log'), self.assertLogs('posts.middleware', 'WARNING'):
+                response = self.client.get(reverse('posts:post-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_helper_lists_queries(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, r'(?s)ran 2 queries.*1\. SELECT.*2\. SELECT'):
+            with query_budget(1):
+                list(Post.objects.all())
+                list(Comment.objects.all())
+
+
+class CommentBulkCreateTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', email='importer@example.com', password='x')
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='x')
+        self.author.settings.auto_reply_enabled = True
+        self.author.settings.save()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(title='title', content='content', author=self.author)
+        self.quiet_post = Post.objects.create(title='quiet', content='content', author=self.user)
+        self.parent = Comment.objects.create(post=self.quiet_post, author=self.user, content='Parent')
+        self.url = reverse('posts:comments-bulk')
+
+    def bulk(self, comments, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'comments': comments, **extra}, format='json')
+
+    def test_creates_valid_items_and_reports_the_rest(self):
+        items = [
+            {'post': self.post.id, 'content': 'Great post'},
+            {'post': 999, 'content': 'Lost'},
+            {'post': self.quiet_post.id, 'content': 'Reply', 'parent_comment': self.parent.id},
+            {'post': self.post.id, 'content': 'Wrong thread', 'parent_comment': self.parent.id},
+            {'post': self.post.id},
+            {'post': self.post.id, 'content': 'This has a bad word: SHIT!'},
+        ]
+        with patch('posts.bulk.moderate', wraps=moderate) as moderate_mock, \
+                patch('posts.jobs.get_auto_reply_scheduler'):
+            response = self.bulk(items)
+        moderate_mock.assert_called_once()
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 3))
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'invalid', 'created', 'invalid', 'invalid', 'created'],
+        )
+        self.assertIn('content', response.data['results'][4]['errors'])
+        self.assertTrue(response.data['results'][5]['comment']['is_blocked'])
+
+        reply = Comment.objects.get(id=response.data['results'][2]['comment']['id'])
+        self.assertEqual(reply.path, self.parent.path + threads.encode_segment(reply.id))
+        stats = CommentDailyStats.objects.get()
+        self.assertEqual((stats.total_comments, stats.blocked_comments), (4, 1))
+
+    def test_atomic_requests_create_nothing_on_error(self):
+        response = self.bulk(
+            [{'post': self.post.id, 'content': 'Fine'}, {'post': 999, 'content': 'Lost'}], atomic=True
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result['status'] for result in response.data['results']], ['skipped', 'invalid'])
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_schedules_one_reply_batch_after_commit(self):
+        items = [{'post': self.post.id, 'content': f'Comment {index}'} for index in range(3)]
+        items.append({'post': self.quiet_post.id, 'content': 'No replies here'})
+        with patch('posts.jobs.get_auto_reply_scheduler') as get_scheduler, \
+                patch('posts.jobs._reply_coalescer', ReplyCoalescer()):
+            response = self.bulk(items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = [result['comment']['id'] for result in response.data['results'][:3]]
+        get_scheduler.return_value.schedule.assert_called_once()
+        delay, flush, batch = get_scheduler.return_value.schedule.call_args.args
+        with patch('posts.jobs.reply_to_comments') as reply:
+            flush(batch)
+        self.assertEqual(delay, 10)
+        reply.assert_called_once_with(created)
+
+    @override_settings(AUTO_REPLY_QUEUE='database')
+    def test_enqueues_jobs_in_bulk(self):
+        items = [{'post': self.post.id, 'content': f'Comment {index}'} for index in range(3)]
+        items.append({'post': self.quiet_post.id, 'content': 'No replies here'})
+        response = self.bulk(items)
+        created = [result['comment']['id'] for result in response.data['results'][:3]]
+        self.assertEqual(sorted(AutoReplyJob.objects.values_list('comment_id', flat=True)), created)
+
+    @override_settings(BULK_COMMENTS_MAX_ITEMS=2)
+    def test_rejects_oversized_requests(self):
+        response = self.bulk([{'post': self.post.id, 'content': 'Hi'}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('comments', response.data)
+
+
+class ContentExportTest(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', is_staff=True
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        self.client.force_authenticate(self.admin)
+        self.post = Post.objects.create(title='Hello, "world"', content='content', author=self.admin)
+        Post.objects.create(title='Blocked', content='content', author=self.other, is_blocked=True)
+        self.comment = Comment.objects.create(post=self.post, author=self.other, content='Multi\nline')
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('posts:content-export', args=[dataset]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_with_filters(self):
+        rows = [json.loads(line) for line in self.export('posts', author=self.admin.id).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Hello, "world"'])
+        self.assertEqual(set(rows[0]), {'id', 'title', 'content', 'author', 'is_blocked', 'created_at', 'updated_at'})
+
+        rows = self.export('posts', blocked='true').splitlines()
+        self.assertEqual([json.loads(row)['title'] for row in rows], ['Blocked'])
+
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.export('comments', date_from=tomorrow), '')
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export('comments', output='csv'))))
+        self.assertEqual(rows[0][:5], ['id', 'post', 'author', 'parent_comment', 'content'])
+        self.assertEqual(rows[1][:5], [str(self.comment.id), str(self.post.id), str(self.other.id), '', 'Multi\nline'])
+
+        rows = list(csv.reader(StringIO(self.export('daily-breakdown', output='csv'))))
+        self.assertEqual(
+            rows, [['date', 'total_comments', 'blocked_comments'], [timezone.localdate().isoformat(), '1', '0']]
+        )
+
+    def test_streams_with_a_chunked_iterator(self):
+        with patch('posts.export.CHUNK_SIZE', 1):
+            lines = self.export('posts').splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_rejects_invalid_parameters(self):
+        url = reverse('posts:content-export', args=['posts'])
+        for params in (
+            {'output': 'xml'}, {'date_from': 'yesterday'}, {'author': 'me'}, {'author': '²'}, {'blocked': 'maybe'},
+            {'date_to': '9999-12-31'},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('posts:content-export', args=['users']))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('posts:content-export', args=['daily-breakdown']), {'author': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command_writes_file(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'comments.ndjson')
+        call_command('export_content', 'comments', '--blocked', 'false', '--output', path)
+        with open(path, encoding='utf-8') as exported:
+            self.assertEqual([json.loads(line)['id'] for line in exported], [self.comment.id])
+
+        out = StringIO()
+        call_command('export_content', 'posts', '--output-format', 'csv', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+        with self.assertRaisesMessage(CommandError, 'out of bounds'):
+            call_command('export_content', 'comments', '--date-to', '9999-12-31', stdout=StringIO())
+
+
+class SeedCommandTest(APITestCase):
+
+    def rollup_rows(self):
+        daily = set(CommentDailyStats.objects.values_list('date', 'total_comments', 'blocked_comments'))
+        activity = set(CommentActivityStats.objects.values_list(
+            'resolution', 'bucket', 'post', 'author', 'is_auto_reply', 'total_comments', 'blocked_comments',
+        ))
+        return daily, activity
+
+    def test_generates_consistent_rows(self):
+        out = StringIO()
+        call_command('seed', '--users', 5, '--posts', 20, '--comments', 300, '--days', 30, '--seed', 1, stdout=out)
+        self.assertIn('Seeded', out.getvalue())
+
+        self.assertEqual((User.objects.count(), Post.objects.count(), Comment.objects.count()), (5, 20, 300))
+        self.assertEqual(UserSettings.objects.count(), 5)
+        self.assertFalse(AutoReplyJob.objects.exists())
+
+        comments = Comment.objects.select_related('post', 'parent_comment')
+        self.assertTrue(any(comment.parent_comment_id for comment in comments))
+        for comment in comments:
+            prefix = comment.parent_comment.path if comment.parent_comment_id else ''
+            self.assertEqual(comment.path, prefix + threads.encode_segment(comment.id))
+            self.assertGreaterEqual(comment.created_at, comment.post.created_at)
+            if comment.parent_comment_id:
+                self.assertEqual(comment.parent_comment.post_id, comment.post_id)
+
+        seeded = self.rollup_rows()
+        call_command('rebuild_comment_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), seeded)
+
+        # Sequences continue after the explicit ids.
+        user = User.objects.create_user(username='new', email='new@example.com', password='x')
+        self.assertGreater(Comment.objects.create(post=Post.objects.first(), author=user, content='x').id, 300)
+
+    def test_loads_fixture_idempotently(self):
+        for _ in range(2):
+            call_command('seed', '--fixture', 'fixture.json', stdout=StringIO())
+
+        self.assertEqual((User.objects.count(), Post.objects.count(), Comment.objects.count()), (3, 3, 10))
+        self.assertEqual(UserSettings.objects.count(), 3)
+        self.assertFalse(Comment.objects.filter(path='').exists())
+        daily = CommentDailyStats.objects.values_list('total_comments', flat=True)
+        self.assertEqual(sum(daily), 10)
+        self.assertFalse(AutoReplyJob.objects.exists())
+
+    def test_rejects_comments_without_posts(self):
+        with self.assertRaises(CommandError):
+            call_command('seed', '--comments', 10, stdout=StringIO())
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SAMPLE_RATE=1.0)
+class RequestTimingTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='writer', email='writer@example.com', password='x', is_staff=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.post = Post.objects.create(title='title', content='content', author=self.user)
+
+    def metrics(self, response):
+        metrics = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, duration, *desc = entry.split(';')
+            metrics[name] = (float(duration.removeprefix('dur=')), desc)
+        return metrics
+
+    def test_header_breaks_down_request(self):
+        with self.assertLogs('posts.timing', 'INFO') as logs:
+            response = self.client.post(
+                reverse('posts:post-comments', args=[self.post.id]), {'post': self.post.id, 'content': 'Nice post'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        metrics = self.metrics(response)
+        self.assertTrue({'db', 'moderation', 'serialize', 'auth', 'app', 'total'} <= set(metrics))
+        self.assertRegex(metrics['db'][1][0], r'desc="\d+ queries"')
+        parts = sum(duration for name, (duration, _) in metrics.items() if name != 'total')
+        self.assertAlmostEqual(parts, metrics['total'][0], delta=1)
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['label'], f'POST /api/posts/{self.post.id}/comments/')
+        self.assertEqual((record['status'], record['view'], record['slow']), (201, 'posts:post-comments', False))
+        self.assertGreater(record['queries'], 0)
+
+    def test_sampling(self):
+        with override_settings(SERVER_TIMING_SAMPLE_RATE=0), self.assertNoLogs('posts.timing'):
+            response = self.client.get(reverse('posts:post-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_slow_requests_are_logged_outside_the_sample(self):
+        with override_settings(SERVER_TIMING_SAMPLE_RATE=0, SERVER_TIMING_SLOW_MS=0.001), \
+                self.assertLogs('posts.timing', 'WARNING') as logs:
+            response = self.client.get(reverse('posts:post-list'))
+        self.assertNotIn('Server-Timing', response)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((record['label'], record['status'], record['slow'], record['sampled']),
+                         ('GET /api/posts/', 200, True, False))
+        self.assertGreater(record['total_ms'], 0)
+        self.assertNotIn('db_ms', record)
+
+    def test_header_is_only_shown_to_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        with self.assertLogs('posts.timing', 'INFO'):
+            response = self.client.get(reverse('posts:post-list'))
+        self.assertNotIn('Server-Timing', response)
+
+        self.client.credentials()
+        with override_settings(SERVER_TIMING_PUBLIC=True), self.assertLogs('posts.timing', 'INFO'):
+            response = self.client.get(reverse('posts:post-list'))
+        self.assertIn('Server-Timing', response)
+
+    def test_slow_requests_are_profiled(self):
+        profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+        with override_settings(
+            SERVER_TIMING_SLOW_MS=0.001, SERVER_TIMING_PROFILE_SLOW=True, SERVER_TIMING_PROFILE_DIR=profile_dir
+        ), self.assertLogs('posts.timing', 'WARNING') as logs:
+            self.client.get(reverse('posts:post-list'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertEqual(os.listdir(profile_dir), [os.path.basename(record['profile'])])
+
+    def test_profile_names_are_unique(self):
+        profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+        profiler = cProfile.Profile()
+        with override_settings(SERVER_TIMING_PROFILE_DIR=profile_dir), patch('posts.timing.time.strftime',
+                                                                              return_value='20240101T000000'):
+            paths = {timing.dump_profile(profiler, 'GET /api/posts/') for _ in range(3)}
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(len(os.listdir(profile_dir)), 3)
+
+    def test_sections_are_exclusive(self):
+        clock = [100.0]
+
+        def advance(seconds):
+            clock[0] += seconds
+
+        with patch('posts.timing.time.perf_counter', lambda: clock[0]):
+            with timing.collect() as timings:
+                advance(0.005)
+                with timing.timed('serialize'):
+                    advance(0.02)
+                    with timing.timed('moderation'):
+                        advance(0.03)
+            metrics = timings.metrics()
+            # Outside a collection sections are not recorded anywhere.
+            with timing.timed('serialize'):
+                advance(0.01)
+        self.assertAlmostEqual(timings.durations['moderation'], 0.03)
+        self.assertAlmostEqual(timings.durations['serialize'], 0.02)
+        self.assertAlmostEqual(metrics['app'], 5)
+        self.assertAlmostEqual(metrics['total'], 55)
@@ -0,0 +1,146 @@
+"""
+Materialized paths of comment threads.
+
+Every comment stores the ids of its ancestors and itself in `Comment.path`,
+each as a fixed-width base36 segment, so a subtree is one contiguous range of
+the (post, path) index and sorting by path yields thread order (depth first,
+oldest reply first). Bounds only use digits and lowercase letters, which
+every collation orders the same way.
+"""
+from .models import Comment
+
+SEGMENT_WIDTH = 8
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_segment(pk):
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+    return ''.join(reversed(digits)).rjust(SEGMENT_WIDTH, '0')
+
+
+def decode_segment(segment):
+    return int(segment, len(ALPHABET))
+
+
+def depth(path):
+    """1 for top-level comments, 2 for their replies and so on."""
+    return len(path) // SEGMENT_WIDTH
+
+
+def subtree_filter(path, include_self=True):
+    """Lookups selecting the comments below `path` (and the comment itself when `include_self`)."""
+    if not path:
+        raise ValueError('Cannot select the subtree of a comment without a path; see ensure_path().')
+    successor = path[:-SEGMENT_WIDTH] + encode_segment(decode_segment(path[-SEGMENT_WIDTH:]) + 1)
+    return {'path__gte' if include_self else 'path__gt': path, 'path__lt': successor}
+
+
+def ensure_path(comment):
+    """
+    The comment's path, first recomputing the paths of its post when it has
+    none (comments inserted by a raw bulk_create never got one).
+    """
+    if not comment.path:
+        backfill_paths(posts=[comment.post_id])
+        comment.path = Comment.objects.values_list('path', flat=True).get(pk=comment.pk)
+    return comment.path
+
+
+def subtree(comment, include_self=True):
+    """The comment's thread below it, in thread order, with one index range scan."""
+    return Comment.objects.filter(
+        post_id=comment.post_id, **subtree_filter(ensure_path(comment), include_self)
+    ).order_by('path')
+
+
+def count_descendants(comment):
+    return subtree(comment, include_self=False).count()
+
+
+def delete_subtree(comment):
+    """Delete a comment with all its replies, collecting the whole subtree in one query."""
+    return subtree(comment).delete()
+
+
+def assign_paths(comments):
+    """
+    Set the path of freshly inserted comments (their ids are only known after
+    the INSERT). Parents already in memory are used as they are; the paths of
+    the others are read with one query. If a parent has no path itself, the
+    paths of its whole post are recomputed instead.
+    """
+    comments = [comment for comment in comments if not comment.path]
+    if not comments:
+        return
+    paths = {}
+    for comment in comments:
+        parent = comment._state.fields_cache.get('parent_comment')
+        if parent is not None and parent.path:
+            paths[parent.pk] = parent.path
+    missing = {comment.parent_comment_id for comment in comments} - set(paths) - {None}
+    if missing:
+        paths.update(Comment.objects.filter(id__in=missing).values_list('id', 'path'))
+    if any(not paths[comment.parent_comment_id] for comment in comments if comment.parent_comment_id in paths):
+        backfill_paths(posts={comment.post_id for comment in comments})
+        stored = dict(Comment.objects.filter(pk__in=[comment.pk for comment in comments]).values_list('id', 'path'))
+        for comment in comments:
+            comment.path = stored[comment.pk]
+        return
+
+    for comment in sorted(comments, key=lambda comment: comment.pk):
+        comment.path = paths.get(comment.parent_comment_id, '') + encode_segment(comment.pk)
+        paths[comment.pk] = comment.path
+
+    if len(comments) == 1:
+        Comment.objects.filter(pk=comments[0].pk).update(path=comments[0].path)
+    else:
+        Comment.objects.bulk_update(comments, ['path'], batch_size=1000)
+
+
+def backfill_paths(model=Comment, batch_size=1000, posts=None):
+    """
+    Recompute the path of every comment of `model` (the historical model in
+    migrations), or only of the `posts` ids, post by post, writing only the
+    ones that changed. Returns the number of updated comments.
+    """
+    updated = 0
+    pending = []
+
+    def flush():
+        nonlocal updated
+        if pending:
+            model.objects.bulk_update(pending, ['path'], batch_size=batch_size)
+            updated += len(pending)
+            pending.clear()
+
+    def resolve_post(rows):
+        parents = {pk: parent_id for pk, parent_id, _ in rows}
+        paths = {}
+        for pk, _, current in rows:
+            chain = [pk]
+            # Walk up to the closest ancestor with a known path (or a root), then back down.
+            while parents.get(chain[-1]) in parents and parents[chain[-1]] not in paths:
+                chain.append(parents[chain[-1]])
+            prefix = paths.get(parents.get(chain[-1]), '')
+            for ancestor in reversed(chain):
+                prefix = paths[ancestor] = prefix + encode_segment(ancestor)
+            if paths[pk] != current:
+                pending.append(model(id=pk, path=paths[pk]))
+        if len(pending) >= batch_size:
+            flush()
+
+    post_id, rows = None, []
+    comments = model.objects.order_by('post_id', 'id').values_list('post_id', 'id', 'parent_comment_id', 'path')
+    if posts is not None:
+        comments = comments.filter(post_id__in=posts)
+    for row_post_id, pk, parent_id, path in comments.iterator(chunk_size=batch_size):
+        if row_post_id != post_id:
+            resolve_post(rows)
+            post_id, rows = row_post_id, []
+        rows.append((pk, parent_id, path))
+    resolve_post(rows)
+    flush()
+    return updated
@@ -0,0 +1,211 @@
+"""
+Per-request performance breakdown.
+
+For a sampled share of requests (SERVER_TIMING_SAMPLE_RATE),
+RequestTimingMiddleware records the SQL query count and database time and
+the time spent in instrumented sections: moderation, serialization, JWT
+authentication and LLM calls. They are sent back in a Server-Timing header
+and logged as one JSON line on the `posts.timing` logger. Requests slower
+than SERVER_TIMING_SLOW_MS are logged as warnings and, with
+SERVER_TIMING_PROFILE_SLOW, their cProfile dump is written to
+SERVER_TIMING_PROFILE_DIR. The other requests only have their total timed,
+and are logged (without a breakdown or profile) when they are slow.
+
+Code marks a section with
+
+    with timing.timed('moderation'):
+        ...
+
+which does nothing outside a sampled request or task. Sections are
+exclusive: time spent in a nested section, or in SQL run inside it, is only
+counted there, so the parts add up to the total and `app` is the rest.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import empty
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('timings', default=None)
+
+
+class Timings:
+    """Exclusive durations of the sections of one request or task, and its SQL queries."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.profiler = None
+        self._children = []
+
+    @contextmanager
+    def section(self, name):
+        started = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.durations[name] += elapsed - self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query as the `db` section."""
+        self.queries += 1
+        with self.section('db'):
+            return execute(sql, params, many, context)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def metrics(self):
+        """{section: milliseconds}, with `app` for the untracked rest and `total` last."""
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        metrics = {name: seconds * 1000 for name, seconds in self.durations.items()}
+        metrics['app'] = max(total * 1000 - sum(metrics.values()), 0)
+        metrics['total'] = total * 1000
+        return metrics
+
+    def header(self):
+        entries = []
+        for name, millis in self.metrics().items():
+            entry = f'{name};dur={millis:.1f}'
+            if name == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+@contextmanager
+def timed(name):
+    """Count the block as section `name` of the current request or task, if it is being timed."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    with timings.section(name):
+        yield
+
+
+def sampled():
+    return settings.SERVER_TIMING_ENABLED and random.random() < settings.SERVER_TIMING_SAMPLE_RATE
+
+
+@contextmanager
+def collect(profile=False):
+    """Time the block: SQL on every connection of this thread and the sections it enters."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            if profile:
+                timings.profiler = cProfile.Profile()
+                try:
+                    timings.profiler.enable()
+                except ValueError:
+                    # Another profiler is already active in this thread.
+                    timings.profiler = None
+            try:
+                yield timings
+            finally:
+                if timings.profiler is not None:
+                    timings.profiler.disable()
+                timings.finish()
+    finally:
+        _current.reset(token)
+
+
+def dump_profile(profiler, label):
+    os.makedirs(settings.SERVER_TIMING_PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-')[:80]
+    # Several slow requests can finish within the same second, in one or more processes.
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}-{slug}.prof"
+    path = os.path.join(settings.SERVER_TIMING_PROFILE_DIR, name)
+    profiler.dump_stats(path)
+    return path
+
+
+def report(timings, event, label, **fields):
+    """Log the breakdown as one JSON line; slow ones as warnings, with their profile dumped."""
+    metrics = timings.metrics()
+    record = {
+        'event': event,
+        'label': label,
+        **fields,
+        'queries': timings.queries,
+        **{f'{name}_ms': round(millis, 2) for name, millis in metrics.items()},
+    }
+    slow_ms = settings.SERVER_TIMING_SLOW_MS
+    record['slow'] = bool(slow_ms) and metrics['total'] >= slow_ms
+    if record['slow'] and timings.profiler is not None:
+        record['profile'] = dump_profile(timings.profiler, label)
+    logger.log(logging.WARNING if record['slow'] else logging.INFO, json.dumps(record))
+    return record
+
+
+def report_slow(event, label, seconds, **fields):
+    """Log a request or task outside the sample as a warning if it is slow, with its total only."""
+    total_ms = seconds * 1000
+    slow_ms = settings.SERVER_TIMING_SLOW_MS
+    if not slow_ms or total_ms < slow_ms:
+        return None
+    record = {'event': event, 'label': label, **fields, 'total_ms': round(total_ms, 2), 'slow': True, 'sampled': False}
+    logger.warning(json.dumps(record))
+    return record
+
+
+@contextmanager
+def task(label):
+    """Time a background job like a request (without a header), unless it already runs inside one."""
+    if _current.get() is not None or not settings.SERVER_TIMING_ENABLED:
+        yield
+        return
+    if not sampled():
+        started = time.perf_counter()
+        yield
+        report_slow('task', label, time.perf_counter() - started)
+        return
+    with collect(profile=settings.SERVER_TIMING_PROFILE_SLOW) as timings:
+        yield
+    report(timings, 'task', label)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer counting the encoding of responses as serialization."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedSerializerMixin:
+    """Counts validation and representation of a serializer (also per item of many=True) as serialization."""
+
+    def run_validation(self, data=empty):
+        with timed('serialize'):
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        # Called once per row of a page, so skip the context manager when nothing is timed.
+        if _current.get() is None:
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
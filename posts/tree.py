@@ -0,0 +1,42 @@
+"""
+Assembly of comment threads from one flat, time-ordered list of rows.
+"""
+from collections import defaultdict
+
+TREE_FIELDS = (
+    'id', 'post', 'author', 'parent_comment', 'content',
+    'is_blocked', 'is_auto_reply', 'created_at', 'updated_at',
+)
+
+
+def build_comment_tree(rows, root=None, max_depth=5, limit=20, after=None):
+    """
+    Nest `rows` (dicts with TREE_FIELDS, ordered by created_at and id) under
+    their parents in O(n) and return (nodes, has_more) for the children of
+    `root` (top-level comments when None).
+
+    Every level holds at most `limit` comments, starting after the sibling
+    with id `after` on the first level. Levels deeper than `max_depth` are
+    left out; `reply_count` and `has_more_replies` tell clients where a
+    branch was cut so they can request it with `root`/`after`.
+    """
+    children = defaultdict(list)
+    for row in rows:
+        children[row['parent_comment']].append(row)
+
+    def level(parent, depth, after=None):
+        siblings = children.get(parent, ())
+        start = 0
+        if after is not None:
+            start = next(index for index, row in enumerate(siblings) if row['id'] == after) + 1
+        nodes = []
+        for row in siblings[start:start + limit]:
+            node = dict(row, reply_count=len(children.get(row['id'], ())))
+            if depth < max_depth:
+                node['replies'], node['has_more_replies'] = level(row['id'], depth + 1)
+            else:
+                node['replies'], node['has_more_replies'] = [], node['reply_count'] > 0
+            nodes.append(node)
+        return nodes, start + limit < len(siblings)
+
+    return level(root, 1, after)
@@ -3,8 +3,14 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     PostViewSet,
     CommentsDailyBreakdown,
+    CommentsBreakdown,
+    ContentExportView,
     CommentRetrieveUpdateDestroyView,
-    CommentListCreateView
+    CommentListCreateView,
+    CommentBulkCreateView,
+    CommentTreeView,
+    ModerationStatsView,
+    AutoReplyStatsView
 )
 
 router = DefaultRouter()
@@ -13,8 +19,14 @@ router.register(r'posts', PostViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('posts/<int:post_id>/comments/', CommentListCreateView.as_view(), name='post-comments'),
+    path('posts/<int:post_id>/comments/tree/', CommentTreeView.as_view(), name='post-comment-tree'),
+    path('comments/bulk/', CommentBulkCreateView.as_view(), name='comments-bulk'),
     path('comments/<int:pk>/', CommentRetrieveUpdateDestroyView.as_view(), name='post-comment-detail'),
     path('comments-daily-breakdown/', CommentsDailyBreakdown.as_view(), name='comments-daily-breakdown'),
+    path('comments-breakdown/', CommentsBreakdown.as_view(), name='comments-breakdown'),
+    path('export/<str:dataset>/', ContentExportView.as_view(), name='content-export'),
+    path('moderation-stats/', ModerationStatsView.as_view(), name='moderation-stats'),
+    path('auto-reply-stats/', AutoReplyStatsView.as_view(), name='auto-reply-stats'),
 ]
 
 app_name = "posts"
@@ -1,5 +1,180 @@
-from profanity_check import predict
+import threading
+from collections import Counter
+from importlib import metadata
+
+from django.conf import settings
+
+from . import providers, timing
+from .moderation import (
+    ModerationDispatcher,
+    ProcessPoolModerationBackend,
+    Verdict,
+    VerdictCache
+)
+
+_backend = None
+_dispatcher = None
+_verdict_cache = None
+_lock = threading.Lock()
+_stage_counts = Counter()
+
+
+def predict(texts):
+    # profanity_check pulls in scikit-learn and SciPy, so it is only imported on first use.
+    return providers.get('profanity_model')(texts)
+
+
+def classify_profanity(texts):
+    """Classify many texts with a single vectorized model call."""
+    texts = list(texts)
+    if not texts:
+        return []
+    return [bool(flag) for flag in predict(texts)]
+
+
+def get_model_version():
+    if settings.PROFANITY_MODEL_VERSION:
+        return settings.PROFANITY_MODEL_VERSION
+    return f"alt-profanity-check-{metadata.version('alt-profanity-check')}"
+
+
+def get_moderation_backend():
+    """Return the process-pool backend, or None when the model runs in-process."""
+    global _backend
+    if settings.MODERATION_BACKEND != 'process':
+        return None
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                # Load the model in the parent first so forked workers share its pages.
+                providers.get('profanity_model')
+                _backend = ProcessPoolModerationBackend(
+                    classify_profanity,
+                    max_workers=settings.MODERATION_POOL_SIZE,
+                    timeout=settings.MODERATION_POOL_TIMEOUT or None,
+                )
+    return _backend
+
+
+def run_model(texts):
+    backend = get_moderation_backend()
+    if backend is None:
+        return classify_profanity(texts)
+    return backend.classify(texts)
+
+
+def get_moderation_dispatcher():
+    """Return the shared micro-batching dispatcher, or None when batching is disabled."""
+    global _dispatcher
+    if not settings.MODERATION_BATCHING_ENABLED:
+        return None
+    if _dispatcher is None:
+        with _lock:
+            if _dispatcher is None:
+                _dispatcher = ModerationDispatcher(
+                    run_model,
+                    window=settings.MODERATION_BATCH_WINDOW_MS / 1000,
+                    max_batch_size=settings.MODERATION_MAX_BATCH_SIZE,
+                )
+    return _dispatcher
+
+
+def get_verdict_cache():
+    """Return the shared verdict cache, or None when PROFANITY_CACHE_SIZE is 0."""
+    global _verdict_cache
+    if settings.PROFANITY_CACHE_SIZE <= 0:
+        return None
+    if _verdict_cache is None:
+        with _lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache(
+                    max_size=settings.PROFANITY_CACHE_SIZE,
+                    ttl=settings.PROFANITY_CACHE_TTL or None,
+                )
+    return _verdict_cache
+
+
+def get_prefilter():
+    """Return the lexical pre-filter, building its automaton on first use."""
+    if not settings.PROFANITY_PREFILTER_ENABLED:
+        return None
+    return providers.get('profanity_prefilter')
+
+
+def get_stage_counts():
+    """Return how many texts each moderation stage has decided."""
+    with _lock:
+        return dict(_stage_counts)
+
+
+def reset_moderation_pipeline():
+    """Drop the shared pipeline components so they are rebuilt from current settings."""
+    global _backend, _dispatcher, _verdict_cache
+    with _lock:
+        if _backend is not None:
+            _backend.shutdown(wait=False)
+        _backend = _dispatcher = _verdict_cache = None
+        _stage_counts.clear()
+    providers.reset('profanity_prefilter')
+
+
+def _classify(texts):
+    dispatcher = get_moderation_dispatcher()
+    if dispatcher is None:
+        return run_model(texts)
+    return dispatcher.classify(texts)
+
+
+def moderate(texts):
+    """Return a Verdict per text: pre-filter first, then the cache, then the model."""
+    with timing.timed('moderation'):
+        texts = list(texts)
+        verdicts = [None] * len(texts)
+
+        prefilter = get_prefilter()
+        if prefilter is not None:
+            verdicts = [prefilter.decide(text) for text in texts]
+
+        undecided = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        if undecided:
+            model_verdicts = _moderate_with_model([texts[index] for index in undecided])
+            for index, verdict in zip(undecided, model_verdicts):
+                verdicts[index] = verdict
+
+    with _lock:
+        _stage_counts.update(verdict.stage for verdict in verdicts)
+    return verdicts
+
+
+def _moderate_with_model(texts):
+    cache = get_verdict_cache()
+    if cache is None:
+        return [Verdict(flag, "model") for flag in _classify(texts)]
+
+    # The vectorizer lowercases and splits on whitespace, so texts sharing a
+    # normalized form always get the same verdict and can share a cache entry.
+    model_version = get_model_version()
+    cached = cache.get_many(texts, model_version)
+    misses = list(dict.fromkeys(text for text, flag in zip(texts, cached) if flag is None))
+    fresh = {}
+    if misses:
+        fresh = dict(zip(misses, _classify(misses)))
+        cache.set_many(fresh.items(), model_version)
+    return [
+        Verdict(fresh[text], "model") if flag is None else Verdict(flag, "cache")
+        for text, flag in zip(texts, cached)
+    ]
 
 
 def validate_profanity(content):
-    return predict([content])[0] == 1
+    """
+    Return the Verdict for `content`. It is truthy when the text is profane and
+    its `stage` attribute tells which moderation stage decided.
+    """
+    return moderate([content])[0]
+
+
+def validate_profanity_fields(data, fields):
+    """Return a {field: Verdict} mapping, classifying all fields in one batch."""
+    texts = [data.get(field, '') for field in fields]
+    return dict(zip(fields, moderate(texts)))
@@ -1,5 +1,12 @@
-from django.db.models import Count, Q
-from django.db.models.functions import TruncDate
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
 from rest_framework.pagination import PageNumberPagination
@@ -7,16 +14,45 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 
-from .models import Post, Comment
-from .serializers import PostSerializer, CommentSerializer, PostDetailSerializer, PostListSerializer
+from .bulk import bulk_create_comments
+from .export import OUTPUT_FORMATS, ExportError, export_rows, render
+from .jobs import get_backlog
+from .models import Post, Comment, CommentActivityStats, CommentDailyStats
+from .pagination import KeysetPagination
+from .rollups import day_start, iter_buckets
+from .scheduler import get_auto_reply_scheduler
+from .tasks import get_reply_cache
+from .threads import delete_subtree, ensure_path, subtree_filter
+from .tree import TREE_FIELDS, build_comment_tree
+from .serializers import (
+    PostSerializer,
+    CommentSerializer,
+    PostDetailSerializer,
+    PostListSerializer,
+    BulkCommentSerializer
+)
+from .validators import (
+    get_moderation_backend,
+    get_moderation_dispatcher,
+    get_verdict_cache,
+    get_stage_counts
+)
 
 
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    pagination_class = KeysetPagination
+    ordering = ('-created_at', '-id')
+    query_budget = {'list': 3, 'retrieve': 2, 'create': 2, 'update': 3, 'partial_update': 3}
+
+    def get_queryset(self):
+        if self.action == "retrieve":
+            return self.queryset.select_related('author')
+        return self.queryset
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -30,7 +66,7 @@ class PostViewSet(viewsets.ModelViewSet):
 
     def update(self, request, *args, **kwargs):
         post = self.get_object()
-        if post.author != request.user:
+        if post.author_id != request.user.id:
             raise PermissionDenied("You do not have permission to edit this post.")
 
         serializer = self.get_serializer(post, data=request.data, partial=True)
@@ -41,7 +77,7 @@ class PostViewSet(viewsets.ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         post = self.get_object()
-        if post.author != request.user:
+        if post.author_id != request.user.id:
             raise PermissionDenied("You do not have permission to delete this post.")
 
         self.perform_destroy(post)
@@ -51,33 +87,138 @@ class PostViewSet(viewsets.ModelViewSet):
 class CommentListCreateView(ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
+    ordering = ('created_at', 'id')
+    query_budget = {'get': 4, 'post': 14}
 
     def get_queryset(self):
-        post_id = self.kwargs['post_id']
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
-            raise NotFound('Post not found.')
+        return Comment.objects.filter(post_id=self.kwargs['post_id'])
 
-        return post.comments.all()
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        # Only an empty page needs to tell a missing post from one without comments.
+        if not page and not Post.objects.filter(id=self.kwargs['post_id']).exists():
+            raise NotFound('Post not found.')
+        return page
 
     def perform_create(self, serializer):
-        post_id = self.kwargs['post_id']
-        post = Post.objects.get(id=post_id)
-        serializer.save(author=self.request.user, post=post)
+        post = serializer.validated_data.get('post')
+        if post is None or post.id != self.kwargs['post_id']:
+            post = get_object_or_404(Post, id=self.kwargs['post_id'])
+        # One transaction for the comment and what its post_save signals write (auto-reply job, rollups).
+        with transaction.atomic():
+            serializer.save(author=self.request.user, post=post)
+
+
+@extend_schema(
+    operation_id="comments_bulk_create",
+    summary="Create many comments in one request",
+    description=(
+            """Creates up to BULK_COMMENTS_MAX_ITEMS comments, on one or several posts, in a single transaction.
+            Every item is reported in 'results' in request order, either as 'created' with the comment or as
+            'invalid' with its errors. Valid items are created even when others are invalid, unless 'atomic' is
+            true. Responds with 201 when every item was created, 207 when only some were and 400 when none were."""
+    ),
+    request=BulkCommentSerializer,
+)
+class CommentBulkCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkCommentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['comments']
+
+        created, errors = bulk_create_comments(request.user, items, atomic=serializer.validated_data['atomic'])
+        comments = dict(zip(created, CommentSerializer(list(created.values()), many=True).data))
+        results = [
+            {"index": index, "status": "created", "comment": comments[index]}
+            if index in comments else
+            {"index": index, "status": "invalid" if index in errors else "skipped", "errors": errors.get(index, {})}
+            for index in range(len(items))
+        ]
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({"created": len(created), "failed": len(errors), "results": results}, status=response_status)
+
+
+@extend_schema(
+    operation_id="post_comment_tree",
+    summary="Retrieve the comments of a post as a nested tree",
+    description=(
+            """Returns the comments of a post nested under their parent comments, loaded with a single query.
+            Each level holds at most 'limit' comments and levels below 'depth' are cut off; 'reply_count' and
+            'has_more_replies' mark truncated branches, which can be fetched with 'root' (the comment to start
+            from) and 'after' (the last sibling already shown)."""
+    ),
+    parameters=[
+        OpenApiParameter(name="depth", description="Number of levels to return (default 5).", required=False, type=int),
+        OpenApiParameter(name="limit", description="Comments per level (default 20).", required=False, type=int),
+        OpenApiParameter(name="root", description="Only return replies below this comment.", required=False, type=int),
+        OpenApiParameter(
+            name="after", description="Continue the first level after this comment.", required=False, type=int
+        ),
+    ],
+)
+class CommentTreeView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 4
+    default_depth = 5
+    max_depth = 50
+    default_limit = 20
+
+    def get_int_param(self, request, name, default=None, maximum=None):
+        value = request.GET.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise ValidationError({name: "Must be a positive integer."})
+        return min(value, maximum) if maximum else value
+
+    def get(self, request, post_id):
+        depth = self.get_int_param(request, 'depth', self.default_depth, self.max_depth)
+        limit = self.get_int_param(request, 'limit', self.default_limit, settings.PAGINATION_MAX_PAGE_SIZE)
+        root = self.get_int_param(request, 'root')
+        after = self.get_int_param(request, 'after')
+
+        comments = Comment.objects.filter(post_id=post_id)
+        if root is not None:
+            root_comment = comments.filter(id=root).only('post_id', 'path').first()
+            if root_comment is None:
+                raise NotFound('Comment not found.')
+            comments = comments.filter(**subtree_filter(ensure_path(root_comment)))
+
+        rows = list(comments.order_by('created_at', 'id').values(*TREE_FIELDS))
+        if not rows and not Post.objects.filter(id=post_id).exists():
+            raise NotFound('Post not found.')
+        if after is not None and not any(row['id'] == after and row['parent_comment'] == root for row in rows):
+            raise ValidationError({"after": "Must be a comment on the requested level."})
+
+        results, has_more = build_comment_tree(rows, root=root, max_depth=depth, limit=limit, after=after)
+        return Response({"has_more": has_more, "results": results})
 
 
 class CommentRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CommentSerializer
     queryset = Comment.objects.all()
+    query_budget = {'get': 2, 'put': 6, 'patch': 6}
 
     def perform_destroy(self, instance):
-        super().perform_destroy(instance)
+        delete_subtree(instance)
 
     def update(self, request, *args, **kwargs):
         comment = self.get_object()
-        if comment.author != request.user:
+        if comment.author_id != request.user.id:
             raise PermissionDenied("You do not have permission to edit this comment.")
         serializer = self.get_serializer(comment, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
@@ -87,7 +228,7 @@ class CommentRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
 
     def destroy(self, request, *args, **kwargs):
         comment = self.get_object()
-        if comment.author != request.user:
+        if comment.author_id != request.user.id:
             raise PermissionDenied("You do not have permission to delete this comment.")
         self.perform_destroy(comment)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -160,13 +301,8 @@ class CommentsDailyBreakdown(APIView):
             return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=400)
 
         comments_data = (
-            Comment.objects.filter(created_at__date__range=[date_from, date_to])
-            .annotate(date=TruncDate('created_at'))
-            .values('date')
-            .annotate(
-                total_comments=Count('id'),
-                blocked_comments=Count('id', filter=Q(is_blocked=True))
-            )
+            CommentDailyStats.objects.filter(date__range=[date_from, date_to], total_comments__gt=0)
+            .values('date', 'total_comments', 'blocked_comments')
             .order_by('date')
         )
 
@@ -174,3 +310,235 @@ class CommentsDailyBreakdown(APIView):
         paginated_data = paginator.paginate_queryset(comments_data, request)
 
         return paginator.get_paginated_response(paginated_data)
+
+
+@extend_schema(
+    operation_id="comments_breakdown",
+    summary="Retrieve a breakdown of comments by hour, day, week or month",
+    description=(
+            """This API endpoint returns comment counts per time bucket between 'date_from' and 'date_to'
+            (inclusive, YYYY-MM-DD), optionally restricted to one post or one comment author. Every bucket of the
+            range is returned, including empty ones, with blocked, auto-reply and human comment counts."""
+    ),
+    parameters=[
+        OpenApiParameter(name="date_from", description="First day of the range (YYYY-MM-DD).", required=True, type=str),
+        OpenApiParameter(name="date_to", description="Last day of the range (YYYY-MM-DD).", required=True, type=str),
+        OpenApiParameter(
+            name="granularity",
+            description="Bucket size: hour, day (default), week or month.",
+            required=False,
+            type=str,
+            enum=CommentActivityStats.Resolution.values,
+        ),
+        OpenApiParameter(name="post", description="Only count comments on this post.", required=False, type=int),
+        OpenApiParameter(name="author", description="Only count comments by this user.", required=False, type=int),
+    ],
+    responses={
+        200: OpenApiExample(
+            "Successful response",
+            value={
+                "granularity": "day",
+                "results": [
+                    {
+                        "bucket": "2024-02-02T00:00:00Z",
+                        "total_comments": 12,
+                        "blocked_comments": 3,
+                        "auto_reply_comments": 4,
+                        "human_comments": 8,
+                    },
+                ],
+            },
+            response_only=True,
+        ),
+    }
+)
+class CommentsBreakdown(APIView):
+    """
+    API View to get comment counts per hour, day, week or month, served from pre-aggregated rollups.
+    """
+    permission_classes = [IsAdminUser]
+    max_buckets = 10000
+
+    def get(self, request):
+        date_from = request.GET.get('date_from')
+        date_to = request.GET.get('date_to')
+        granularity = request.GET.get('granularity', CommentActivityStats.Resolution.DAY)
+
+        if not date_from or not date_to:
+            return Response({"error": "Please provide both 'date_from' and 'date_to' query parameters."}, status=400)
+
+        try:
+            date_from = parse_date(date_from)
+            date_to = parse_date(date_to)
+        except ValueError:
+            date_from = date_to = None
+
+        if not date_from or not date_to:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=400)
+        if granularity not in CommentActivityStats.Resolution.values:
+            return Response({"error": "Invalid granularity. Use hour, day, week or month."}, status=400)
+
+        scope = {}
+        for param in ('post', 'author'):
+            value = request.GET.get(param)
+            if value is not None:
+                try:
+                    value = int(value)
+                except ValueError:
+                    value = -1
+                if value < 0:
+                    return Response({"error": f"Invalid '{param}' parameter. Please use an ID."}, status=400)
+                scope[f'{param}_id'] = value
+
+        try:
+            start = day_start(date_from)
+            end = day_start(date_to + timedelta(days=1))
+            # One bucket past the limit is enough to reject the range without listing all of them.
+            buckets = list(islice(iter_buckets(start, end, granularity), self.max_buckets + 1))
+        except OverflowError:
+            return Response({"error": "The date range is out of bounds."}, status=400)
+        if len(buckets) > self.max_buckets:
+            return Response(
+                {"error": f"The range spans more than {self.max_buckets} buckets. Use a coarser granularity."},
+                status=400,
+            )
+
+        rows = {row['bucket']: row for row in self.get_rows(granularity, scope, buckets[0], end)}
+
+        results = []
+        for bucket in buckets:
+            row = rows.get(bucket, {})
+            total = row.get('total') or 0
+            auto_reply = row.get('auto_reply') or 0
+            results.append({
+                "bucket": bucket,
+                "total_comments": total,
+                "blocked_comments": row.get('blocked') or 0,
+                "auto_reply_comments": auto_reply,
+                "human_comments": total - auto_reply,
+            })
+
+        return Response({"granularity": granularity, "results": results})
+
+    @staticmethod
+    def get_rows(granularity, scope, start, end):
+        """Counts per bucket of the comments on one post and/or by one author (all of them if `scope` is empty)."""
+        if len(scope) == 2:
+            # No rollup is kept per post and author together; one author's comments in the range are
+            # few enough to count directly, through the (author, created_at) index.
+            return (
+                Comment.objects
+                .filter(**scope, created_at__gte=start, created_at__lt=end)
+                .annotate(bucket=Trunc('created_at', granularity))
+                .values('bucket')
+                .annotate(
+                    total=Count('id'),
+                    blocked=Count('id', filter=Q(is_blocked=True)),
+                    auto_reply=Count('id', filter=Q(is_auto_reply=True)),
+                )
+                .order_by()
+            )
+        return (
+            CommentActivityStats.objects
+            .filter(
+                resolution=granularity, post_id=scope.get('post_id'), author_id=scope.get('author_id'),
+                bucket__gte=start, bucket__lt=end,
+            )
+            .values('bucket')
+            .annotate(
+                total=Sum('total_comments'),
+                blocked=Sum('blocked_comments'),
+                auto_reply=Sum('total_comments', filter=Q(is_auto_reply=True)),
+            )
+            .order_by('bucket')
+        )
+
+
+@extend_schema(
+    operation_id="content_export",
+    summary="Stream posts, comments or the daily comment breakdown as NDJSON or CSV",
+    description=(
+            """Streams every row of the dataset ('posts', 'comments' or 'daily-breakdown') in one response, reading
+            the table in chunks so that exports of any size use constant memory. 'date_from' and 'date_to'
+            (YYYY-MM-DD, inclusive) filter on the creation day, 'author' and 'blocked' (true/false) on posts and
+            comments."""
+    ),
+    parameters=[
+        OpenApiParameter(name="output", description="ndjson (default) or csv.", required=False, type=str,
+                         enum=list(OUTPUT_FORMATS)),
+        OpenApiParameter(name="date_from", description="First day (YYYY-MM-DD).", required=False, type=str),
+        OpenApiParameter(name="date_to", description="Last day (YYYY-MM-DD).", required=False, type=str),
+        OpenApiParameter(name="author", description="Only rows by this user.", required=False, type=int),
+        OpenApiParameter(name="blocked", description="Only blocked (true) or visible (false) rows.",
+                         required=False, type=bool),
+    ],
+)
+class ContentExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, dataset):
+        output_format = request.GET.get('output', 'ndjson')
+        filters = {}
+        for param in ('date_from', 'date_to'):
+            if request.GET.get(param):
+                try:
+                    filters[param] = parse_date(request.GET[param])
+                except ValueError:
+                    filters[param] = None
+                if filters[param] is None:
+                    return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=400)
+        if 'author' in request.GET:
+            try:
+                filters['author'] = int(request.GET['author'])
+            except ValueError:
+                filters['author'] = -1
+            if filters['author'] < 0:
+                return Response({"error": "Invalid 'author' parameter. Please use an ID."}, status=400)
+        if 'blocked' in request.GET:
+            if request.GET['blocked'] not in ('true', 'false'):
+                return Response({"error": "Invalid 'blocked' parameter. Use true or false."}, status=400)
+            filters['is_blocked'] = request.GET['blocked'] == 'true'
+
+        try:
+            columns, rows = export_rows(dataset, **filters)
+            content = render(output_format, columns, rows)
+        except ExportError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        content_type, extension = OUTPUT_FORMATS[output_format]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{extension}"'
+        return response
+
+
+class ModerationStatsView(APIView):
+    """
+    API View exposing runtime statistics of the content moderation pipeline.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        backend = get_moderation_backend()
+        dispatcher = get_moderation_dispatcher()
+        cache = get_verdict_cache()
+        return Response({
+            "backend": backend.stats() if backend else None,
+            "batching": dispatcher.stats() if dispatcher else None,
+            "cache": cache.stats() if cache else None,
+            "stages": get_stage_counts(),
+        })
+
+
+class AutoReplyStatsView(APIView):
+    """
+    API View exposing the state of the in-memory auto-reply scheduler and the job table.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        reply_cache = get_reply_cache()
+        return Response({
+            "scheduler": get_auto_reply_scheduler().stats(),
+            "jobs": get_backlog(),
+            "reply_cache": reply_cache.stats() if reply_cache else None,
+        })
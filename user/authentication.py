@@ -0,0 +1,11 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from posts import timing
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication reporting token validation and the user lookup as the `auth` timing section."""
+
+    def authenticate(self, request):
+        with timing.timed('auth'):
+            return super().authenticate(request)
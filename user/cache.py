@@ -0,0 +1,45 @@
+"""
+Read-through cache of UserSettings, keyed by user id.
+
+Entries are dropped whenever settings change through save(), delete() or
+QuerySet.update() (see UserSettingsQuerySet and user.signals). With a
+per-process cache backend other processes only notice a change once their
+entry expires after USER_SETTINGS_CACHE_TTL seconds; a shared backend
+(Redis, Memcached) makes invalidation immediate everywhere.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_MISSING = object()
+
+
+def cache_key(user_id):
+    return f'user-settings:{user_id}'
+
+
+def get_user_settings(user_id):
+    """Return the UserSettings of a user (None if they have none), from the cache when possible."""
+    from .models import UserSettings
+
+    if settings.USER_SETTINGS_CACHE_TTL <= 0:
+        return UserSettings.objects.filter(user_id=user_id).first()
+
+    key = cache_key(user_id)
+    user_settings = cache.get(key, _MISSING)
+    if user_settings is _MISSING:
+        user_settings = UserSettings.objects.filter(user_id=user_id).first()
+        cache.set(key, user_settings, settings.USER_SETTINGS_CACHE_TTL)
+    return user_settings
+
+
+def invalidate_user_settings(*user_ids):
+    """
+    Drop cached settings now and again once the current transaction commits,
+    so a read racing with the write cannot keep the old value cached.
+    """
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
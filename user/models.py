@@ -15,10 +15,24 @@ class User(AbstractUser):
         return f"{self.first_name} {self.last_name}"
 
 
+class UserSettingsQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        """Update the rows and drop them from the settings cache, since update() sends no signals."""
+        from .cache import invalidate_user_settings
+
+        user_ids = list(self.values_list('user_id', flat=True))
+        rows = super().update(**kwargs)
+        invalidate_user_settings(*user_ids)
+        return rows
+
+
 class UserSettings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='settings')
     auto_reply_enabled = models.BooleanField(default=False)
     auto_reply_delay = models.IntegerField(default=10)
 
+    objects = UserSettingsQuerySet.as_manager()
+
     def __str__(self):
         return f"Settings for {self.user.email}"
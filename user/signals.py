@@ -1,5 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .cache import invalidate_user_settings
 from .models import User, UserSettings
 
 
@@ -7,3 +8,9 @@ from .models import User, UserSettings
 def create_user_settings(sender, instance, created, **kwargs):
     if created:
         UserSettings.objects.create(user=instance)
+
+
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+def invalidate_cached_settings(sender, instance, **kwargs):
+    invalidate_user_settings(instance.user_id)
@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from posts.models import Post
+from user.cache import get_user_settings
+from user.models import User, UserSettings
+
+
+class UserSettingsCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', email='author@example.com', password='x')
+        self.client.force_authenticate(self.user)
+
+    def test_reads_through_once(self):
+        with self.assertNumQueries(1):
+            get_user_settings(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertFalse(get_user_settings(self.user.id).auto_reply_enabled)
+
+    def test_settings_view_invalidates(self):
+        get_user_settings(self.user.id)
+        response = self.client.patch(
+            reverse('user:manage_settings'), {'auto_reply_enabled': True, 'auto_reply_delay': 3}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user_settings = get_user_settings(self.user.id)
+        self.assertEqual((user_settings.auto_reply_enabled, user_settings.auto_reply_delay), (True, 3))
+
+    def test_queryset_update_invalidates(self):
+        get_user_settings(self.user.id)
+        UserSettings.objects.filter(user=self.user).update(auto_reply_delay=42)
+        self.assertEqual(get_user_settings(self.user.id).auto_reply_delay, 42)
+
+        UserSettings.objects.bulk_update(
+            [UserSettings(id=self.user.settings.id, auto_reply_delay=7)], ['auto_reply_delay']
+        )
+        self.assertEqual(get_user_settings(self.user.id).auto_reply_delay, 7)
+
+    def test_comment_creation_skips_settings_table_when_warm(self):
+        post = Post.objects.create(title='title', content='content', author=self.user)
+        url = reverse('posts:post-comments', args=[post.id])
+        self.client.post(url, {'post': post.id, 'content': 'First'})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, {'post': post.id, 'content': 'Second'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in context.captured_queries if 'user_usersettings' in query['sql']])
+
+    @override_settings(USER_SETTINGS_CACHE_TTL=0)
+    def test_cache_can_be_disabled(self):
+        get_user_settings(self.user.id)
+        with self.assertNumQueries(1):
+            get_user_settings(self.user.id)